@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Online anomaly detection for HRV and resting heart rate
+Each metric keeps a constant-size baseline (count, exponentially weighted mean and
+variance) in the state directory, updated from every synced day. A day whose value is
+more than ANOMALY_Z_THRESHOLD standard deviations from the baseline is flagged in the
+Notion row (Anomaly checkbox + Anomaly Note). Backfills rebuild the baselines in one
+pass over the range, in date order.
+"""
+
+import math
+import os
+import threading
+from typing import Dict, List, Optional
+from state_store import load_json_state, save_json_state
+
+ANOMALY_STATE_FILE = 'anomaly_baselines.json'
+
+# Fitbit field -> (label, unit) used in the note
+ANOMALY_METRICS = {
+    'hrv_daily_rmssd': ('HRV', 'ms'),
+    'resting_heart_rate': ('Resting HR', 'bpm'),
+}
+
+# Distance from the baseline, in standard deviations, that counts as an anomaly
+ANOMALY_Z_THRESHOLD = float(os.getenv('ANOMALY_Z_THRESHOLD', '2.5'))
+# Days of history needed before anything is flagged
+ANOMALY_MIN_DAYS = int(os.getenv('ANOMALY_MIN_DAYS', '14'))
+# Span of the exponential weighting: older readings fade out over roughly this many days
+ANOMALY_WINDOW_DAYS = int(os.getenv('ANOMALY_WINDOW_DAYS', '60'))
+
+_lock = threading.Lock()
+
+class Baseline:
+    """Running mean/variance of one metric.
+    
+    The weight of a new reading is max(1/count, 2/(window+1)): an exact running
+    mean and variance (Welford) for the first days, exponentially weighted after.
+    The state before the last update is kept so re-syncing the same date replaces
+    its reading instead of counting it twice.
+    """
+    
+    def __init__(self, count: int = 0, mean: float = 0.0, variance: float = 0.0,
+                 last_date: Optional[str] = None, previous: Optional[List] = None):
+        self.count = count
+        self.mean = mean
+        self.variance = variance
+        self.last_date = last_date
+        self.previous = previous
+    
+    def to_state(self) -> Dict:
+        return {'count': self.count, 'mean': self.mean, 'variance': self.variance,
+                'last_date': self.last_date, 'previous': self.previous}
+    
+    @classmethod
+    def from_state(cls, state: Dict) -> 'Baseline':
+        return cls(state.get('count', 0), state.get('mean', 0.0), state.get('variance', 0.0),
+                   state.get('last_date'), state.get('previous'))
+    
+    def z_score(self, value: float) -> Optional[float]:
+        """Distance of a value from the baseline in standard deviations (None while warming up)"""
+        if self.count < ANOMALY_MIN_DAYS or self.variance <= 0:
+            return None
+        return (value - self.mean) / math.sqrt(self.variance)
+    
+    def undo(self):
+        """Drop the last update (only one level deep)"""
+        if self.previous is not None:
+            self.count, self.mean, self.variance, self.last_date = self.previous
+            self.previous = None
+    
+    def update(self, date: str, value: float):
+        self.previous = [self.count, self.mean, self.variance, self.last_date]
+        # Clip outliers so a single odd reading doesn't drag the baseline along
+        if self.z_score(value) is not None:
+            limit = ANOMALY_Z_THRESHOLD * math.sqrt(self.variance)
+            value = min(max(value, self.mean - limit), self.mean + limit)
+        
+        self.count += 1
+        weight = max(1 / self.count, 2 / (ANOMALY_WINDOW_DAYS + 1))
+        diff = value - self.mean
+        self.mean += weight * diff
+        self.variance = (1 - weight) * (self.variance + weight * diff * diff)
+        self.last_date = date
+
+class AnomalyDetector:
+    """Baselines of every metric in ANOMALY_METRICS"""
+    
+    def __init__(self, baselines: Optional[Dict[str, Baseline]] = None):
+        self.baselines = baselines or {}
+    
+    @classmethod
+    def load(cls) -> 'AnomalyDetector':
+        state = load_json_state(ANOMALY_STATE_FILE, {}) or {}
+        return cls({field: Baseline.from_state(value) for field, value in state.get('baselines', {}).items()})
+    
+    def save(self):
+        save_json_state(ANOMALY_STATE_FILE, {
+            'baselines': {field: baseline.to_state() for field, baseline in self.baselines.items()}
+        })
+    
+    def last_date(self) -> Optional[str]:
+        return max((baseline.last_date for baseline in self.baselines.values() if baseline.last_date), default=None)
+    
+    def observe(self, date: str, fitbit_data: Dict) -> Optional[List[str]]:
+        """Score the day's readings, then add them to the baselines.
+        
+        Returns a note per anomalous metric, or None if the day has none of the metrics.
+        Days older than a baseline's last update are scored but not added to it.
+        """
+        notes = None
+        for field, (label, unit) in ANOMALY_METRICS.items():
+            value = fitbit_data.get(field)
+            if not value:
+                continue
+            notes = notes or []
+            
+            baseline = self.baselines.setdefault(field, Baseline())
+            if baseline.last_date == date:
+                baseline.undo()
+            
+            z = baseline.z_score(value)
+            if z is not None and abs(z) >= ANOMALY_Z_THRESHOLD:
+                direction = 'above' if z > 0 else 'below'
+                notes.append(f"{label} {value:g} {unit} is {abs(z):.1f}σ {direction} baseline {baseline.mean:.1f}")
+            
+            if baseline.last_date is None or date > baseline.last_date:
+                baseline.update(date, value)
+        return notes
+
+def flag_anomalies(date: str, fitbit_data: Dict):
+    """Check a synced day against the persisted baselines and update them.
+    
+    The result goes to fitbit_data['anomalies'] (a list of notes, empty when the day
+    looks normal); it is left unset when the day has no HRV or resting HR.
+    """
+    with _lock:
+        detector = AnomalyDetector.load()
+        notes = detector.observe(date, fitbit_data)
+        if notes is None:
+            return
+        detector.save()
+    fitbit_data['anomalies'] = notes
+    for note in notes:
+        print(f"⚠️ Anomaly on {date}: {note}")
+
+def anomaly_properties(fitbit_data: Dict, partial: bool = False) -> Dict:
+    """Notion properties for the anomaly columns (none if the day wasn't checked).
+    
+    With partial=True (a refresh of some collections) they are only written when every
+    metric was checked, so a resting-HR-only refresh doesn't clear an earlier HRV flag.
+    """
+    if 'anomalies' not in fitbit_data:
+        return {}
+    if partial and not all(fitbit_data.get(field) for field in ANOMALY_METRICS):
+        return {}
+    notes = fitbit_data['anomalies']
+    return {
+        "Anomaly": {"checkbox": bool(notes)},
+        "Anomaly Note": {"rich_text": [{"text": {"content": '; '.join(notes)}}] if notes else []}
+    }
+
+class BaselineRebuild:
+    """Rebuilds the baselines in one pass over backfilled days, fed in date order.
+    
+    The result replaces the saved baselines only if it reaches at least as far as
+    they do, so backfilling an old range doesn't rewind today's baseline.
+    """
+    
+    def __init__(self):
+        self.detector = AnomalyDetector()
+        self.days = 0
+    
+    def observe(self, date: str, fitbit_data: Dict):
+        with _lock:
+            notes = self.detector.observe(date, fitbit_data)
+        if notes is not None:
+            fitbit_data['anomalies'] = notes
+            self.days += 1
+    
+    def save(self):
+        with _lock:
+            saved = AnomalyDetector.load()
+            rebuilt_until = self.detector.last_date()
+            if not rebuilt_until or (saved.last_date() and rebuilt_until < saved.last_date()):
+                print("🧮 Anomaly baselines kept (backfill ends before the last synced day)")
+                return
+            self.detector.save()
+        print(f"🧮 Rebuilt anomaly baselines from {self.days} days")
@@ -1,23 +1,66 @@
 #!/usr/bin/env python3
 """
 Backfill Fitbit data to Notion database for a date range
-Can be run manually with custom date ranges or defaults to last week
+Can be run manually with custom date ranges or defaults to last week;
+--fill-gaps only re-fetches days that are missing or incomplete in Notion
 """
 
 import os
 import sys
 import argparse
 import requests
+import threading
 import time
 from datetime import datetime, timedelta
-from notion_client import Client
 from dotenv import load_dotenv
+from http_client import get_session, get_streamed, get_notion_client
+from state_store import load_json_state, save_json_state
+from anomalies import BaselineRebuild, anomaly_properties, flag_anomalies
+from sync_fitbit_notion import NOTION_METRIC_FIELDS, drop_missing_columns
+import http_cassette
+import profiling
+import telemetry
+from pipeline import Pipeline, Stage
+
+# Fitbit Web API host (overridable to point at a local mock server)
+FITBIT_API_BASE_URL = os.getenv('FITBIT_API_BASE_URL', 'https://api.fitbit.com').rstrip('/')
+
+# Pauses that keep a long backfill under Fitbit's 150 requests/hour
+FITBIT_API_DELAY = float(os.getenv('FITBIT_API_DELAY', '2'))
+BACKFILL_DAY_DELAY = float(os.getenv('BACKFILL_DAY_DELAY', '5'))
+
+# --fill-gaps: a day is incomplete when one of these columns is empty or 0.
+# HRV and resting HR only count from the first day they appear, since older
+# devices don't record them.
+GAP_METRICS = {
+    "Steps": 'steps',
+    "Sleep Hours": 'sleep_hours',
+    "HRV Daily RMSSD": 'hrv_daily_rmssd',
+    "Wake Resting HR": 'resting_heart_rate',
+}
+DEVICE_DEPENDENT_METRICS = ("HRV Daily RMSSD", "Wake Resting HR")
+# Days scanned by --fill-gaps when no date range is given
+FILL_GAPS_DAYS = int(os.getenv('FILL_GAPS_DAYS', '365'))
+# Longest span of one Fitbit range request (the HRV and body log endpoints allow 30 days)
+FITBIT_RANGE_MAX_DAYS = 30
+# Days a fill left incomplete (Fitbit has no data for them), so later scans skip them
+GAPS_STATE_FILE = 'backfill_gaps.json'
+
+# Activity time series fetched per range: resource -> field
+ACTIVITY_SERIES = {
+    'steps': 'steps',
+    'distance': 'distance',
+    'calories': 'calories',
+    'minutesFairlyActive': 'fairly_active_minutes',
+    'minutesVeryActive': 'very_active_minutes',
+}
 
 def get_date_range(start_date=None, end_date=None, last_week=False):
     """Get date range for backfill"""
     if last_week or (not start_date and not end_date):
         # Default to last 7 days
-        end_date = datetime.now() - timedelta(days=1)  # Yesterday
+        today = datetime.strptime(os.environ['SYNC_TODAY'], '%Y-%m-%d') if os.getenv('SYNC_TODAY') else datetime.now()
+        end_date = today - timedelta(days=1)  # Yesterday
         start_date = end_date - timedelta(days=6)  # 7 days total
         return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
     
@@ -40,7 +83,7 @@ def refresh_fitbit_token():
         return None
     
     # Prepare token refresh request
-    token_url = "https://api.fitbit.com/oauth2/token"
+    token_url = f"{FITBIT_API_BASE_URL}/oauth2/token"
     token_data = {
         'grant_type': 'refresh_token',
         'refresh_token': refresh_token
@@ -54,7 +97,7 @@ def refresh_fitbit_token():
         'Content-Type': 'application/x-www-form-urlencoded'
     }
     
-    response = requests.post(token_url, data=token_data, headers=headers)
+    response = get_session().post(token_url, data=token_data, headers=headers)
     
     if response.status_code == 200:
         tokens = response.json()
@@ -77,7 +120,9 @@ def make_api_request(url, headers, description="API call"):
     base_delay = 2  # Start with 2 second delay
     
     for attempt in range(max_retries):
-        response = requests.get(url, headers=headers)
+        if attempt:
+            telemetry.record_retry('fitbit')
+        response = get_streamed(url, headers=headers)
         
         if response.status_code == 200:
             return response
@@ -88,7 +133,8 @@ def make_api_request(url, headers, description="API call"):
                 # Update headers with new token
                 headers['Authorization'] = f'Bearer {new_token}'
                 # Retry the request once with new token
-                response = requests.get(url, headers=headers)
+                telemetry.record_retry('fitbit')
+                response = get_streamed(url, headers=headers)
                 if response.status_code == 200:
                     return response
             print(f"   ❌ {description} failed even after token refresh")
@@ -103,22 +149,127 @@ def make_api_request(url, headers, description="API call"):
     
     return response
 
-def get_fitbit_data(date):
-    """Fetch comprehensive Fitbit data for a specific date with rate limiting"""
+def make_strict_api_request(url, headers, description="API call"):
+    """make_api_request that raises when the call still fails, so a failure isn't taken for missing data"""
+    response = make_api_request(url, headers, description)
+    if response.status_code != 200:
+        raise requests.exceptions.HTTPError(f"{description} failed with status {response.status_code}", response=response)
+    return response
+
+def sleep_metrics(sessions, date):
+    """Sleep duration, efficiency, times and stages of the date's main sleep (from a list of sleep logs)"""
+    data = {}
+    
+    # Find the sleep session for the specific date
+    main_sleep = None
+    for sleep_session in sessions:
+        if sleep_session.get('dateOfSleep') == date and sleep_session.get('isMainSleep', False):
+            main_sleep = sleep_session
+            break
+    
+    # Fallback to any session for the date
+    if not main_sleep:
+        for sleep_session in sessions:
+            if sleep_session.get('dateOfSleep') == date:
+                main_sleep = sleep_session
+                break
+    
+    if main_sleep:
+        data['sleep_hours'] = round(main_sleep.get('minutesAsleep', 0) / 60, 1)
+        data['sleep_efficiency'] = main_sleep.get('efficiency', 0)
+        data['sleep_start'] = main_sleep.get('startTime', '')
+        data['sleep_end'] = main_sleep.get('endTime', '')
+        
+        # Sleep stages - handle both new and old Fitbit formats
+        levels = main_sleep.get('levels', {})
+        
+        # First try new format with levels.summary
+        if 'summary' in levels and levels['summary']:
+            summary = levels['summary']
+            data['deep_sleep'] = summary.get('deep', {}).get('minutes', 0)
+            data['light_sleep'] = summary.get('light', {}).get('minutes', 0)
+            data['rem_sleep'] = summary.get('rem', {}).get('minutes', 0)
+        
+        # If no summary, try parsing levels.data for sleep stages
+        elif 'data' in levels and levels['data']:
+            stage_minutes = {'deep': 0, 'light': 0, 'rem': 0}
+            
+            # Parse data groupings (stages > 3 minutes)
+            for period in levels['data']:
+                stage = period.get('level', '')
+                if stage in stage_minutes:
+                    # Convert seconds to minutes
+                    duration_seconds = period.get('seconds', 0)
+                    stage_minutes[stage] += duration_seconds // 60
+            
+            # Parse shortData if available (short wake periods ≤ 3 minutes)
+            if 'shortData' in levels:
+                for period in levels.get('shortData', []):
+                    stage = period.get('level', '')
+                    if stage in stage_minutes:
+                        duration_seconds = period.get('seconds', 0)
+                        stage_minutes[stage] += duration_seconds // 60
+            
+            data['deep_sleep'] = stage_minutes['deep']
+            data['light_sleep'] = stage_minutes['light']
+            data['rem_sleep'] = stage_minutes['rem']
+        
+        else:
+            # Fallback to old format - parse minuteData
+            minute_data = main_sleep.get('minuteData', [])
+            if minute_data:
+                asleep_minutes = sum(1 for m in minute_data if m.get('value') == '1')
+                # For old format, treat all sleep as "light sleep"
+                data['light_sleep'] = asleep_minutes
+                data['deep_sleep'] = 0  # Not available in old format
+                data['rem_sleep'] = 0   # Not available in old format
+            else:
+                data['deep_sleep'] = 0
+                data['light_sleep'] = 0
+                data['rem_sleep'] = 0
+    
+    return data
+
+def heart_metrics(heart_info):
+    """Resting heart rate and zone minutes from an activities-heart value"""
+    data = {'resting_heart_rate': heart_info.get('restingHeartRate')}
+    
+    # Heart rate zones
+    zones = heart_info.get('heartRateZones', [])
+    for zone in zones:
+        zone_name = zone.get('name', '').lower().replace(' ', '_')
+        if 'fat_burn' in zone_name or 'fat burn' in zone_name:
+            data['fat_burn_minutes'] = zone.get('minutes', 0)
+        elif 'cardio' in zone_name:
+            data['cardio_minutes'] = zone.get('minutes', 0)
+        elif 'peak' in zone_name:
+            data['peak_minutes'] = zone.get('minutes', 0)
+    return data
+
+def hrv_metrics(hrv_entry):
+    hrv_value = hrv_entry.get('value', {})
+    return {'hrv_daily_rmssd': hrv_value.get('dailyRmssd'), 'hrv_deep_rmssd': hrv_value.get('deepRmssd')}
+
+def get_fitbit_data(date, strict=False):
+    """Fetch comprehensive Fitbit data for a specific date with rate limiting.
+    
+    A failed call leaves its metrics out; with strict=True it fails the whole fetch (returns None).
+    """
     load_dotenv()
     access_token = os.getenv('FITBIT_ACCESS_TOKEN')
     
     headers = {'Authorization': f'Bearer {access_token}'}
-    base_url = 'https://api.fitbit.com/1/user/-'
+    base_url = f'{FITBIT_API_BASE_URL}/1/user/-'
     
     data = {}
     
     # Add longer delays between API calls to avoid rate limiting
-    api_delay = 2  # Increased to 2 seconds
+    api_delay = FITBIT_API_DELAY
+    request = make_strict_api_request if strict else make_api_request
     
     try:
         # Activity summary
-        response = make_api_request(f'{base_url}/activities/date/{date}.json', headers, "Activity")
+        response = request(f'{base_url}/activities/date/{date}.json', headers, "Activity")
         if response.status_code == 200:
             activities = response.json()
             summary = activities['summary']
@@ -137,103 +288,25 @@ def get_fitbit_data(date):
         # Use sleep log list endpoint to get stages data
         from datetime import datetime, timedelta
         next_day = (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
-        response = make_api_request(f'https://api.fitbit.com/1.2/user/-/sleep/list.json?beforeDate={next_day}&sort=desc&limit=5', headers_v12, "Sleep")
+        response = request(f'{FITBIT_API_BASE_URL}/1.2/user/-/sleep/list.json?beforeDate={next_day}&sort=desc&limit=5', headers_v12, "Sleep")
         if response.status_code == 200:
             sleep_data = response.json()
             if sleep_data.get('sleep'):
-                # Find the sleep session for the specific date
-                main_sleep = None
-                for sleep_session in sleep_data['sleep']:
-                    if sleep_session.get('dateOfSleep') == date and sleep_session.get('isMainSleep', False):
-                        main_sleep = sleep_session
-                        break
-                
-                # Fallback to any session for the date
-                if not main_sleep:
-                    for sleep_session in sleep_data['sleep']:
-                        if sleep_session.get('dateOfSleep') == date:
-                            main_sleep = sleep_session
-                            break
-                
-                if main_sleep:
-                    data['sleep_hours'] = round(main_sleep.get('minutesAsleep', 0) / 60, 1)
-                    data['sleep_efficiency'] = main_sleep.get('efficiency', 0)
-                    data['sleep_start'] = main_sleep.get('startTime', '')
-                    data['sleep_end'] = main_sleep.get('endTime', '')
-                    
-                    # Sleep stages - handle both new and old Fitbit formats
-                    levels = main_sleep.get('levels', {})
-                    
-                    # First try new format with levels.summary
-                    if 'summary' in levels and levels['summary']:
-                        summary = levels['summary']
-                        data['deep_sleep'] = summary.get('deep', {}).get('minutes', 0)
-                        data['light_sleep'] = summary.get('light', {}).get('minutes', 0)
-                        data['rem_sleep'] = summary.get('rem', {}).get('minutes', 0)
-                    
-                    # If no summary, try parsing levels.data for sleep stages
-                    elif 'data' in levels and levels['data']:
-                        stage_minutes = {'deep': 0, 'light': 0, 'rem': 0}
-                        
-                        # Parse data groupings (stages > 3 minutes)
-                        for period in levels['data']:
-                            stage = period.get('level', '')
-                            if stage in stage_minutes:
-                                # Convert seconds to minutes
-                                duration_seconds = period.get('seconds', 0)
-                                stage_minutes[stage] += duration_seconds // 60
-                        
-                        # Parse shortData if available (short wake periods ≤ 3 minutes)
-                        if 'shortData' in levels:
-                            for period in levels.get('shortData', []):
-                                stage = period.get('level', '')
-                                if stage in stage_minutes:
-                                    duration_seconds = period.get('seconds', 0)
-                                    stage_minutes[stage] += duration_seconds // 60
-                        
-                        data['deep_sleep'] = stage_minutes['deep']
-                        data['light_sleep'] = stage_minutes['light']
-                        data['rem_sleep'] = stage_minutes['rem']
-                    
-                    else:
-                        # Fallback to old format - parse minuteData
-                        minute_data = main_sleep.get('minuteData', [])
-                        if minute_data:
-                            asleep_minutes = sum(1 for m in minute_data if m.get('value') == '1')
-                            # For old format, treat all sleep as "light sleep"
-                            data['light_sleep'] = asleep_minutes
-                            data['deep_sleep'] = 0  # Not available in old format
-                            data['rem_sleep'] = 0   # Not available in old format
-                        else:
-                            data['deep_sleep'] = 0
-                            data['light_sleep'] = 0
-                            data['rem_sleep'] = 0
+                data.update(sleep_metrics(sleep_data['sleep'], date))
         
         time.sleep(api_delay)  # Delay between API calls
         
         # Heart rate data (resting + zones)
-        response = make_api_request(f'{base_url}/activities/heart/date/{date}/1d.json', headers, "Heart Rate")
+        response = request(f'{base_url}/activities/heart/date/{date}/1d.json', headers, "Heart Rate")
         if response.status_code == 200:
             hr_data = response.json()
             if hr_data.get('activities-heart'):
-                heart_info = hr_data['activities-heart'][0].get('value', {})
-                data['resting_heart_rate'] = heart_info.get('restingHeartRate')
-                
-                # Heart rate zones
-                zones = heart_info.get('heartRateZones', [])
-                for zone in zones:
-                    zone_name = zone.get('name', '').lower().replace(' ', '_')
-                    if 'fat_burn' in zone_name or 'fat burn' in zone_name:
-                        data['fat_burn_minutes'] = zone.get('minutes', 0)
-                    elif 'cardio' in zone_name:
-                        data['cardio_minutes'] = zone.get('minutes', 0)  
-                    elif 'peak' in zone_name:
-                        data['peak_minutes'] = zone.get('minutes', 0)
+                data.update(heart_metrics(hr_data['activities-heart'][0].get('value', {})))
         
         time.sleep(api_delay)  # Delay between API calls
         
         # Weight data (if available)
-        response = make_api_request(f'{base_url}/body/log/weight/date/{date}.json', headers, "Weight")
+        response = request(f'{base_url}/body/log/weight/date/{date}.json', headers, "Weight")
         if response.status_code == 200:
             weight_data = response.json()
             if weight_data.get('weight'):
@@ -244,7 +317,7 @@ def get_fitbit_data(date):
         time.sleep(api_delay)  # Delay between API calls
         
         # Body fat data (if available)
-        response = make_api_request(f'{base_url}/body/log/fat/date/{date}.json', headers, "Body Fat")
+        response = request(f'{base_url}/body/log/fat/date/{date}.json', headers, "Body Fat")
         if response.status_code == 200:
             fat_data = response.json()
             if fat_data.get('fat'):
@@ -253,41 +326,195 @@ def get_fitbit_data(date):
         time.sleep(api_delay)  # Delay between API calls
         
         # HRV data (Heart Rate Variability)
-        response = make_api_request(f'{base_url}/hrv/date/{date}.json', headers, "HRV")
+        response = request(f'{base_url}/hrv/date/{date}.json', headers, "HRV")
         if response.status_code == 200:
             hrv_data = response.json()
             if hrv_data.get('hrv'):
-                hrv_entries = hrv_data['hrv']
-                if hrv_entries:
-                    # Get the most recent HRV reading for the day
-                    latest_hrv = hrv_entries[-1]
-                    hrv_value = latest_hrv.get('value', {})
-                    data['hrv_daily_rmssd'] = hrv_value.get('dailyRmssd')
-                    data['hrv_deep_rmssd'] = hrv_value.get('deepRmssd')
+                # Get the most recent HRV reading for the day
+                data.update(hrv_metrics(hrv_data['hrv'][-1]))
         
         return data
-        
+    
     except requests.exceptions.RequestException as e:
         print(f"❌ Error fetching Fitbit data for {date}: {e}")
         return None
 
-def update_notion_database(date, fitbit_data):
-    """Update or create entry in Notion database (reused from sync script)"""
+def get_fitbit_data_range(start_date, end_date):
+    """Fetch the same metrics as get_fitbit_data for every date of a range with range endpoints.
+    
+    Ten requests per range (at most FITBIT_RANGE_MAX_DAYS days) instead of seven per day.
+    Returns a dict of date -> data, or None if any request failed.
+    """
+    load_dotenv()
+    access_token = os.getenv('FITBIT_ACCESS_TOKEN')
+    
+    headers = {'Authorization': f'Bearer {access_token}'}
+    base_url = f'{FITBIT_API_BASE_URL}/1/user/-'
+    span = f'{start_date}/{end_date}'
+    data = {date: {} for date in generate_date_list(start_date, end_date)}
+    
+    def request(url, description, request_headers=headers):
+        response = make_strict_api_request(url, request_headers, description)
+        time.sleep(FITBIT_API_DELAY)  # Delay between API calls
+        return response.json()
+    
+    try:
+        # Activity summary, one time series per field
+        for resource, field in ACTIVITY_SERIES.items():
+            series = request(f'{base_url}/activities/{resource}/date/{span}.json', f"Activity {resource}")
+            for point in series.get(f'activities-{resource}', []):
+                if point.get('dateTime') in data:
+                    value = float(point.get('value', 0))
+                    data[point['dateTime']][field] = value if field == 'distance' else int(value)
+        for day in data.values():
+            if 'fairly_active_minutes' in day or 'very_active_minutes' in day:
+                day['active_minutes'] = day.pop('fairly_active_minutes', 0) + day.pop('very_active_minutes', 0)
+        
+        # Sleep logs with stages
+        headers_v12 = dict(headers, **{'Accept-Language': 'en_US', 'Accept-Version': '1.2'})
+        sessions = request(f'{FITBIT_API_BASE_URL}/1.2/user/-/sleep/date/{span}.json', "Sleep", headers_v12).get('sleep', [])
+        for date in data:
+            data[date].update(sleep_metrics(sessions, date))
+        
+        # Heart rate data (resting + zones)
+        for entry in request(f'{base_url}/activities/heart/date/{span}.json', "Heart Rate").get('activities-heart', []):
+            if entry.get('dateTime') in data:
+                data[entry['dateTime']].update(heart_metrics(entry.get('value', {})))
+        
+        # Weight and body fat logs (first log of each day, like the daily endpoint)
+        for entry in reversed(request(f'{base_url}/body/log/weight/date/{span}.json', "Weight").get('weight', [])):
+            if entry.get('date') in data:
+                data[entry['date']].update({'weight': entry.get('weight'), 'bmi': entry.get('bmi')})
+        for entry in reversed(request(f'{base_url}/body/log/fat/date/{span}.json', "Body Fat").get('fat', [])):
+            if entry.get('date') in data:
+                data[entry['date']]['body_fat'] = entry.get('fat')
+        
+        # HRV data (most recent reading of each day)
+        for entry in request(f'{base_url}/hrv/date/{span}.json', "HRV").get('hrv', []):
+            if entry.get('dateTime') in data:
+                data[entry['dateTime']].update(hrv_metrics(entry))
+        
+        return data
+    
+    except requests.exceptions.RequestException as e:
+        print(f"❌ Error fetching Fitbit data for {start_date} to {end_date}: {e}")
+        return None
+
+def scan_notion_rows(start_date, end_date):
+    """Page id and gap-relevant values of every row in the range, read in one paginated query"""
     load_dotenv()
     
-    notion = Client(auth=os.getenv('NOTION_TOKEN'))
+    notion = get_notion_client()
+    database_id = os.getenv('NOTION_DATABASE_ID')
+    
+    rows = {}
+    start_cursor = None
+    while True:
+        query = {
+            "database_id": database_id,
+            "filter": {
+                "and": [
+                    {"property": "Date", "date": {"on_or_after": start_date}},
+                    {"property": "Date", "date": {"on_or_before": end_date}}
+                ]
+            },
+            "page_size": 100
+        }
+        if start_cursor:
+            query["start_cursor"] = start_cursor
+        
+        response = notion.databases.query(**query)
+        for page in response['results']:
+            properties = page.get('properties', {})
+            date_value = (properties.get('Date', {}).get('date') or {}).get('start')
+            if date_value:
+                rows[date_value[:10]] = {
+                    'page_id': page['id'],
+                    'values': {name: properties.get(name, {}).get('number') for name in GAP_METRICS}
+                }
+        
+        if not response.get('has_more'):
+            return rows
+        start_cursor = response.get('next_cursor')
+
+def find_gaps(start_date, end_date, rows):
+    """Dates that have no row or an incomplete one, with the columns that are missing"""
+    # A device-dependent metric counts as supported from the first day it was recorded
+    supported_since = {
+        name: min((date for date, row in rows.items() if row['values'].get(name)), default=None)
+        for name in DEVICE_DEPENDENT_METRICS
+    }
+    unfillable = load_json_state(GAPS_STATE_FILE, {}) or {}
+    
+    gaps = {}
+    for date in generate_date_list(start_date, end_date):
+        values = rows[date]['values'] if date in rows else {}
+        missing = [
+            name for name in GAP_METRICS
+            if not values.get(name)
+            and (name not in DEVICE_DEPENDENT_METRICS or (supported_since[name] and date >= supported_since[name]))
+        ]
+        if date not in rows:
+            gaps[date] = missing
+        elif missing and not set(missing) <= set(unfillable.get(date, [])):
+            gaps[date] = missing
+    return gaps
+
+def contiguous_ranges(dates):
+    """Group sorted dates into (start, end) runs of consecutive days, at most FITBIT_RANGE_MAX_DAYS long"""
+    ranges = []
+    for date in dates:
+        day = datetime.strptime(date, '%Y-%m-%d')
+        if ranges:
+            start, end = ranges[-1]
+            start_day = datetime.strptime(start, '%Y-%m-%d')
+            if (day - datetime.strptime(end, '%Y-%m-%d')).days == 1 and (day - start_day).days < FITBIT_RANGE_MAX_DAYS:
+                ranges[-1] = (start, date)
+                continue
+        ranges.append((date, date))
+    return ranges
+
+def record_unfillable(gaps, items):
+    """Remember the gaps Fitbit had no data for, so the next scan doesn't fetch them again"""
+    unfillable = load_json_state(GAPS_STATE_FILE, {}) or {}
+    for item in items:
+        # Failed Fitbit calls fail the item, so only days whose calls all succeeded count
+        fitbit_data = item.get('fitbit_fetch')
+        if not fitbit_data or item.failed:
+            continue
+        still_missing = [name for name in gaps.get(item.date, []) if not fitbit_data.get(GAP_METRICS[name])]
+        if still_missing:
+            unfillable[item.date] = still_missing
+        else:
+            unfillable.pop(item.date, None)
+    save_json_state(GAPS_STATE_FILE, unfillable)
+
+def update_notion_database(date, fitbit_data, food_data=None, page_ids=None, partial=False):
+    """Update or create entry in Notion database (reused from sync script).
+    
+    `page_ids` (date -> page id, e.g. from scan_notion_rows) replaces the lookup query.
+    With partial=True metrics missing from fitbit_data are left out instead of written as 0,
+    so values the row already has are kept.
+    """
+    load_dotenv()
+    
+    notion = get_notion_client()
     database_id = os.getenv('NOTION_DATABASE_ID')
     
     # Check if entry already exists for this date
-    existing_pages = notion.databases.query(
-        database_id=database_id,
-        filter={
-            "property": "Date",
-            "date": {
-                "equals": date
+    if page_ids is not None:
+        page_id = page_ids.get(date)
+    else:
+        existing_pages = notion.databases.query(
+            database_id=database_id,
+            filter={
+                "property": "Date",
+                "date": {
+                    "equals": date
+                }
             }
-        }
-    )
+        )
+        page_id = existing_pages['results'][0]['id'] if existing_pages['results'] else None
     
     # Prepare properties with all Fitbit metrics
     properties = {
@@ -305,6 +532,9 @@ def update_notion_database(date, fitbit_data):
         "Cardio Zone (min)": {"number": fitbit_data.get('cardio_minutes', 0)},
         "Peak Zone (min)": {"number": fitbit_data.get('peak_minutes', 0)},
     }
+    if partial:
+        properties = {name: value for name, value in properties.items()
+                      if name not in NOTION_METRIC_FIELDS or NOTION_METRIC_FIELDS[name] in fitbit_data}
     
     # Add optional properties if available
     if fitbit_data.get('resting_heart_rate'):
@@ -328,10 +558,31 @@ def update_notion_database(date, fitbit_data):
     if fitbit_data.get('hrv_deep_rmssd'):
         properties["HRV Deep RMSSD"] = {"number": fitbit_data['hrv_deep_rmssd']}
     
+    properties.update(anomaly_properties(fitbit_data))
+    
+    # Add food data if available
+    if food_data:
+        from google_drive_food import format_meal_text
+        
+        if food_data.get('breakfast'):
+            properties["Breakfast"] = {"rich_text": [{"text": {"content": format_meal_text(food_data['breakfast'])}}]}
+        
+        if food_data.get('lunch'):
+            properties["Lunch"] = {"rich_text": [{"text": {"content": format_meal_text(food_data['lunch'])}}]}
+        
+        if food_data.get('dinner'):
+            properties["Dinner"] = {"rich_text": [{"text": {"content": format_meal_text(food_data['dinner'])}}]}
+        
+        # Mark that food photos were processed (and which photos, so unchanged dates can be skipped)
+        properties["Food Photos Processed"] = {"checkbox": True}
+        if food_data.get('fingerprint'):
+            properties["Food Photos Fingerprint"] = {"rich_text": [{"text": {"content": food_data['fingerprint']}}]}
+    
+    properties = drop_missing_columns(notion, database_id, properties)
+    
     try:
-        if existing_pages['results']:
+        if page_id:
             # Update existing page
-            page_id = existing_pages['results'][0]['id']
             notion.pages.update(page_id=page_id, properties=properties)
             return "updated"
         else:
@@ -341,7 +592,7 @@ def update_notion_database(date, fitbit_data):
                 properties=properties
             )
             return "created"
-            
+    
     except Exception as e:
         print(f"❌ Error updating Notion for {date}: {e}")
         return "error"
@@ -365,11 +616,33 @@ def main():
     parser.add_argument('--start-date', '-s', type=str, help='Start date (YYYY-MM-DD)')
     parser.add_argument('--end-date', '-e', type=str, help='End date (YYYY-MM-DD)')
     parser.add_argument('--last-week', '-w', action='store_true', help='Backfill last 7 days (default if no dates provided)')
+    parser.add_argument('--fill-gaps', action='store_true', help=f'Only backfill days that are missing or incomplete in Notion (default range: last {FILL_GAPS_DAYS} days)')
+    parser.add_argument('--include-food', action='store_true', help='Also process Drive food photos for the whole range')
+    parser.add_argument('--refresh-food-cache', action='store_true', help='Discard cached food analyses (e.g. after changing the prompt)')
+    parser.add_argument('--force-food', action='store_true', help='Re-process food photos even for dates Notion marks as processed')
+    http_cassette.add_arguments(parser)
+    profiling.add_arguments(parser)
     
     args = parser.parse_args()
+    http_cassette.install_from_args(args)
+    profiling.enable_from_args(args)
     
+    telemetry.start_run('backfill')
+    ok = False
+    try:
+        ok = run_backfill(args)
+    finally:
+        telemetry.finish_run('ok' if ok else 'error')
+
+def run_backfill(args):
+    """Backfill the requested date range; returns True if every date was written"""
     # Get date range
-    start_date, end_date = get_date_range(args.start_date, args.end_date, args.last_week)
+    if args.fill_gaps and not (args.start_date or args.end_date or args.last_week):
+        # Look for gaps over the last FILL_GAPS_DAYS days
+        _, end_date = get_date_range(last_week=True)
+        start_date = (datetime.strptime(end_date, '%Y-%m-%d') - timedelta(days=FILL_GAPS_DAYS - 1)).strftime('%Y-%m-%d')
+    else:
+        start_date, end_date = get_date_range(args.start_date, args.end_date, args.last_week)
     
     print("🔄 Starting Fitbit → Notion backfill...")
     print(f"📅 Date range: {start_date} to {end_date}")
@@ -377,44 +650,126 @@ def main():
     # Generate list of dates to process
     dates = generate_date_list(start_date, end_date)
     
-    print(f"📊 Processing {len(dates)} days...")
+    # Fill-gaps mode: one scan of the database, then only the incomplete days, fetched per range
+    gaps = {}
+    page_ids = None
+    range_of = {}
+    if args.fill_gaps:
+        print("🔍 Scanning Notion for missing or incomplete days...")
+        with telemetry.stage('gap_scan'):
+            rows = scan_notion_rows(start_date, end_date)
+        gaps = find_gaps(start_date, end_date, rows)
+        page_ids = {date: row['page_id'] for date, row in rows.items()}
+        dates = sorted(gaps)
+        ranges = contiguous_ranges(dates)
+        for range_start, range_end in ranges:
+            for date in generate_date_list(range_start, range_end):
+                range_of[date] = (range_start, range_end)
+        
+        if not dates:
+            print(f"🎉 No gaps to fill! ({len(rows)} rows scanned)")
+            return True
+        print(f"🕳️ Found {len(dates)} incomplete days in {len(ranges)} ranges ({len(rows)} rows scanned)")
+        for range_start, range_end in ranges:
+            print(f"   {range_start}" + (f" to {range_end}" if range_end != range_start else ""))
+        start_date, end_date = dates[0], dates[-1]
     
-    # Track results
-    created = 0
-    updated = 0
-    errors = 0
+    print(f"📊 Processing {len(dates)} days...")
     
-    for date in dates:
-        print(f"\n📅 Processing {date}...")
+    # Food photos for the whole range in one pass (one folder listing, concurrent analysis)
+    food_by_date = {}
+    if args.include_food:
+        print("🍽️ Processing food photos from Drive for the whole range...")
+        try:
+            from google_drive_food import process_drive_food_photos_range
+            from sync_fitbit_notion import get_food_processed_fingerprints
+            
+            with telemetry.stage('food'):
+                processed_fingerprints = None if args.force_food else get_food_processed_fingerprints(start_date, end_date)
+                food_by_date = process_drive_food_photos_range(
+                    start_date, end_date, refresh_cache=args.refresh_food_cache, processed_fingerprints=processed_fingerprints
+                )
+        except ImportError as e:
+            print(f"⚠️ Google Drive integration not available: {e}")
+        except Exception as e:
+            print(f"⚠️ Error processing food photos: {e}")
+    
+    # Days are fetched in date order, so the HRV/resting HR baselines are rebuilt as they stream by.
+    # Scattered gap days can't rebuild them; they are checked against the saved baselines instead.
+    anomaly_baselines = BaselineRebuild()
+    
+    fetched_ranges = {}
+    fetch_lock = threading.Lock()
+    
+    def fetch_range(date):
+        """Fitbit data of a date from its range, fetching the whole range on first use"""
+        with fetch_lock:
+            span = range_of[date]
+            if span not in fetched_ranges:
+                if fetched_ranges:
+                    time.sleep(BACKFILL_DAY_DELAY)
+                print(f"\n📅 Fetching {span[0]} to {span[1]}...")
+                fetched_ranges[span] = get_fitbit_data_range(*span) or {}
+            return fetched_ranges[span].pop(date, None)
+    
+    def fetch_fitbit(item):
+        if item.date in range_of and range_of[item.date][0] != range_of[item.date][1]:
+            fitbit_data = fetch_range(item.date)
+        else:
+            # Pause between days to stay under Fitbit's rate limit (the previous day's Notion write overlaps it)
+            if item.index:
+                time.sleep(BACKFILL_DAY_DELAY)
+            print(f"\n📅 Processing {item.date}...")
+            # Filling gaps, a failed call must not look like a day without data
+            fitbit_data = get_fitbit_data(item.date, strict=args.fill_gaps)
         
-        # Get Fitbit data
-        fitbit_data = get_fitbit_data(date)
         if not fitbit_data:
-            print(f"❌ Failed to fetch Fitbit data for {date}")
-            errors += 1
-            continue
+            raise Exception(f"Failed to fetch Fitbit data for {item.date}")
+        if args.fill_gaps:
+            flag_anomalies(item.date, fitbit_data)
+        else:
+            anomaly_baselines.observe(item.date, fitbit_data)
         
         # Show key metrics
         print(f"   Steps: {fitbit_data.get('steps', 0)}, Sleep: {fitbit_data.get('sleep_hours', 0)}h, HRV: {fitbit_data.get('hrv_daily_rmssd', 'N/A')}")
-        
-        # Update Notion
-        result = update_notion_database(date, fitbit_data)
-        if result == "created":
-            print(f"✅ Created entry for {date}")
-            created += 1
-        elif result == "updated":
-            print(f"✅ Updated entry for {date}")
-            updated += 1
-        else:
-            errors += 1
-        
-        # Longer delay between days to avoid overwhelming API
-        if date != dates[-1]:  # Don't delay after the last date
-            time.sleep(5)  # 5 second delay between days
+        return fitbit_data
+    
+    def write_notion(item):
+        result = update_notion_database(item.date, item.get('fitbit_fetch'), food_by_date.get(item.date), page_ids,
+                                        partial=args.fill_gaps)
+        if result == "error":
+            raise Exception(f"Notion update failed for {item.date}")
+        print(f"✅ {result.title()} entry for {item.date}")
+        return result
+    
+    pipeline = Pipeline('backfill', [
+        Stage('fitbit_fetch', fetch_fitbit),
+        Stage('notion_write', write_notion, workers=2)
+    ])
+    items = pipeline.run(dates)
+    if args.fill_gaps:
+        record_unfillable(gaps, items)
+    else:
+        anomaly_baselines.save()
+    
+    # Weekly/monthly rows once for the whole range, instead of rewriting a week per day
+    from sync_fitbit_notion import rollups_enabled, update_rollups
+    if rollups_enabled():
+        try:
+            with telemetry.stage('rollup'):
+                update_rollups({item.date: item.get('fitbit_fetch') for item in items if item.get('fitbit_fetch')})
+        except Exception as e:
+            print(f"⚠️ Error updating rollups: {e}")
+    
+    # Track results
+    created = sum(1 for item in items if item.get('notion_write') == "created")
+    updated = sum(1 for item in items if item.get('notion_write') == "updated")
+    errors = sum(1 for item in items if item.failed)
     
     # Summary
     print(f"\n🎉 Backfill completed!")
     print(f"📊 Results: {created} created, {updated} updated, {errors} errors")
+    return errors == 0
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Offline check of the incremental Drive ingestion
+Runs sync_fitbit_notion.py twice against the local mocks: the first run seeds the
+Drive catalog, then a photo taken days earlier is "uploaded" to the mock folder, and
+the second run must find it through the changes feed and process the earlier date's
+food photos into its Notion row.
+
+    python benchmarks/check_drive_changes.py
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timedelta
+
+from run_benchmarks import REPO_ROOT, start_mocks, configure_environment
+
+def run_sync() -> int:
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    return subprocess.run([sys.executable, os.path.join(REPO_ROOT, 'sync_fitbit_notion.py')], env=env,
+                          stdout=subprocess.DEVNULL).returncode
+
+def main():
+    parser = argparse.ArgumentParser(description='Check that photos uploaded late are picked up from the Drive changes feed')
+    parser.add_argument('--photos', type=int, default=12, help='Photos already in the mock folder')
+    parser.add_argument('--days-late', type=int, default=3, help='Age of the late photo, in days before today')
+    args = parser.parse_args()
+    
+    # Same knobs as run_benchmarks.py, with fast mocks and no pauses
+    mock_args = argparse.Namespace(latency_scale=0.05, jitter=0.1, rate_limit_every=0, photos=args.photos, food_days=2,
+                                   photo_px=400, fitbit_api_delay=0, backfill_day_delay=0, gemini_rpm=1000)
+    workdir = tempfile.mkdtemp(prefix='drive-changes-')
+    mocks = start_mocks(mock_args)
+    configure_environment(mocks, workdir, mock_args)
+    os.chdir(workdir)
+    open('.env', 'w').close()
+    
+    failures = 0
+    try:
+        if run_sync() != 0:
+            print("❌ First sync failed")
+            failures += 1
+        
+        late_day = datetime.now() - timedelta(days=args.days_late)
+        late_date = late_day.strftime('%Y-%m-%d')
+        photo = mocks['drive'].add_photo(late_day.replace(hour=12, minute=30, second=0, microsecond=0))
+        print(f"📤 Uploaded {photo['name']} (lunch on {late_date})")
+        
+        mocks['drive'].reset_counters()
+        if run_sync() != 0:
+            print("❌ Second sync failed")
+            failures += 1
+        
+        rows = [page for page in mocks['notion'].pages.values()
+                if (page['properties'].get('Date', {}).get('date') or {}).get('start') == late_date]
+        if rows and rows[0]['properties'].get('Food Photos Processed', {}).get('checkbox'):
+            print(f"✅ {late_date} food photos processed from the changes feed")
+        else:
+            print(f"❌ The late photo was not processed into the {late_date} row")
+            failures += 1
+        print(f"📊 Drive requests in the second sync: {mocks['drive'].request_count}")
+    finally:
+        for mock in mocks.values():
+            mock.stop()
+    
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for Fitbit's subscription notifier
+Sends the verification GETs and signed notification POSTs that Fitbit sends to a
+subscriber endpoint, so fitbit_webhook.py can be exercised without a public URL.
+
+    python benchmarks/fake_fitbit_notifier.py --url http://127.0.0.1:8080/fitbit/webhook \
+        --collections activities,sleep --dates 2025-07-10 --burst 5
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+class FakeFitbitNotifier:
+    """Signs notifications like Fitbit does (HMAC-SHA1 keyed with '<client secret>&')"""
+    
+    def __init__(self, url: str, client_secret: str, owner_id: str = 'MOCKUSER', subscription_id: str = 'fitbit-notion-sync'):
+        self.url = url
+        self.client_secret = client_secret
+        self.owner_id = owner_id
+        self.subscription_id = subscription_id
+    
+    def sign(self, body: bytes) -> str:
+        digest = hmac.new(f"{self.client_secret}&".encode(), body, hashlib.sha1).digest()
+        return base64.b64encode(digest).decode()
+    
+    @staticmethod
+    def _status(request: urllib.request.Request) -> int:
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                return response.status
+        except urllib.error.HTTPError as e:
+            return e.code
+    
+    def verify(self, code: str) -> int:
+        """Subscriber verification request; a correct endpoint answers 204 (and 404 to wrong codes)"""
+        return self._status(urllib.request.Request(f"{self.url}?verify={code}"))
+    
+    def notification(self, collection_type: str, date: str) -> Dict:
+        return {
+            'collectionType': collection_type,
+            'date': date,
+            'ownerId': self.owner_id,
+            'ownerType': 'user',
+            'subscriptionId': f"{self.subscription_id}-{collection_type}"  # one id per collection, as fitbit_webhook.py subscribes
+        }
+    
+    def notify(self, notifications: List[Dict], signature: Optional[str] = None) -> int:
+        """POST one batch of notifications; returns the HTTP status"""
+        body = json.dumps(notifications).encode()
+        request = urllib.request.Request(self.url, data=body, method='POST', headers={
+            'Content-Type': 'application/json',
+            'X-Fitbit-Signature': signature if signature is not None else self.sign(body)
+        })
+        return self._status(request)
+
+def main():
+    parser = argparse.ArgumentParser(description='Send Fitbit-style subscription notifications to a local receiver')
+    parser.add_argument('--url', default='http://127.0.0.1:8080/fitbit/webhook', help='Subscriber endpoint')
+    parser.add_argument('--client-secret', default=os.getenv('FITBIT_CLIENT_SECRET', ''), help='Key for the signature (default: FITBIT_CLIENT_SECRET)')
+    parser.add_argument('--verify-code', default=os.getenv('FITBIT_SUBSCRIBER_VERIFY_CODE'), help='Also run the verification handshake with this code')
+    parser.add_argument('--collections', default='activities', help='Comma-separated collection types to notify')
+    parser.add_argument('--dates', required=True, help='Comma-separated dates (YYYY-MM-DD) to notify')
+    parser.add_argument('--burst', type=int, default=1, help='Send each notification this many times (tests coalescing)')
+    parser.add_argument('--interval', type=float, default=0.1, help='Seconds between the POSTs of a burst')
+    parser.add_argument('--bad-signature', action='store_true', help='Send an invalid signature (the receiver must answer 404)')
+    args = parser.parse_args()
+    
+    notifier = FakeFitbitNotifier(args.url, args.client_secret)
+    failures = 0
+    
+    if args.verify_code:
+        correct = notifier.verify(args.verify_code)
+        wrong = notifier.verify(args.verify_code + '-wrong')
+        print(f"🔑 Verification: correct code -> {correct}, wrong code -> {wrong}")
+        failures += (correct != 204) + (wrong != 404)
+    
+    dates = [date.strip() for date in args.dates.split(',') if date.strip()]
+    collections = [name.strip() for name in args.collections.split(',') if name.strip()]
+    signature = 'invalid' if args.bad_signature else None
+    expected = 404 if args.bad_signature else 204
+    for _ in range(args.burst):
+        notifications = [notifier.notification(collection, date) for date in dates for collection in collections]
+        status = notifier.notify(notifications, signature)
+        print(f"📤 {len(notifications)} notifications -> {status}")
+        failures += status != expected
+        time.sleep(args.interval)
+    
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Cold-start import benchmark
+Imports each entry point in a fresh interpreter with -X importtime, reports the
+median cumulative import time and the heaviest direct imports, and fails when an
+entry point goes over the budget or eagerly loads a heavy optional dependency.
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 100 --repeat 9 --output imports.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = ['sync_fitbit_notion', 'backfill_fitbit_data', 'manual_sync_today']
+
+# Only the stages that need them may import these
+HEAVY_MODULES = ['googleapiclient', 'google.generativeai', 'google.oauth2', 'PIL', 'notion_client', 'httpx']
+
+DEFAULT_BUDGET_MS = 150
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+def measure_import(module: str) -> Dict:
+    """Import one module in a fresh interpreter; times are in milliseconds"""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr.strip()}")
+    
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports.append({
+                'name': name,
+                'depth': (len(indent) - 1) // 2,
+                'self_ms': int(self_us) / 1000,
+                'cumulative_ms': int(cumulative_us) / 1000
+            })
+    
+    entry = next(item for item in reversed(imports) if item['name'] == module and item['depth'] == 0)
+    
+    # Direct imports of the entry point are listed (deepest first) right before it
+    children = []
+    for item in reversed(imports[:imports.index(entry)]):
+        if item['depth'] == 0:
+            break
+        if item['depth'] == 1:
+            children.append(item)
+    
+    loaded = {item['name'] for item in imports}
+    heavy = sorted(name for name in HEAVY_MODULES
+                   if any(loaded_name == name or loaded_name.startswith(name + '.') for loaded_name in loaded))
+    return {
+        'import_ms': entry['cumulative_ms'],
+        'process_ms': wall * 1000,
+        'children': children,
+        'heavy_modules': heavy
+    }
+
+def benchmark(module: str, repeat: int) -> Dict:
+    measure_import(module)  # warm-up: compiles .pyc files and fills the OS cache
+    runs = [measure_import(module) for _ in range(repeat)]
+    
+    children: Dict[str, List[float]] = {}
+    for run in runs:
+        for child in run['children']:
+            children.setdefault(child['name'], []).append(child['cumulative_ms'])
+    heaviest = sorted(((name, statistics.median(values)) for name, values in children.items()),
+                      key=lambda item: item[1], reverse=True)
+    return {
+        'module': module,
+        'import_ms_p50': round(statistics.median(run['import_ms'] for run in runs), 1),
+        'import_ms_max': round(max(run['import_ms'] for run in runs), 1),
+        'process_ms_p50': round(statistics.median(run['process_ms'] for run in runs), 1),
+        'heaviest_imports': [{'name': name, 'cumulative_ms': round(ms, 1)} for name, ms in heaviest],
+        'heavy_modules': runs[-1]['heavy_modules']
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start import time of the sync entry points')
+    parser.add_argument('--modules', default=','.join(ENTRY_POINTS), help='Comma-separated modules to import')
+    parser.add_argument('--repeat', type=int, default=5, help='Fresh interpreters per module (the median is reported)')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS, help='Max median import time per module')
+    parser.add_argument('--top', type=int, default=5, help='Heaviest direct imports to show per module')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    args = parser.parse_args()
+    
+    modules = [name.strip() for name in args.modules.split(',') if name.strip()]
+    results = []
+    failures = []
+    print(f"{'module':<24} {'import p50':>11} {'max':>9} {'process p50':>12}  heaviest direct imports")
+    for module in modules:
+        result = benchmark(module, args.repeat)
+        results.append(result)
+        heaviest = ', '.join(f"{item['name']} {item['cumulative_ms']}ms" for item in result['heaviest_imports'][:args.top])
+        print(f"{module:<24} {result['import_ms_p50']:>9}ms {result['import_ms_max']:>7}ms "
+              f"{result['process_ms_p50']:>10}ms  {heaviest}")
+        
+        if result['import_ms_p50'] > args.budget_ms:
+            failures.append(f"{module} imports in {result['import_ms_p50']}ms (budget {args.budget_ms:g}ms)")
+        if result['heavy_modules']:
+            failures.append(f"{module} eagerly imports {', '.join(result['heavy_modules'])}")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'budget_ms': args.budget_ms, 'results': results}, f, indent=2)
+        print(f"\n📄 Results written to {args.output}")
+    
+    print()
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        sys.exit(1)
+    print(f"✅ All entry points within the {args.budget_ms:g}ms cold-start budget")
+
+if __name__ == "__main__":
+    main()
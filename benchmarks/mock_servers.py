@@ -0,0 +1,700 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the Fitbit, Notion, Google Drive and Gemini HTTP APIs
+Each server returns realistic payloads for the endpoints the sync scripts use,
+with configurable latency and injected 429 responses
+"""
+
+import base64
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+from PIL import Image, ImageDraw
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, *args):
+        pass
+    
+    def _dispatch(self):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        body = self.rfile.read(length) if length else b''
+        status, headers, payload = self.server.mock.serve(self.command, parsed.path, parse_qs(parsed.query), body, self.headers)
+        
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+    
+    do_GET = do_POST = do_PATCH = do_DELETE = _dispatch
+
+class MockServer:
+    """Threaded HTTP server with simulated latency and periodic 429s"""
+    
+    service = 'mock'
+    
+    def __init__(self, latency: float = 0.05, jitter: float = 0.3, rate_limit_every: int = 0, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_every = rate_limit_every
+        self.random = random.Random(seed)
+        self.request_count = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._server = None
+    
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+    
+    def start(self) -> str:
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.mock = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.base_url
+    
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+    
+    def reset_counters(self):
+        with self._lock:
+            self.request_count = 0
+            self.rate_limited = 0
+    
+    def delay(self, extra: float = 0.0) -> float:
+        with self._lock:
+            factor = self.random.uniform(1 - self.jitter, 1 + self.jitter)
+        return max(0.0, (self.latency + extra) * factor)
+    
+    def serve(self, method: str, path: str, query: Dict, body: bytes, headers) -> Tuple[int, Dict, bytes]:
+        with self._lock:
+            self.request_count += 1
+            throttle = self.rate_limit_every and self.request_count % self.rate_limit_every == 0
+            if throttle:
+                self.rate_limited += 1
+        
+        if throttle:
+            time.sleep(self.delay())
+            return self.rate_limit_response()
+        
+        try:
+            status, response_headers, payload, extra_latency = self.handle(method, path, query, body, headers)
+        except Exception as e:
+            status, response_headers, payload, extra_latency = 500, {}, json_body({'error': str(e)}), 0.0
+        
+        time.sleep(self.delay(extra_latency))
+        return status, response_headers, payload
+    
+    def rate_limit_response(self) -> Tuple[int, Dict, bytes]:
+        return 429, {'Content-Type': 'application/json', 'Retry-After': '1'}, json_body({'error': 'rate limited'})
+    
+    def handle(self, method: str, path: str, query: Dict, body: bytes, headers) -> Tuple[int, Dict, bytes, float]:
+        raise NotImplementedError
+
+def json_body(data) -> bytes:
+    return json.dumps(data).encode()
+
+def json_response(data, status: int = 200, headers: Optional[Dict] = None, extra_latency: float = 0.0):
+    response_headers = {'Content-Type': 'application/json'}
+    response_headers.update(headers or {})
+    return status, response_headers, json_body(data), extra_latency
+
+def _day_random(date: str, salt: str = '') -> random.Random:
+    """Deterministic per-date generator so repeated runs see the same data"""
+    return random.Random(int(hashlib.md5(f"{date}{salt}".encode()).hexdigest()[:8], 16))
+
+class FitbitMock(MockServer):
+    """Fitbit Web API: activities, sleep, heart rate, body and HRV endpoints"""
+    
+    service = 'fitbit'
+    
+    def __init__(self, hourly_limit: int = 150, **kwargs):
+        super().__init__(**kwargs)
+        self.hourly_limit = hourly_limit
+        self.subscriptions: Dict[str, str] = {}  # subscription id -> collection
+    
+    def _rate_headers(self) -> Dict:
+        remaining = max(0, self.hourly_limit - (self.request_count % (self.hourly_limit + 1)))
+        return {
+            'fitbit-rate-limit-limit': str(self.hourly_limit),
+            'fitbit-rate-limit-remaining': str(remaining),
+            'fitbit-rate-limit-reset': '1800'
+        }
+    
+    def rate_limit_response(self):
+        status, headers, payload = super().rate_limit_response()
+        headers.update(self._rate_headers())
+        headers['fitbit-rate-limit-remaining'] = '0'
+        return status, headers, json_body({'errors': [{'errorType': 'system', 'message': 'Too Many Requests'}]})
+    
+    def handle(self, method, path, query, body, headers):
+        if path == '/oauth2/token':
+            return json_response({'access_token': 'mock-access', 'refresh_token': 'mock-refresh', 'expires_in': 28800})
+        
+        match = re.match(r'^/1(?:\.2)?/user/-/(.+?)\.json$', path)
+        if not match:
+            return json_response({'errors': [{'message': f'unknown path {path}'}]}, status=404)
+        resource = match.group(1)
+        
+        if '/apiSubscriptions/' in resource:
+            collection, _, subscription_id = resource.partition('/apiSubscriptions/')
+            with self._lock:
+                existing = self.subscriptions.get(subscription_id)
+                if existing is None:
+                    self.subscriptions[subscription_id] = collection
+            # Like Fitbit, a subscription id identifies one collection only
+            if existing not in (None, collection):
+                return json_response({'errors': [{'errorType': 'conflict', 'message':
+                                      f'Subscription id {subscription_id} is already used for {existing}'}]}, status=409)
+            return json_response({'collectionType': collection, 'ownerId': 'MOCKUSER', 'ownerType': 'user',
+                                  'subscriberId': '1', 'subscriptionId': subscription_id}, status=201 if existing is None else 200)
+        
+        # Range endpoints: <resource>/date/<start>/<end>
+        range_match = re.match(r'^(.+)/date/(\d{4}-\d{2}-\d{2})/(\d{4}-\d{2}-\d{2})$', resource)
+        if range_match:
+            payload = self.date_range(*range_match.groups())
+            if payload is None:
+                return json_response({'errors': [{'message': f'unknown resource {resource}'}]}, status=404)
+            return json_response(payload, headers=self._rate_headers())
+        
+        if resource == 'sleep/list':
+            before = datetime.strptime(query['beforeDate'][0], '%Y-%m-%d')
+            limit = int(query.get('limit', ['5'])[0])
+            dates = [(before - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(1, limit + 1)]
+            payload = {'sleep': [self.sleep_log(date) for date in dates], 'pagination': {}}
+        elif resource.startswith('activities/heart/date/'):
+            payload = self.heart(resource.split('/')[3])
+        elif resource.startswith('activities/date/'):
+            payload = self.activities(resource.split('/')[2])
+        elif resource.startswith('body/log/weight/date/'):
+            payload = self.weight(resource.split('/')[4])
+        elif resource.startswith('body/log/fat/date/'):
+            payload = self.fat(resource.split('/')[4])
+        elif resource.startswith('hrv/date/'):
+            payload = self.hrv(resource.split('/')[2])
+        else:
+            return json_response({'errors': [{'message': f'unknown resource {resource}'}]}, status=404)
+        
+        return json_response(payload, headers=self._rate_headers())
+    
+    def date_range(self, name: str, start: str, end: str) -> Optional[Dict]:
+        """Payload of a range endpoint, built from the single-day payloads"""
+        first = datetime.strptime(start, '%Y-%m-%d')
+        dates = [(first + timedelta(days=offset)).strftime('%Y-%m-%d')
+                 for offset in range((datetime.strptime(end, '%Y-%m-%d') - first).days + 1)]
+        
+        series = {'activities/steps': 'steps', 'activities/calories': 'caloriesOut',
+                  'activities/minutesFairlyActive': 'fairlyActiveMinutes', 'activities/minutesVeryActive': 'veryActiveMinutes'}
+        if name in series:
+            key = series[name]
+            return {f"activities-{name.split('/')[1]}": [
+                {'dateTime': date, 'value': str(self.activities(date)['summary'][key])} for date in dates
+            ]}
+        if name == 'activities/distance':
+            return {'activities-distance': [
+                {'dateTime': date, 'value': str(self.activities(date)['summary']['distances'][0]['distance'])} for date in dates
+            ]}
+        if name == 'activities/heart':
+            return {'activities-heart': [self.heart(date)['activities-heart'][0] for date in dates]}
+        if name == 'sleep':
+            return {'sleep': [self.sleep_log(date) for date in reversed(dates)]}
+        if name in ('body/log/weight', 'body/log/fat'):
+            kind = name.split('/')[-1]
+            return {kind: [entry for date in dates for entry in getattr(self, kind)(date)[kind]]}
+        if name == 'hrv':
+            return {'hrv': [entry for date in dates for entry in self.hrv(date)['hrv']]}
+        return None
+    
+    def activities(self, date: str) -> Dict:
+        rng = _day_random(date, 'activities')
+        steps = rng.randint(3000, 18000)
+        return {
+            'activities': [],
+            'goals': {'steps': 10000},
+            'summary': {
+                'steps': steps,
+                'caloriesOut': rng.randint(1800, 3200),
+                'fairlyActiveMinutes': rng.randint(0, 40),
+                'veryActiveMinutes': rng.randint(0, 60),
+                'lightlyActiveMinutes': rng.randint(60, 300),
+                'sedentaryMinutes': rng.randint(500, 900),
+                'distances': [{'activity': 'total', 'distance': round(steps * 0.00075, 2)}]
+            }
+        }
+    
+    def sleep_log(self, date: str) -> Dict:
+        rng = _day_random(date, 'sleep')
+        asleep = rng.randint(300, 540)
+        start = datetime.strptime(date, '%Y-%m-%d') - timedelta(hours=rng.randint(1, 3), minutes=rng.randint(0, 59))
+        deep, rem = rng.randint(40, 110), rng.randint(60, 130)
+        return {
+            'dateOfSleep': date,
+            'isMainSleep': True,
+            'minutesAsleep': asleep,
+            'efficiency': rng.randint(80, 98),
+            'startTime': start.strftime('%Y-%m-%dT%H:%M:%S.000'),
+            'endTime': (start + timedelta(minutes=asleep + 30)).strftime('%Y-%m-%dT%H:%M:%S.000'),
+            'type': 'stages',
+            'levels': {
+                'summary': {
+                    'deep': {'minutes': deep},
+                    'light': {'minutes': asleep - deep - rem},
+                    'rem': {'minutes': rem},
+                    'wake': {'minutes': 30}
+                },
+                # A night of 30-second stage data, as returned by the real API
+                'data': [{'dateTime': (start + timedelta(seconds=30 * i)).strftime('%Y-%m-%dT%H:%M:%S.000'),
+                          'level': rng.choice(('deep', 'light', 'rem', 'wake')), 'seconds': 30}
+                         for i in range(0, asleep * 2, 8)]
+            }
+        }
+    
+    def heart(self, date: str) -> Dict:
+        rng = _day_random(date, 'heart')
+        return {'activities-heart': [{
+            'dateTime': date,
+            'value': {
+                'restingHeartRate': rng.randint(50, 65),
+                'heartRateZones': [
+                    {'name': 'Out of Range', 'minutes': rng.randint(1000, 1300)},
+                    {'name': 'Fat Burn', 'minutes': rng.randint(20, 120)},
+                    {'name': 'Cardio', 'minutes': rng.randint(0, 40)},
+                    {'name': 'Peak', 'minutes': rng.randint(0, 15)}
+                ]
+            }
+        }]}
+    
+    def weight(self, date: str) -> Dict:
+        rng = _day_random(date, 'weight')
+        if rng.random() < 0.6:
+            return {'weight': []}
+        return {'weight': [{'date': date, 'weight': round(rng.uniform(70, 80), 1), 'bmi': round(rng.uniform(22, 25), 2)}]}
+    
+    def fat(self, date: str) -> Dict:
+        rng = _day_random(date, 'fat')
+        if rng.random() < 0.8:
+            return {'fat': []}
+        return {'fat': [{'date': date, 'fat': round(rng.uniform(14, 22), 1)}]}
+    
+    def hrv(self, date: str) -> Dict:
+        rng = _day_random(date, 'hrv')
+        return {'hrv': [{'dateTime': date, 'value': {
+            'dailyRmssd': round(rng.uniform(25, 60), 3), 'deepRmssd': round(rng.uniform(30, 70), 3)
+        }}]}
+
+def _plain_text(items: List[Dict]) -> List[Dict]:
+    return [dict(item, plain_text=item.get('text', {}).get('content', '')) for item in items]
+
+def _read_properties(properties: Dict) -> Dict:
+    """Convert properties as written (pages.create/update) to the shape queries return"""
+    result = {}
+    for name, value in properties.items():
+        value = dict(value)
+        for kind in ('rich_text', 'title'):
+            if kind in value:
+                value[kind] = _plain_text(value[kind])
+        result[name] = value
+    return result
+
+# Columns reported for databases without an explicit schema: every column of the
+# daily database (after update_notion_schema.py) and of the rollup database
+NOTION_MOCK_COLUMNS = (
+    "Date", "Steps", "Distance (km)", "Calories", "Active Minutes", "Sleep Hours", "Sleep Efficiency",
+    "Deep Sleep (min)", "Light Sleep (min)", "REM Sleep (min)", "Fat Burn Zone (min)", "Cardio Zone (min)",
+    "Peak Zone (min)", "Wake Resting HR", "Sleep Start", "Sleep End", "Weight (kg)", "BMI", "Body Fat %",
+    "HRV Daily RMSSD", "HRV Deep RMSSD", "Breakfast", "Lunch", "Dinner", "Food Photos Processed",
+    "Food Photos Fingerprint", "Anomaly", "Anomaly Note",
+    "Period", "Type", "Dates", "Days",
+) + tuple(f"Avg {label}{suffix}" for label in ("Steps", "Sleep Hours", "HRV", "Resting HR") for suffix in ("", " (28d)"))
+
+class NotionMock(MockServer):
+    """Notion API: database queries with filters/pagination and page create/update, kept in memory.
+    
+    A database given a column set in `schemas` rejects writes to other columns (like
+    Notion's validation_error) and gains the columns added by a database update.
+    """
+    
+    service = 'notion'
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.pages: Dict[str, Dict] = {}
+        self.schemas: Dict[str, set] = {}
+        self._pages_lock = threading.Lock()
+    
+    def unknown_columns(self, database_id: Optional[str], properties: Dict) -> Optional[Dict]:
+        """validation_error response for properties the database doesn't have (None if all exist)"""
+        columns = self.schemas.get(database_id)
+        unknown = [name for name in properties if columns is not None and name not in columns]
+        if not unknown:
+            return None
+        return json_response({'object': 'error', 'status': 400, 'code': 'validation_error',
+                              'message': f'{unknown[0]} is not a property that exists.'}, status=400)
+    
+    def rate_limit_response(self):
+        return 429, {'Content-Type': 'application/json', 'Retry-After': '1'}, json_body({
+            'object': 'error', 'status': 429, 'code': 'rate_limited', 'message': 'You have been rate limited.'
+        })
+    
+    def handle(self, method, path, query, body, headers):
+        data = json.loads(body) if body else {}
+        
+        match = re.match(r'^/v1/databases/([^/]+)/query$', path)
+        if match and method == 'POST':
+            return json_response(self.query(match.group(1), data))
+        
+        if path == '/v1/pages' and method == 'POST':
+            error = self.unknown_columns(data.get('parent', {}).get('database_id'), data.get('properties', {}))
+            if error:
+                return error
+            page_id = str(uuid.uuid4())
+            page = {
+                'object': 'page',
+                'id': page_id,
+                'parent': data.get('parent', {}),
+                'properties': _read_properties(data.get('properties', {}))
+            }
+            with self._pages_lock:
+                self.pages[page_id] = page
+            return json_response(page)
+        
+        match = re.match(r'^/v1/pages/([^/]+)$', path)
+        if match and method == 'PATCH':
+            with self._pages_lock:
+                page = self.pages.get(match.group(1))
+                if page is None:
+                    return json_response({'object': 'error', 'status': 404, 'code': 'object_not_found',
+                                          'message': 'Page not found'}, status=404)
+                error = self.unknown_columns(page['parent'].get('database_id'), data.get('properties', {}))
+                if error:
+                    return error
+                page['properties'].update(_read_properties(data.get('properties', {})))
+            return json_response(page)
+        
+        match = re.match(r'^/v1/databases/([^/]+)$', path)
+        if match:
+            database_id = match.group(1)
+            with self._pages_lock:
+                if method == 'PATCH' and database_id in self.schemas:
+                    self.schemas[database_id] |= set(data.get('properties', {}))
+                columns = self.schemas.get(database_id, NOTION_MOCK_COLUMNS)
+                properties = {name: {'id': name, 'name': name} for name in columns}
+            return json_response({'object': 'database', 'id': database_id, 'properties': properties})
+        
+        return json_response({'object': 'error', 'status': 404, 'code': 'invalid_request_url',
+                              'message': f'Invalid request URL {path}'}, status=404)
+    
+    def query(self, database_id: str, data: Dict) -> Dict:
+        with self._pages_lock:
+            pages = [page for page in self.pages.values()
+                     if page['parent'].get('database_id') in (None, database_id)
+                     and _matches(data.get('filter'), page['properties'])]
+        
+        pages.sort(key=lambda page: ((page['properties'].get('Date', {}).get('date') or {}).get('start') or ''), reverse=True)
+        start = int(data.get('start_cursor') or 0)
+        size = min(int(data.get('page_size', 100)), 100)
+        chunk = pages[start:start + size]
+        has_more = start + size < len(pages)
+        return {
+            'object': 'list',
+            'results': chunk,
+            'has_more': has_more,
+            'next_cursor': str(start + size) if has_more else None
+        }
+
+def _matches(filter_spec: Optional[Dict], properties: Dict) -> bool:
+    if not filter_spec:
+        return True
+    if 'and' in filter_spec:
+        return all(_matches(part, properties) for part in filter_spec['and'])
+    if 'or' in filter_spec:
+        return any(_matches(part, properties) for part in filter_spec['or'])
+    
+    prop = properties.get(filter_spec.get('property'), {})
+    if 'date' in filter_spec:
+        value = ((prop.get('date') or {}).get('start') or '')[:10]
+        condition = filter_spec['date']
+        checks = {
+            'equals': lambda target: value == target,
+            'on_or_after': lambda target: value and value >= target,
+            'on_or_before': lambda target: value and value <= target,
+            'after': lambda target: value and value > target,
+            'before': lambda target: value and value < target,
+            'is_empty': lambda target: not value,
+            'is_not_empty': lambda target: bool(value)
+        }
+        return all(checks[key](target[:10] if isinstance(target, str) else target) for key, target in condition.items())
+    if 'checkbox' in filter_spec:
+        return bool(prop.get('checkbox')) == filter_spec['checkbox'].get('equals')
+    if 'number' in filter_spec:
+        value = prop.get('number')
+        condition = filter_spec['number']
+        if 'is_empty' in condition:
+            return value is None
+        if 'is_not_empty' in condition:
+            return value is not None
+        return value == condition.get('equals')
+    if 'rich_text' in filter_spec:
+        text = ''.join(item.get('plain_text', '') for item in prop.get('rich_text', []))
+        condition = filter_spec['rich_text']
+        if 'is_empty' in condition:
+            return not text
+        if 'is_not_empty' in condition:
+            return bool(text)
+        return text == condition.get('equals')
+    return True
+
+# Meal windows photos are spread over (hour ranges)
+MEAL_HOURS = [(7, 10), (12, 14), (18, 21)]
+
+class DriveMock(MockServer):
+    """Drive v3: folder listing, changes feed, media downloads (with Range) and thumbnails.
+    
+    The folder holds `photo_count` JPEGs spread over `days` days ending at `end_date`.
+    `metadata_ratio` of them carry Drive's imageMediaMetadata.time; the others only
+    have the capture time in their EXIF header. Every `duplicate_every`-th photo is a
+    near-identical second shot of the previous one, a minute later. Photos added with
+    `add_photo` show up in the changes feed, like uploads after the folder was listed.
+    """
+    
+    service = 'drive'
+    
+    def __init__(self, folder_id: str, photo_count: int = 500, days: int = 50, end_date: Optional[str] = None,
+                 photo_px: int = 1600, metadata_ratio: float = 0.7, duplicate_every: int = 5,
+                 thumbnail_latency: float = 0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.folder_id = folder_id
+        self.photo_px = photo_px
+        self.thumbnail_latency = thumbnail_latency
+        self.bytes_served = 0
+        self._images: Dict[str, bytes] = {}
+        self._thumbnails: Dict[Tuple[str, int], bytes] = {}
+        self._image_lock = threading.Lock()
+        
+        end = datetime.strptime(end_date, '%Y-%m-%d') if end_date else datetime.now() - timedelta(days=1)
+        rng = random.Random(42)
+        self.files: List[Dict] = []
+        self.changes: List[Dict] = []
+        self._shots: Dict[str, Tuple[int, datetime, int]] = {}  # id -> (scene seed, capture time, variant)
+        
+        for number in range(photo_count):
+            file_id = f"photo{number:05d}"
+            if duplicate_every and number % duplicate_every == duplicate_every - 1 and self.files:
+                previous = self.files[-1]
+                scene, previous_time, _ = self._shots[previous['id']]
+                captured = previous_time + timedelta(minutes=1)
+                variant = 1
+            else:
+                day = end - timedelta(days=number % max(days, 1))
+                start_hour, end_hour = MEAL_HOURS[(number // max(days, 1)) % len(MEAL_HOURS)]
+                captured = day.replace(hour=rng.randint(start_hour, end_hour - 1), minute=rng.randint(0, 59),
+                                       second=rng.randint(0, 59), microsecond=0)
+                scene = rng.randint(0, 2 ** 31)
+                variant = 0
+            
+            self._shots[file_id] = (scene, captured, variant)
+            uploaded = captured + timedelta(hours=rng.randint(1, 10))
+            file = {
+                'id': file_id,
+                'name': f"PXL_{captured.strftime('%Y%m%d_%H%M%S')}{number % 1000:03d}.jpg" if rng.random() < 0.5
+                        else f"photo_{number}.jpg",
+                'mimeType': 'image/jpeg',
+                'md5Checksum': hashlib.md5(file_id.encode()).hexdigest(),
+                'createdTime': uploaded.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                'modifiedTime': uploaded.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                'parents': [folder_id],
+                'trashed': False,
+                'imageMediaMetadata': {'width': photo_px, 'height': photo_px * 3 // 4}
+            }
+            if rng.random() < metadata_ratio:
+                file['imageMediaMetadata']['time'] = captured.strftime('%Y:%m:%d %H:%M:%S')
+            self.files.append(file)
+    
+    def add_photo(self, captured: datetime) -> Dict:
+        """Upload a photo taken at `captured` now; returns its file resource"""
+        with self._image_lock:
+            number = len(self.files)
+            file_id = f"photo{number:05d}"
+            self._shots[file_id] = (random.Random(number).randint(0, 2 ** 31), captured, 0)
+            uploaded = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000Z')
+            file = {
+                'id': file_id,
+                'name': f"PXL_{captured.strftime('%Y%m%d_%H%M%S')}{number % 1000:03d}.jpg",
+                'mimeType': 'image/jpeg',
+                'md5Checksum': hashlib.md5(file_id.encode()).hexdigest(),
+                'createdTime': uploaded,
+                'modifiedTime': uploaded,
+                'parents': [self.folder_id],
+                'trashed': False,
+                'imageMediaMetadata': {'width': self.photo_px, 'height': self.photo_px * 3 // 4,
+                                       'time': captured.strftime('%Y:%m:%d %H:%M:%S')}
+            }
+            self.files.append(file)
+            self.changes.append({'kind': 'drive#change', 'fileId': file_id, 'removed': False, 'file': file})
+        return file
+    
+    def prepare(self):
+        """Render every original up front so image encoding isn't timed as server latency"""
+        for file in self.files:
+            self.image(file['id'])
+    
+    def _render(self, file_id: str) -> Image.Image:
+        scene, _, variant = self._shots[file_id]
+        rng = random.Random(scene)
+        canvas = Image.new('RGB', (160, 120), tuple(rng.randint(0, 255) for _ in range(3)))
+        draw = ImageDraw.Draw(canvas)
+        for _ in range(12):
+            x, y = rng.randint(0, 150), rng.randint(0, 110)
+            draw.ellipse([x, y, x + rng.randint(10, 60), y + rng.randint(10, 50)],
+                         fill=tuple(rng.randint(0, 255) for _ in range(3)))
+        if variant:
+            # Second shot of the same plate: slightly brighter
+            canvas = canvas.point(lambda value: min(255, value + 6))
+        return canvas.resize((self.photo_px, self.photo_px * 3 // 4), Image.BILINEAR)
+    
+    def image(self, file_id: str) -> bytes:
+        with self._image_lock:
+            cached = self._images.get(file_id)
+        if cached is not None:
+            return cached
+        
+        _, captured, _ = self._shots[file_id]
+        exif = Image.Exif()
+        exif[0x0132] = captured.strftime('%Y:%m:%d %H:%M:%S')
+        exif[0x8769] = {0x9003: captured.strftime('%Y:%m:%d %H:%M:%S')}
+        output = io.BytesIO()
+        self._render(file_id).save(output, format='JPEG', quality=90, exif=exif)
+        
+        with self._image_lock:
+            self._images[file_id] = output.getvalue()
+        return output.getvalue()
+    
+    def thumbnail(self, file_id: str, size: int) -> bytes:
+        key = (file_id, size)
+        with self._image_lock:
+            cached = self._thumbnails.get(key)
+        if cached is not None:
+            return cached
+        
+        image = Image.open(io.BytesIO(self.image(file_id)))
+        image.draft('RGB', (size, size))
+        image = image.convert('RGB')
+        image.thumbnail((size, size))
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=85)
+        
+        with self._image_lock:
+            self._thumbnails[key] = output.getvalue()
+        return output.getvalue()
+    
+    def _file_resource(self, file: Dict) -> Dict:
+        return dict(file, thumbnailLink=f"{self.base_url}/thumbnails/{file['id']}=s220")
+    
+    def handle(self, method, path, query, body, headers):
+        if path == '/token':
+            return json_response({'access_token': 'mock-google-access', 'expires_in': 3599, 'token_type': 'Bearer'})
+        
+        match = re.match(r'^/thumbnails/([^=]+)=s(\d+)$', path)
+        if match:
+            payload = self.thumbnail(match.group(1), int(match.group(2)))
+            self.bytes_served += len(payload)
+            return 200, {'Content-Type': 'image/jpeg'}, payload, self.thumbnail_latency
+        
+        # Page token N = the changes from the N-th one on
+        if path.endswith('/changes/startPageToken'):
+            return json_response({'kind': 'drive#startPageToken', 'startPageToken': str(len(self.changes) + 1)})
+        
+        if path.endswith('/changes'):
+            start = int(query.get('pageToken', ['1'])[0]) - 1
+            changes = [dict(change, file=self._file_resource(change['file'])) for change in self.changes[start:]]
+            return json_response({'kind': 'drive#changeList', 'changes': changes,
+                                  'newStartPageToken': str(len(self.changes) + 1)})
+        
+        if path.endswith('/files'):
+            page_size = min(int(query.get('pageSize', ['100'])[0]), 1000)
+            start = int(query.get('pageToken', ['0'])[0])
+            chunk = self.files[start:start + page_size]
+            payload = {'kind': 'drive#fileList', 'files': [self._file_resource(file) for file in chunk]}
+            if start + page_size < len(self.files):
+                payload['nextPageToken'] = str(start + page_size)
+            return json_response(payload)
+        
+        match = re.match(r'^.*/files/([^/]+)$', path)
+        if match and query.get('alt') == ['media']:
+            content = self.image(match.group(1))
+            range_header = headers.get('Range')
+            if range_header:
+                first, last = re.match(r'bytes=(\d+)-(\d*)', range_header).groups()
+                last = int(last) if last else len(content) - 1
+                payload = content[int(first):last + 1]
+                self.bytes_served += len(payload)
+                return 206, {'Content-Type': 'image/jpeg',
+                             'Content-Range': f"bytes {first}-{int(first) + len(payload) - 1}/{len(content)}"}, payload, 0.0
+            self.bytes_served += len(content)
+            # Simulate transfer time of the full original (~50 MB/s)
+            return 200, {'Content-Type': 'image/jpeg'}, content, len(content) / 50e6
+        
+        return json_response({'error': {'code': 404, 'message': f'File not found: {path}'}}, status=404)
+
+# Foods the Gemini mock answers with, picked per image
+MOCK_FOODS = ['cappuccino', 'fried eggs with tomatoes', 'pizza', 'caesar salad', 'ramen',
+              'greek yogurt with berries', 'chicken curry with rice', 'NO_FOOD']
+
+class GeminiMock(MockServer):
+    """Gemini generateContent (REST): single-image text answers and per-image JSON batch answers"""
+    
+    service = 'gemini'
+    
+    def __init__(self, latency_per_image: float = 0.15, **kwargs):
+        super().__init__(**kwargs)
+        self.latency_per_image = latency_per_image
+        self.images_received = 0
+    
+    def rate_limit_response(self):
+        return 429, {'Content-Type': 'application/json'}, json_body({'error': {
+            'code': 429, 'message': 'Resource has been exhausted (e.g. check quota).', 'status': 'RESOURCE_EXHAUSTED'
+        }})
+    
+    def handle(self, method, path, query, body, headers):
+        if not re.match(r'^/v1beta/models/[^/:]+:generateContent$', path):
+            return json_response({'error': {'code': 404, 'message': f'Not found: {path}', 'status': 'NOT_FOUND'}}, status=404)
+        
+        request = json.loads(body)
+        parts = [part for content in request.get('contents', []) for part in content.get('parts', [])]
+        images = [part['inlineData']['data'] for part in parts if 'inlineData' in part]
+        text_chars = sum(len(part.get('text', '')) for part in parts)
+        with self._lock:
+            self.images_received += len(images)
+        
+        foods = [MOCK_FOODS[int(hashlib.md5(base64.b64decode(data)).hexdigest()[:6], 16) % len(MOCK_FOODS)]
+                 for data in images]
+        generation_config = request.get('generationConfig', {})
+        if generation_config.get('responseMimeType') == 'application/json':
+            text = json.dumps({'items': [{'image': index, 'food': food} for index, food in enumerate(foods)]})
+        else:
+            text = foods[0] if foods else 'NO_FOOD'
+        
+        prompt_tokens = 258 * len(images) + text_chars // 4
+        output_tokens = max(1, len(text) // 4)
+        return json_response({
+            'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'}, 'finishReason': 'STOP', 'index': 0}],
+            'usageMetadata': {'promptTokenCount': prompt_tokens, 'candidatesTokenCount': output_tokens,
+                              'totalTokenCount': prompt_tokens + output_tokens},
+            'modelVersion': 'gemini-2.5-flash'
+        }, extra_latency=self.latency_per_image * len(images))
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Offline end-to-end benchmarks
+Runs the real entry points against the local mock servers in mock_servers.py and
+reports wall time, throughput, request counts and p50/p95 latency per service.
+
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --scenarios sync,food --repeat 5 --output bench.json
+"""
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from mock_servers import FitbitMock, NotionMock, DriveMock, GeminiMock
+
+SCENARIOS = ['sync', 'backfill', 'food', 'food_range']
+SERVICES = ['fitbit', 'notion', 'drive', 'gemini']
+
+# Same folder id the scripts list, so the mock folder is "the" food folder
+MOCK_FOLDER_ID = '1FJhSf-gauhVnMwcHwOez1omDQ7jJtp5B'
+MOCK_DATABASE_ID = 'mock-health-database'
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def start_mocks(args) -> Dict:
+    scale = args.latency_scale
+    common = {'jitter': args.jitter, 'rate_limit_every': args.rate_limit_every}
+    mocks = {
+        'fitbit': FitbitMock(latency=0.08 * scale, **common),
+        'notion': NotionMock(latency=0.15 * scale, **common),
+        'drive': DriveMock(MOCK_FOLDER_ID, photo_count=args.photos, days=args.food_days,
+                           photo_px=args.photo_px, latency=0.05 * scale, thumbnail_latency=0.03 * scale, **common),
+        'gemini': GeminiMock(latency=0.6 * scale, latency_per_image=0.15 * scale, **common)
+    }
+    print(f"🖼️ Rendering {args.photos} mock photos...")
+    mocks['drive'].prepare()
+    for mock in mocks.values():
+        mock.start()
+    return mocks
+
+def configure_environment(mocks: Dict, workdir: str, args):
+    """Point every client at the mocks; must run before the sync modules are imported"""
+    os.environ.update({
+        'FITBIT_API_BASE_URL': mocks['fitbit'].base_url,
+        'NOTION_BASE_URL': mocks['notion'].base_url,
+        'DRIVE_API_ENDPOINT': mocks['drive'].base_url,
+        'GEMINI_API_ENDPOINT': mocks['gemini'].base_url,
+        'GOOGLE_TOKEN_URI': f"{mocks['drive'].base_url}/token",
+        'FITBIT_CLIENT_ID': 'mock-client',
+        'FITBIT_CLIENT_SECRET': 'mock-secret',
+        'FITBIT_ACCESS_TOKEN': 'mock-access',
+        'FITBIT_REFRESH_TOKEN': 'mock-refresh',
+        'NOTION_TOKEN': 'mock-notion-token',
+        'NOTION_DATABASE_ID': MOCK_DATABASE_ID,
+        'GOOGLE_CLIENT_ID': 'mock-google-client',
+        'GOOGLE_CLIENT_SECRET': 'mock-google-secret',
+        'GOOGLE_ACCESS_TOKEN': 'mock-google-access',
+        'GOOGLE_REFRESH_TOKEN': 'mock-google-refresh',
+        'GOOGLE_API_KEY': 'mock-gemini-key',
+        'FITBIT_API_DELAY': str(args.fitbit_api_delay),
+        'BACKFILL_DAY_DELAY': str(args.backfill_day_delay),
+        'GEMINI_RPM': str(args.gemini_rpm),
+        'GEMINI_TPM': str(args.gemini_rpm * 10000),
+        'SYNC_STATE_DIR': os.path.join(workdir, 'state'),
+        'RUN_REPORT_PATH': os.path.join(workdir, 'run_report.json')
+    })
+    for name in ('GITHUB_STEP_SUMMARY', 'METRICS_TEXTFILE'):
+        os.environ.pop(name, None)
+
+@contextmanager
+def quiet(enabled: bool):
+    """Silence the scripts' progress output while timing"""
+    if not enabled:
+        yield
+        return
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as devnull:
+        sys.stdout = devnull
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+
+def reset_run_state(args, mocks: Dict):
+    import google_drive_food
+    from food_cache import close_food_cache
+    
+    if not args.keep_state:
+        close_food_cache()
+        shutil.rmtree(os.environ['SYNC_STATE_DIR'], ignore_errors=True)
+        os.makedirs(os.environ['SYNC_STATE_DIR'], exist_ok=True)
+        mocks['notion'].pages.clear()
+    google_drive_food._photo_buffers.clear()
+    google_drive_food.reset_google_context()
+    for mock in mocks.values():
+        mock.reset_counters()
+
+def run_scenario(name: str, args) -> int:
+    """Run one scenario; returns the number of items (days or photos) it processed"""
+    import telemetry
+    
+    yesterday = datetime.now() - timedelta(days=1)
+    
+    if name == 'sync':
+        import sync_fitbit_notion
+        sys.argv = ['sync_fitbit_notion.py']
+        sync_fitbit_notion.main()
+        return 1
+    
+    if name == 'backfill':
+        import backfill_fitbit_data
+        start = yesterday - timedelta(days=args.backfill_days - 1)
+        sys.argv = ['backfill_fitbit_data.py', '--start-date', start.strftime('%Y-%m-%d'),
+                    '--end-date', yesterday.strftime('%Y-%m-%d')]
+        backfill_fitbit_data.main()
+        return args.backfill_days
+    
+    import google_drive_food
+    telemetry.start_run(f'benchmark_{name}')
+    try:
+        if name == 'food':
+            google_drive_food.process_drive_food_photos(yesterday.strftime('%Y-%m-%d'))
+        else:
+            start = yesterday - timedelta(days=args.food_days - 1)
+            google_drive_food.process_drive_food_photos_range(start.strftime('%Y-%m-%d'), yesterday.strftime('%Y-%m-%d'))
+    finally:
+        telemetry.finish_run()
+    return args.photos
+
+def benchmark(name: str, args, mocks: Dict) -> Dict:
+    walls = []
+    runs = []
+    for _ in range(args.repeat):
+        reset_run_state(args, mocks)
+        started = time.perf_counter()
+        error = None
+        with quiet(not args.verbose):
+            try:
+                items = run_scenario(name, args)
+            except Exception as e:
+                # A crashing run is a result too (e.g. an unhandled 429)
+                items, error = 0, f"{type(e).__name__}: {e}"
+        wall = time.perf_counter() - started
+        walls.append(wall)
+        if error:
+            print(f"  ❌ run failed: {error}")
+        
+        with open(os.environ['RUN_REPORT_PATH']) as f:
+            report = json.load(f)
+        runs.append({
+            'wall_seconds': round(wall, 3),
+            'items': items,
+            'error': error,
+            'requests': {service: report['services'].get(service, {}).get('calls', 0) for service in SERVICES},
+            'errors': {service: report['services'].get(service, {}).get('errors', 0) for service in SERVICES},
+            'latency': {service: report['services'][service]['latency_seconds']
+                        for service in SERVICES if service in report['services']},
+            'server_429s': {service: mocks[service].rate_limited for service in SERVICES},
+            'stages': report['stages']
+        })
+    
+    def median_of(service: str, key: str) -> float:
+        values = [run['latency'][service][key] for run in runs if service in run['latency']]
+        return round(statistics.median(values), 4) if values else 0.0
+    
+    items = max(run['items'] for run in runs)
+    return {
+        'scenario': name,
+        'runs': runs,
+        'failed_runs': sum(1 for run in runs if run['error']),
+        'wall_p50': round(percentile(walls, 0.5), 3),
+        'wall_p95': round(percentile(walls, 0.95), 3),
+        'throughput_per_second': round(items / statistics.median(walls), 3),
+        'unit': 'days' if name in ('sync', 'backfill') else 'photos',
+        'requests': {service: round(statistics.median(run['requests'][service] for run in runs)) for service in SERVICES},
+        'latency_p50': {service: median_of(service, 'p50') for service in SERVICES},
+        'latency_p95': {service: median_of(service, 'p95') for service in SERVICES}
+    }
+
+def print_results(results: List[Dict]):
+    print()
+    print(f"{'scenario':<12} {'wall p50':>9} {'wall p95':>9} {'throughput':>16}  requests / p50 / p95 (s) per service")
+    for result in results:
+        throughput = f"{result['throughput_per_second']} {result['unit']}/s"
+        services = '  '.join(
+            f"{service}={result['requests'][service]}/{result['latency_p50'][service]}/{result['latency_p95'][service]}"
+            for service in SERVICES if result['requests'][service]
+        )
+        failed = f"  ({result['failed_runs']} failed)" if result['failed_runs'] else ''
+        print(f"{result['scenario']:<12} {result['wall_p50']:>8}s {result['wall_p95']:>8}s {throughput:>16}  {services}{failed}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the sync scripts against local mock APIs')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per scenario (wall p50/p95 are across runs)')
+    parser.add_argument('--backfill-days', type=int, default=365, help='Days in the backfill scenario')
+    parser.add_argument('--photos', type=int, default=500, help='Photos in the mock Drive folder')
+    parser.add_argument('--food-days', type=int, default=50, help='Days the photos are spread over')
+    parser.add_argument('--photo-px', type=int, default=1600, help='Width of the mock originals')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='Multiplier for all simulated latencies')
+    parser.add_argument('--jitter', type=float, default=0.3, help='Relative latency jitter')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='Answer every Nth request with 429 (0 = never)')
+    parser.add_argument('--fitbit-api-delay', type=float, default=0.0, help='FITBIT_API_DELAY for the backfill (seconds)')
+    parser.add_argument('--backfill-day-delay', type=float, default=0.0, help='BACKFILL_DAY_DELAY for the backfill (seconds)')
+    parser.add_argument('--gemini-rpm', type=int, default=1000, help='GEMINI_RPM for the food scenarios')
+    parser.add_argument('--keep-state', action='store_true', help='Keep caches/indexes and Notion pages between runs (warm runs)')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help='Show the scripts\' own output')
+    args = parser.parse_args()
+    
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    
+    workdir = tempfile.mkdtemp(prefix='fitbit-notion-bench-')
+    mocks = start_mocks(args)
+    configure_environment(mocks, workdir, args)
+    
+    results = []
+    try:
+        for name in scenarios:
+            print(f"⏱️ {name} ({args.repeat} runs)...")
+            results.append(benchmark(name, args, mocks))
+    finally:
+        for mock in mocks.values():
+            mock.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+        print(f"\n📄 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Incremental Drive ingestion via the Drive changes API
+Keeps a persisted catalog of the food photo folder plus a startPageToken, so each
+run only looks at photos added, modified or removed since the previous run
+"""
+
+from typing import Dict, List, Optional, Tuple
+from state_store import load_json_state, save_json_state
+from telemetry import timed_call
+
+CATALOG_FILE = 'drive_photo_catalog.json'
+
+# File fields needed for timestamp extraction, caching and image preparation
+PHOTO_FIELDS = "id,name,mimeType,md5Checksum,createdTime,modifiedTime,imageMediaMetadata,thumbnailLink,parents,trashed"
+
+def load_catalog(folder_id: str) -> Optional[Dict]:
+    """Load the persisted catalog for this folder (None if there is none yet)"""
+    catalog = load_json_state(CATALOG_FILE)
+    if not catalog or catalog.get('folder_id') != folder_id or not catalog.get('start_page_token'):
+        return None
+    return catalog
+
+def save_catalog(catalog: Dict):
+    save_json_state(CATALOG_FILE, catalog)
+
+def list_folder_files(service, folder_id: str) -> List[Dict]:
+    """Full listing of the image files in a folder (all pages)"""
+    query = f"'{folder_id}' in parents and mimeType contains 'image/' and trashed = false"
+    files = []
+    page_token = None
+    
+    while True:
+        with timed_call('drive'):
+            results = service.files().list(
+                q=query,
+                fields=f"nextPageToken,files({PHOTO_FIELDS})",
+                orderBy='createdTime desc',
+                pageSize=1000,
+                pageToken=page_token
+            ).execute()
+        
+        files.extend(results.get('files', []))
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return files
+
+def seed_catalog(service, folder_id: str) -> Dict:
+    """Build a catalog from a full folder listing"""
+    # Take the token before listing so nothing uploaded in between is missed
+    with timed_call('drive'):
+        start_page_token = service.changes().getStartPageToken().execute()['startPageToken']
+    
+    files = list_folder_files(service, folder_id)
+    print(f"📸 Seeded Drive catalog with {len(files)} photos")
+    
+    return {
+        'folder_id': folder_id,
+        'start_page_token': start_page_token,
+        'files': {file['id']: file for file in files},
+        'pending': {}
+    }
+
+def _is_folder_photo(file: Optional[Dict], folder_id: str) -> bool:
+    return bool(
+        file
+        and not file.get('trashed')
+        and folder_id in file.get('parents', [])
+        and file.get('mimeType', '').startswith('image/')
+    )
+
+def apply_drive_changes(service, catalog: Dict) -> Tuple[List[Dict], List[str]]:
+    """Fetch changes since the catalog's token and apply them.
+    
+    Returns (new_or_modified_files, removed_file_ids). The catalog's token is only
+    advanced once every page of changes has been read.
+    """
+    folder_id = catalog['folder_id']
+    files = catalog['files']
+    changed = {}
+    removed = []
+    page_token = catalog['start_page_token']
+    
+    while page_token:
+        with timed_call('drive'):
+            results = service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                includeRemoved=True,
+                pageSize=1000,
+                fields=f"nextPageToken,newStartPageToken,changes(fileId,removed,file({PHOTO_FIELDS}))"
+            ).execute()
+        
+        for change in results.get('changes', []):
+            file_id = change.get('fileId')
+            file = change.get('file')
+            
+            if change.get('removed') or not _is_folder_photo(file, folder_id):
+                # Deleted, trashed, moved out of the folder or not a photo
+                if files.pop(file_id, None) is not None:
+                    removed.append(file_id)
+                    changed.pop(file_id, None)
+                continue
+            
+            previous = files.get(file_id)
+            if previous is None or previous.get('modifiedTime') != file.get('modifiedTime') \
+                    or previous.get('md5Checksum') != file.get('md5Checksum'):
+                changed[file_id] = file
+            files[file_id] = file
+        
+        if results.get('newStartPageToken'):
+            catalog['start_page_token'] = results['newStartPageToken']
+        page_token = results.get('nextPageToken')
+    
+    return list(changed.values()), removed
+
+def queue_for_analysis(catalog: Dict, date: str, file_id: str):
+    """Record a newly seen photo as waiting for analysis on its date"""
+    pending = catalog.setdefault('pending', {}).setdefault(date, [])
+    if file_id not in pending:
+        pending.append(file_id)
+
+def mark_date_processed(catalog: Dict, date: str):
+    """Clear the analysis queue for a date once its photos have been processed"""
+    catalog.setdefault('pending', {}).pop(date, None)
+
+def pending_dates(catalog: Optional[Dict]) -> List[str]:
+    """Dates with photos that arrived since they were last processed"""
+    if not catalog:
+        return []
+    return sorted(date for date, file_ids in catalog.get('pending', {}).items() if file_ids)
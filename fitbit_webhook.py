@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Fitbit Subscriptions webhook receiver
+Fitbit calls this endpoint whenever a subscribed collection changes:
+    GET  <path>?verify=<code>   subscriber verification: 204 for FITBIT_SUBSCRIBER_VERIFY_CODE, 404 otherwise
+    POST <path>                 JSON list of {"collectionType", "date", "ownerId", ...} notifications,
+                                signed with X-Fitbit-Signature = base64(HMAC-SHA1(body, client_secret + "&"))
+Notifications are acknowledged immediately (Fitbit expects an answer within 5 seconds)
+and queued. Bursts are coalesced per date; then only the changed collections are
+re-fetched and written to that date's Notion row.
+
+    python fitbit_webhook.py --subscribe      # register the subscriptions once
+    python fitbit_webhook.py --port 8080
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import signal
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+from http_client import get_session
+from state_store import load_json_state, save_json_state
+from anomalies import flag_anomalies
+from sync_fitbit_notion import (
+    FITBIT_API_BASE_URL, get_fitbit_data, update_notion_database, rollups_enabled, update_rollups
+)
+import telemetry
+
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/fitbit/webhook')
+# A date's batch is processed once no notification arrived for this long...
+WEBHOOK_QUIET_SECONDS = float(os.getenv('WEBHOOK_QUIET_SECONDS', '30'))
+# ...or at the latest this long after its first notification
+WEBHOOK_MAX_DELAY_SECONDS = float(os.getenv('WEBHOOK_MAX_DELAY_SECONDS', '300'))
+WEBHOOK_RETRY_SECONDS = float(os.getenv('WEBHOOK_RETRY_SECONDS', '300'))
+
+# Prefix of the subscription ids; Fitbit needs a distinct id per collection (<prefix>-<collection>)
+SUBSCRIPTION_ID = os.getenv('FITBIT_SUBSCRIPTION_ID', 'fitbit-notion-sync')
+QUEUE_STATE_FILE = 'webhook_queue.json'
+
+# Fitbit collection types -> get_fitbit_data collections to re-fetch
+# (heart rate zones change with activities, HRV is computed from sleep)
+SUBSCRIPTION_COLLECTIONS = {
+    'activities': ('activities', 'heart'),
+    'sleep': ('sleep', 'hrv'),
+    'body': ('body',)
+}
+
+def verify_signature(body: bytes, signature: Optional[str], client_secret: str) -> bool:
+    """Check X-Fitbit-Signature: base64 HMAC-SHA1 of the raw body keyed with '<client secret>&'"""
+    if not signature or not client_secret:
+        return False
+    digest = hmac.new(f"{client_secret}&".encode(), body, hashlib.sha1).digest()
+    return hmac.compare_digest(base64.b64encode(digest).decode(), signature.strip())
+
+class NotificationQueue:
+    """Changed collections per date, persisted in the state dir and released in coalesced batches"""
+    
+    def __init__(self, quiet_seconds: float = WEBHOOK_QUIET_SECONDS, max_delay_seconds: float = WEBHOOK_MAX_DELAY_SECONDS):
+        self.quiet_seconds = quiet_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self._condition = threading.Condition()
+        self._pending: Dict[str, Set[str]] = {
+            date: set(collections) for date, collections in (load_json_state(QUEUE_STATE_FILE, {}) or {}).items()
+        }
+        self._first: Optional[float] = time.monotonic() if self._pending else None
+        self._last: Optional[float] = self._first
+        self._not_before = 0.0  # retry back-off after a failed batch
+    
+    def _save(self):
+        save_json_state(QUEUE_STATE_FILE, {date: sorted(collections) for date, collections in self._pending.items()})
+    
+    def __len__(self) -> int:
+        with self._condition:
+            return len(self._pending)
+    
+    def add(self, notifications: List[Dict]) -> int:
+        """Queue notifications; returns how many named a collection we sync"""
+        accepted = 0
+        with self._condition:
+            for notification in notifications:
+                collection_type = notification.get('collectionType')
+                date = notification.get('date')
+                if collection_type == 'userRevokedAccess':
+                    print("⚠️ The Fitbit user revoked access; re-run the OAuth setup")
+                    continue
+                if collection_type not in SUBSCRIPTION_COLLECTIONS or not date:
+                    continue
+                self._pending.setdefault(date, set()).update(SUBSCRIPTION_COLLECTIONS[collection_type])
+                accepted += 1
+            
+            if accepted:
+                now = time.monotonic()
+                self._first = self._first or now
+                self._last = now
+                self._save()
+                self._condition.notify()
+        return accepted
+    
+    def requeue(self, batch: Dict[str, Set[str]], delay_seconds: float):
+        """Put a failed batch back, to be retried after `delay_seconds`"""
+        with self._condition:
+            for date, collections in batch.items():
+                self._pending.setdefault(date, set()).update(collections)
+            now = time.monotonic()
+            self._first = self._first or now
+            self._last = self._last or now
+            self._not_before = now + delay_seconds
+            self._save()
+    
+    def next_batch(self, stopping: threading.Event) -> Optional[Dict[str, Set[str]]]:
+        """Block until a coalesced batch is due (None once `stopping` is set)"""
+        with self._condition:
+            while not stopping.is_set():
+                if self._pending:
+                    now = time.monotonic()
+                    due = max(min(self._last + self.quiet_seconds, self._first + self.max_delay_seconds), self._not_before)
+                    if now >= due:
+                        batch, self._pending = self._pending, {}
+                        self._first = self._last = None
+                        self._not_before = 0.0
+                        self._save()
+                        return batch
+                    self._condition.wait(min(due - now, 1.0))
+                else:
+                    self._condition.wait(1.0)
+        return None
+
+def process_batch(batch: Dict[str, Set[str]]) -> Dict[str, Set[str]]:
+    """Re-fetch the changed collections per date and update Notion; returns what failed"""
+    telemetry.start_run('webhook')
+    failed = {}
+    refreshed = {}
+    try:
+        for date, collections in sorted(batch.items()):
+            print(f"🔔 {date}: refreshing {', '.join(sorted(collections))}")
+            with telemetry.stage('fitbit_fetch'):
+                fitbit_data = get_fitbit_data(date, collections=sorted(collections))
+            if fitbit_data is None:
+                failed[date] = collections
+                continue
+            flag_anomalies(date, fitbit_data)
+            with telemetry.stage('notion_write'):
+                update_notion_database(date, fitbit_data, partial=True)
+            refreshed[date] = fitbit_data
+        
+        if refreshed and rollups_enabled():
+            try:
+                with telemetry.stage('rollup'):
+                    update_rollups(refreshed)
+            except Exception as e:
+                print(f"⚠️ Error updating rollups: {e}")
+    finally:
+        telemetry.finish_run('error' if failed else 'ok')
+    return failed
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, *args):
+        pass
+    
+    def _respond(self, status: int):
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+    
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path != self.server.path:
+            return self._respond(404)
+        code = parse_qs(parsed.query).get('verify', [None])[0]
+        verified = bool(self.server.verify_code) and code == self.server.verify_code
+        if code:
+            print(f"{'✅' if verified else '❌'} Subscriber verification request ({'accepted' if verified else 'rejected'})")
+        self._respond(204 if verified else 404)
+    
+    def do_POST(self):
+        if urlparse(self.path).path != self.server.path:
+            return self._respond(404)
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        body = self.rfile.read(length) if length else b''
+        
+        # Fitbit asks subscribers to answer unsigned or tampered notifications with 404
+        if not verify_signature(body, self.headers.get('X-Fitbit-Signature'), self.server.client_secret):
+            print("❌ Rejected notification with an invalid signature")
+            return self._respond(404)
+        try:
+            notifications = json.loads(body or b'[]')
+        except ValueError:
+            return self._respond(400)
+        if isinstance(notifications, dict):
+            notifications = [notifications]
+        
+        accepted = self.server.queue.add(notifications)
+        print(f"📬 {len(notifications)} notifications received ({accepted} queued, {len(self.server.queue)} dates pending)")
+        self._respond(204)
+
+class WebhookReceiver:
+    """HTTP server plus the worker that drains the notification queue"""
+    
+    def __init__(self, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, path: str = WEBHOOK_PATH,
+                 queue: Optional[NotificationQueue] = None):
+        load_dotenv()
+        self.queue = queue if queue is not None else NotificationQueue()
+        self.stopping = threading.Event()
+        self.server = ThreadingHTTPServer((host, port), WebhookHandler)
+        self.server.daemon_threads = True
+        self.server.path = path
+        self.server.queue = self.queue
+        self.server.client_secret = os.getenv('FITBIT_CLIENT_SECRET', '')
+        self.server.verify_code = os.getenv('FITBIT_SUBSCRIBER_VERIFY_CODE', '')
+        self._worker = threading.Thread(target=self._drain, name='webhook-worker', daemon=True)
+        
+        if not self.server.client_secret:
+            print("⚠️ FITBIT_CLIENT_SECRET is not set; every notification will be rejected")
+    
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{self.server.path}"
+    
+    def _drain(self):
+        while True:
+            batch = self.queue.next_batch(self.stopping)
+            if batch is None:
+                return
+            try:
+                failed = process_batch(batch)
+            except Exception as e:
+                print(f"❌ Error processing notifications: {e}")
+                failed = batch
+            if failed:
+                print(f"⚠️ {len(failed)} dates failed, retrying in {WEBHOOK_RETRY_SECONDS:g}s")
+                self.queue.requeue(failed, WEBHOOK_RETRY_SECONDS)
+    
+    def start(self):
+        """Serve in background threads (used by tests and the fake notifier)"""
+        self._worker.start()
+        threading.Thread(target=self.server.serve_forever, name='webhook-server', daemon=True).start()
+        print(f"👂 Listening for Fitbit notifications on {self.url}")
+    
+    def stop(self):
+        self.stopping.set()
+        self.server.shutdown()
+        self.server.server_close()
+        self._worker.join()
+        pending = len(self.queue)
+        if pending:
+            print(f"💾 {pending} dates still queued, they will be processed on the next start")
+    
+    def serve_forever(self):
+        """Serve until SIGTERM/SIGINT"""
+        stopped = threading.Event()
+        
+        def handle_signal(signum, frame):
+            print(f"🛑 {signal.Signals(signum).name} received, shutting down...")
+            stopped.set()
+        
+        signal.signal(signal.SIGTERM, handle_signal)
+        signal.signal(signal.SIGINT, handle_signal)
+        self.start()
+        stopped.wait()
+        self.stop()
+
+def subscribe(collections: List[str], subscription_id: str = SUBSCRIPTION_ID) -> bool:
+    """Create (or confirm) a Fitbit subscription per collection for the authorized user.
+    
+    Fitbit answers 409 to an id already used for another collection, so each one gets its own id.
+    """
+    load_dotenv()
+    headers = {'Authorization': f"Bearer {os.getenv('FITBIT_ACCESS_TOKEN')}"}
+    ok = True
+    for collection in collections:
+        response = get_session().post(
+            f'{FITBIT_API_BASE_URL}/1/user/-/{collection}/apiSubscriptions/{subscription_id}-{collection}.json', headers=headers
+        )
+        if response.status_code in (200, 201):
+            print(f"✅ Subscribed to {collection} ({'already existed' if response.status_code == 200 else 'created'})")
+        else:
+            print(f"❌ Subscribing to {collection} failed: {response.status_code} {response.text}")
+            ok = False
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description='Receive Fitbit subscription notifications and sync the changed data to Notion')
+    parser.add_argument('--host', default=WEBHOOK_HOST, help='Interface to listen on (put it behind an HTTPS reverse proxy)')
+    parser.add_argument('--port', type=int, default=WEBHOOK_PORT, help='Port to listen on')
+    parser.add_argument('--path', default=WEBHOOK_PATH, help='Subscriber endpoint path')
+    parser.add_argument('--quiet-seconds', type=float, default=WEBHOOK_QUIET_SECONDS, help='Wait for this long without notifications before syncing')
+    parser.add_argument('--max-delay-seconds', type=float, default=WEBHOOK_MAX_DELAY_SECONDS, help='Sync at the latest this long after the first notification')
+    parser.add_argument('--subscribe', action='store_true', help=f"Register the {', '.join(SUBSCRIPTION_COLLECTIONS)} subscriptions and exit")
+    args = parser.parse_args()
+    
+    if args.subscribe:
+        telemetry.start_run('webhook_subscribe')
+        ok = False
+        try:
+            ok = subscribe(list(SUBSCRIPTION_COLLECTIONS))
+        finally:
+            telemetry.finish_run('ok' if ok else 'error')
+        return
+    
+    queue = NotificationQueue(args.quiet_seconds, args.max_delay_seconds)
+    WebhookReceiver(args.host, args.port, args.path, queue).serve_forever()
+
+if __name__ == "__main__":
+    main()
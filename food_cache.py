@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Persistent cache of Gemini food descriptions
+Keyed by Drive file id + md5Checksum + prompt/model version, so re-running a date
+skips both the photo download and the model call for photos already analyzed
+"""
+
+import sqlite3
+import threading
+from typing import Optional, Tuple
+from state_store import state_path
+
+CACHE_FILE = 'food_analysis_cache.sqlite3'
+
+_connection = None
+_lock = threading.Lock()
+
+def _get_connection() -> sqlite3.Connection:
+    """Open (once per process) the cache database"""
+    global _connection
+    if _connection is None:
+        _connection = sqlite3.connect(state_path(CACHE_FILE), check_same_thread=False)
+        _connection.execute("""
+            CREATE TABLE IF NOT EXISTS food_analysis (
+                file_id TEXT NOT NULL,
+                checksum TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                description TEXT,
+                analyzed_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (file_id, checksum, prompt_version)
+            )
+        """)
+        _connection.commit()
+    return _connection
+
+def get_cached_analysis(file_id: str, checksum: str, prompt_version: str) -> Tuple[bool, Optional[str]]:
+    """Look up a previous analysis. Returns (hit, description); description is None for NO_FOOD"""
+    with _lock:
+        row = _get_connection().execute(
+            "SELECT description FROM food_analysis WHERE file_id = ? AND checksum = ? AND prompt_version = ?",
+            (file_id, checksum, prompt_version)
+        ).fetchone()
+    
+    if row is None:
+        return False, None
+    return True, row[0]
+
+def store_analysis(file_id: str, checksum: str, prompt_version: str, description: Optional[str]):
+    """Remember the analysis result for a photo (None means no food was detected)"""
+    with _lock:
+        connection = _get_connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO food_analysis (file_id, checksum, prompt_version, description) VALUES (?, ?, ?, ?)",
+            (file_id, checksum, prompt_version, description)
+        )
+        connection.commit()
+
+def invalidate_food_cache() -> int:
+    """Delete every cached analysis (e.g. after changing the prompt). Returns rows removed"""
+    with _lock:
+        connection = _get_connection()
+        cursor = connection.execute("DELETE FROM food_analysis")
+        connection.commit()
+        return cursor.rowcount
+
+def close_food_cache():
+    """Close the cache database (it is reopened on next use)"""
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
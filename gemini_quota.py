@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Gemini quota accounting for concurrent photo analysis
+Keeps requests and tokens within the per-minute limits and tallies usage for the run summary
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+import telemetry
+
+# Free-tier limits for gemini-2.5-flash; override for paid tiers
+GEMINI_MAX_WORKERS = int(os.getenv('GEMINI_MAX_WORKERS', '4'))
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv('GEMINI_RPM', '10'))
+GEMINI_TOKENS_PER_MINUTE = int(os.getenv('GEMINI_TPM', '250000'))
+
+# Rough cost of one food request (image + prompt + short answer) used before the real usage is known
+ESTIMATED_TOKENS_PER_IMAGE = 600
+
+class GeminiRateLimiter:
+    """Sliding one-minute window over requests and tokens, shared by all workers"""
+    
+    def __init__(self, requests_per_minute: int = GEMINI_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = GEMINI_TOKENS_PER_MINUTE, window_seconds: float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window_seconds = window_seconds
+        self._events = deque()  # [timestamp, tokens] per request in the window
+        self._condition = threading.Condition()
+    
+    def _prune(self, now: float):
+        while self._events and now - self._events[0][0] >= self.window_seconds:
+            self._events.popleft()
+    
+    def acquire(self, estimated_tokens: int = ESTIMATED_TOKENS_PER_IMAGE) -> list:
+        """Block until a request fits in the window; returns a handle for `record`"""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._prune(now)
+                tokens_in_window = sum(event[1] for event in self._events)
+                
+                if (len(self._events) < self.requests_per_minute
+                        and tokens_in_window + estimated_tokens <= self.tokens_per_minute) or not self._events:
+                    event = [now, estimated_tokens]
+                    self._events.append(event)
+                    telemetry.record_rate_limit(
+                        'gemini', self.requests_per_minute - len(self._events), limit=self.requests_per_minute
+                    )
+                    return event
+                
+                # Wait until the oldest request leaves the window
+                wait = self.window_seconds - (now - self._events[0][0])
+                self._condition.wait(timeout=max(wait, 0.05))
+    
+    def record(self, handle: list, tokens_used: Optional[int]):
+        """Replace the estimate for a request with its actual token usage"""
+        if tokens_used is None:
+            return
+        with self._condition:
+            handle[1] = tokens_used
+            self._condition.notify_all()
+
+class FoodAnalysisStats:
+    """Per-run counters for the food analysis summary"""
+    
+    def __init__(self):
+        self.started = time.monotonic()
+        self.photos_analyzed = 0
+        self.cache_hits = 0
+        self.failures = 0
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.total_tokens = 0
+        self._lock = threading.Lock()
+    
+    def record_response(self, response) -> Optional[int]:
+        """Add a Gemini response's usage metadata; returns its total token count"""
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', 0) or 0
+        output_tokens = getattr(usage, 'candidates_token_count', 0) or 0
+        total_tokens = getattr(usage, 'total_token_count', 0) or (prompt_tokens + output_tokens)
+        
+        with self._lock:
+            self.requests += 1
+            self.prompt_tokens += prompt_tokens
+            self.output_tokens += output_tokens
+            self.total_tokens += total_tokens
+        telemetry.increment('gemini_tokens', total_tokens)
+        
+        return total_tokens if usage is not None else None
+    
+    def record_analyzed(self, photo_count: int = 1):
+        """Count photos whose analysis was parsed successfully"""
+        with self._lock:
+            self.photos_analyzed += photo_count
+    
+    def record_cache_hit(self):
+        with self._lock:
+            self.cache_hits += 1
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+    
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started
+        return (f"{self.photos_analyzed} photos analyzed in {self.requests} requests, "
+                f"{self.cache_hits} from cache, {self.failures} failed, "
+                f"{elapsed:.1f}s, {self.total_tokens} tokens "
+                f"({self.prompt_tokens} prompt / {self.output_tokens} output)")
@@ -4,24 +4,113 @@ Google Drive Food Detection Integration
 Retrieves food photos from Google Drive folder, extracts metadata, and classifies meals
 """
 
+from __future__ import annotations
+
+import hashlib
+import io
+import json
 import os
-import tempfile
+import re
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-import requests
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
-import google.generativeai as genai
-from PIL import Image
-from PIL.ExifTags import TAGS
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 from dotenv import load_dotenv
+from state_store import update_env_file
+from food_cache import get_cached_analysis, store_analysis, invalidate_food_cache
+from drive_changes import (
+    load_catalog, save_catalog, seed_catalog, apply_drive_changes, list_folder_files,
+    queue_for_analysis, mark_date_processed
+)
+from photo_index import PhotoTimestampIndex
+from photo_dedupe import dedupe_meal_photos
+from gemini_quota import GeminiRateLimiter, FoodAnalysisStats, GEMINI_MAX_WORKERS, ESTIMATED_TOKENS_PER_IMAGE
+from http_client import get_session, get_streamed, read_body
+import http_cassette
+import telemetry
+
+# The Google API client, Gemini SDK and Pillow are imported where they are used:
+# together they take longer to import than a Fitbit-only run takes to finish
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 # Your Google Drive folder ID from the URL
 DRIVE_FOLDER_ID = "1FJhSf-gauhVnMwcHwOez1omDQ7jJtp5B"
 
+# Drive API root (override to point at a local fake Drive server)
+DRIVE_API_ENDPOINT = os.getenv('DRIVE_API_ENDPOINT', 'https://www.googleapis.com').rstrip('/')
+GOOGLE_TOKEN_URI = os.getenv('GOOGLE_TOKEN_URI', 'https://oauth2.googleapis.com/token')
+# Gemini API host; when set, the REST transport is used against it (e.g. a local mock server)
+GEMINI_API_ENDPOINT = os.getenv('GEMINI_API_ENDPOINT')
+
+# Use the changes API and a persisted folder catalog instead of listing the folder every run
+DRIVE_INCREMENTAL = os.getenv('DRIVE_INCREMENTAL', 'true').lower() == 'true'
+
+# Bytes fetched with a Range request when looking for the EXIF header.
+# The APP1 segment is capped at 64KB by the JPEG format, so this is enough
+# for almost every camera file.
+EXIF_HEADER_BYTES = 64 * 1024
+
+# EXIF tags holding timestamps, in order of preference
+EXIF_TAG_EXIF_IFD = 0x8769
+EXIF_TAG_DATETIME_ORIGINAL = 0x9003
+EXIF_TAG_DATETIME_DIGITIZED = 0x9004
+EXIF_TAG_DATETIME = 0x0132
+
+# Gemini model and prompt used for food recognition
+GEMINI_MODEL = 'gemini-2.5-flash'
+
+FOOD_PROMPT = """List only the food and drink items in this image. No descriptions, no presentation details, no extra words.
+
+Good examples:
+- "cappuccino" (not "coffee with latte art" or "cup of coffee")
+- "fried eggs with tomatoes and cucumber" (not "plate of fried eggs served with fresh tomatoes and cucumber slices")
+- "pizza" (not "slice of pizza on a white plate")
+- "caesar salad" (not "fresh caesar salad with croutons")
+
+Just the food items, separated by commas if multiple dishes.
+
+If no food/drink is visible, respond "NO_FOOD"."""
+
+FOOD_BATCH_PROMPT = """You will receive several photos, each preceded by its label ("Image 0", "Image 1", ...).
+For each image, list only the food and drink items in it. No descriptions, no presentation details, no extra words.
+
+Good examples:
+- "cappuccino" (not "coffee with latte art" or "cup of coffee")
+- "fried eggs with tomatoes and cucumber" (not "plate of fried eggs served with fresh tomatoes and cucumber slices")
+- "pizza" (not "slice of pizza on a white plate")
+- "caesar salad" (not "fresh caesar salad with croutons")
+
+Separate multiple dishes in one image with commas. If no food/drink is visible in an image, use "NO_FOOD" for it.
+
+Respond with JSON only, one entry per image:
+{"items": [{"image": 0, "food": "cappuccino"}, {"image": 1, "food": "NO_FOOD"}]}"""
+
+# Cached analyses are only reused for the same model + prompts
+FOOD_PROMPT_VERSION = hashlib.sha256(f"{GEMINI_MODEL}\n{FOOD_PROMPT}\n{FOOD_BATCH_PROMPT}".encode()).hexdigest()[:16]
+
+# How photos are grouped into Gemini requests: 'off' (one request per photo),
+# 'meal' (one request per meal window) or 'day' (one request for the whole day)
+FOOD_BATCH_MODE = os.getenv('FOOD_BATCH_MODE', 'meal').lower()
+FOOD_BATCH_MAX_IMAGES = int(os.getenv('FOOD_BATCH_MAX_IMAGES', '8'))
+
+# Longest side of the image sent to Gemini (0 sends the original file)
+GEMINI_IMAGE_MAX_PX = int(os.getenv('GEMINI_IMAGE_MAX_PX', '1024'))
+
+# Full photo downloads for the current run, keyed by Drive file id.
+# Each photo is fetched at most once and shared by EXIF parsing and Gemini.
+_photo_buffers: Dict[str, bytes] = {}
+
+# Google clients shared by every photo function for the current run
+_google_context = None
+_google_context_lock = threading.Lock()
+
 def refresh_google_credentials():
     """Refresh Google OAuth credentials if needed"""
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
+    
     load_dotenv()
     
     client_id = os.getenv('GOOGLE_CLIENT_ID')
@@ -38,7 +127,7 @@ def refresh_google_credentials():
         refresh_token=refresh_token,
         client_id=client_id,
         client_secret=client_secret,
-        token_uri='https://oauth2.googleapis.com/token'
+        token_uri=GOOGLE_TOKEN_URI
     )
     
     # Refresh if needed
@@ -46,74 +135,207 @@ def refresh_google_credentials():
         print("🔄 Google credentials expired, refreshing...")
         credentials.refresh(Request())
         
-        # Update .env file with new token
-        with open('.env', 'r') as f:
-            content = f.read()
-        
-        if 'GOOGLE_ACCESS_TOKEN=' in content:
-            content = content.replace(
-                f'GOOGLE_ACCESS_TOKEN={access_token}',
-                f'GOOGLE_ACCESS_TOKEN={credentials.token}'
-            )
-        else:
-            content += f'\nGOOGLE_ACCESS_TOKEN={credentials.token}\n'
+        # Replayed token responses are redacted; keep the real token in .env
+        if http_cassette.replaying():
+            return credentials
         
-        with open('.env', 'w') as f:
-            f.write(content)
+        # Update .env file with new token
+        update_env_file({'GOOGLE_ACCESS_TOKEN': credentials.token})
     
     return credentials
 
-def get_drive_photos(date: str) -> List[Dict]:
-    """Get photos from Google Drive folder for a specific date"""
-    credentials = refresh_google_credentials()
-    service = build('drive', 'v3', credentials=credentials)
+def get_drive_service(credentials: Credentials):
+    """Build the Drive API client from the bundled discovery document (no discovery fetch)"""
+    from googleapiclient.discovery import build
     
-    # Parse target date
-    target_date = datetime.strptime(date, '%Y-%m-%d')
+    return build(
+        'drive', 'v3',
+        credentials=credentials,
+        client_options={'api_endpoint': DRIVE_API_ENDPOINT},
+        static_discovery=True
+    )
+
+class GoogleContext:
+    """Credentials, Drive service and Gemini model created once per run"""
     
-    try:
-        # Query files in the folder
-        query = f"'{DRIVE_FOLDER_ID}' in parents and mimeType contains 'image/'"
-        
-        results = service.files().list(
-            q=query,
-            fields="files(id,name,createdTime,modifiedTime,imageMediaMetadata,webContentLink)",
-            orderBy='createdTime desc'
-        ).execute()
-        
-        files = results.get('files', [])
-        print(f"📸 Found {len(files)} photos in Drive folder")
+    def __init__(self):
+        self.credentials = refresh_google_credentials()
+        self.drive = get_drive_service(self.credentials)
+        self._model = None
+        self._model_lock = threading.Lock()
+    
+    @property
+    def model(self):
+        """Gemini model, configured on first use so Drive-only runs don't need an API key"""
+        with self._model_lock:
+            if self._model is None:
+                import google.generativeai as genai
+                
+                api_key = os.getenv('GOOGLE_API_KEY')
+                if not api_key:
+                    raise Exception("GOOGLE_API_KEY not found in .env file")
+                
+                # REST is needed for local endpoints and for recording/replaying HTTP
+                transport = os.getenv('GEMINI_TRANSPORT') or ('rest' if GEMINI_API_ENDPOINT else None)
+                client_options = {'api_endpoint': GEMINI_API_ENDPOINT} if GEMINI_API_ENDPOINT else None
+                genai.configure(api_key=api_key, transport=transport, client_options=client_options)
+                self._model = genai.GenerativeModel(GEMINI_MODEL)
+            return self._model
+
+def get_google_context() -> GoogleContext:
+    """Return the run's Google context, creating it (and refreshing credentials) once"""
+    global _google_context
+    with _google_context_lock:
+        if _google_context is None or not _google_context.credentials.valid:
+            _google_context = GoogleContext()
+        return _google_context
+
+def reset_google_context():
+    """Drop the shared Google clients (next use re-reads credentials)"""
+    global _google_context
+    with _google_context_lock:
+        _google_context = None
+
+def _file_info(file: Dict) -> Dict:
+    """Prepare file info from a Drive file resource"""
+    return {
+        'id': file['id'],
+        'name': file['name'],
+        'mime_type': file.get('mimeType', 'image/jpeg'),
+        'checksum': file.get('md5Checksum') or file.get('modifiedTime', ''),
+        'created_time': file.get('createdTime'),
+        'modified_time': file.get('modifiedTime'),
+        'image_metadata': file.get('imageMediaMetadata', {}),
+        'thumbnail_link': file.get('thumbnailLink'),
+        'download_url': f"https://drive.google.com/uc?id={file['id']}"
+    }
+
+def _resolve_into_index(files: List[Dict], index: PhotoTimestampIndex, credentials: Credentials,
+                        keep_dates: Set[str]) -> List[str]:
+    """Resolve capture times for files the index hasn't seen at this modifiedTime.
+    
+    Returns the dates of newly resolved photos. Download buffers are only kept
+    for photos on one of `keep_dates`.
+    """
+    new_dates = []
+    for file in files:
+        if index.lookup(file['id'], file.get('modifiedTime')) is not None:
+            continue
         
-        # Filter by date and prepare file info
-        photos = []
-        for file in files:
-            file_info = {
-                'id': file['id'],
-                'name': file['name'],
-                'created_time': file.get('createdTime'),
-                'modified_time': file.get('modifiedTime'),
-                'image_metadata': file.get('imageMediaMetadata', {}),
-                'download_url': f"https://drive.google.com/uc?id={file['id']}"
-            }
-            
-            # Try to determine photo timestamp
-            photo_time = get_photo_timestamp(file_info, credentials)
-            if photo_time:
-                photo_date = photo_time.date()
-                if photo_date == target_date.date():
-                    file_info['photo_time'] = photo_time
-                    photos.append(file_info)
-                    print(f"  📷 {file['name']} - {photo_time.strftime('%H:%M')}")
+        photo_time, source = resolve_photo_timestamp(_file_info(file), credentials)
+        index.update(file['id'], file.get('modifiedTime'), photo_time, source)
         
-        print(f"📅 Found {len(photos)} photos for {date}")
-        return photos
+        photo_date = photo_time.strftime('%Y-%m-%d') if photo_time else None
+        if photo_date not in keep_dates:
+            release_photo(file['id'])
+        if photo_date:
+            new_dates.append(photo_date)
+    return new_dates
+
+def sync_catalog_photos(service, credentials: Credentials, index: PhotoTimestampIndex,
+                        keep_dates: Set[str]) -> Dict[str, Dict]:
+    """Bring the index up to date from the Drive changes API; returns folder files by id"""
+    catalog = load_catalog(DRIVE_FOLDER_ID)
+    seeding = catalog is None
+    
+    if seeding:
+        with telemetry.stage('drive_listing'):
+            catalog = seed_catalog(service, DRIVE_FOLDER_ID)
+        changed = list(catalog['files'].values())
+    else:
+        with telemetry.stage('drive_listing'):
+            changed, removed = apply_drive_changes(service, catalog)
+        for file_id in removed:
+            index.remove(file_id)
+        print(f"📸 Drive changes: {len(changed)} new/modified, {len(removed)} removed photos")
+    
+    with telemetry.stage('photo_timestamps'):
+        _resolve_into_index(changed, index, credentials, keep_dates)
+    
+    # Queue new photos for analysis under their capture date
+    if not seeding:
+        for file in changed:
+            entry = index.lookup(file['id'], file.get('modifiedTime'))
+            if entry and entry.get('date'):
+                queue_for_analysis(catalog, entry['date'], file['id'])
+    
+    save_catalog(catalog)
+    return catalog['files']
+
+def sync_listed_photos(service, credentials: Credentials, index: PhotoTimestampIndex,
+                       keep_dates: Set[str]) -> Dict[str, Dict]:
+    """Full folder listing (used when incremental sync is off or fails); returns folder files by id"""
+    with telemetry.stage('drive_listing'):
+        files = list_folder_files(service, DRIVE_FOLDER_ID)
+    print(f"📸 Found {len(files)} photos in Drive folder")
+    
+    with telemetry.stage('photo_timestamps'):
+        _resolve_into_index(files, index, credentials, keep_dates)
+    
+    # Forget photos that are no longer in the folder
+    current_ids = {file['id'] for file in files}
+    for file_id in list(index.entries):
+        if file_id not in current_ids:
+            index.remove(file_id)
+    
+    return {file['id']: file for file in files}
+
+def sync_photo_index(index: PhotoTimestampIndex, keep_dates: Set[str]) -> Dict[str, Dict]:
+    """Update the timestamp index from Drive; returns folder files by id"""
+    context = get_google_context()
+    
+    with telemetry.stage('drive_sync'):
+        if DRIVE_INCREMENTAL:
+            try:
+                return sync_catalog_photos(context.drive, context.credentials, index, keep_dates)
+            except Exception as e:
+                print(f"⚠️ Incremental Drive sync failed ({e}), listing the whole folder")
         
-    except Exception as e:
-        print(f"❌ Error retrieving Drive photos: {e}")
-        return []
+        return sync_listed_photos(context.drive, context.credentials, index, keep_dates)
+
+def photos_for_date(files: Dict[str, Dict], index: PhotoTimestampIndex, date: str) -> List[Dict]:
+    """File info (with photo_time) for the photos taken on a date"""
+    photos = []
+    for file_id in index.file_ids_on(date):
+        if file_id not in files:
+            continue
+        file_info = _file_info(files[file_id])
+        file_info['photo_time'] = index.photo_time(file_id)
+        photos.append(file_info)
+    return photos
+
+def get_drive_photos(date: str) -> List[Dict]:
+    """Get photos from Google Drive folder for a specific date.
+    
+    Raises if Drive can't be read, so a failed listing is never mistaken for a day without photos.
+    """
+    index = PhotoTimestampIndex.load()
+    files = sync_photo_index(index, {date})
+    index.save()
+    
+    photos = photos_for_date(files, index, date)
+    for photo in photos:
+        print(f"  📷 {photo['name']} - {photo['photo_time'].strftime('%H:%M')}")
+    
+    print(f"📅 Found {len(photos)} photos for {date}")
+    return photos
+
+def mark_photos_processed(dates: List[str]):
+    """Clear the incremental analysis queue for the given dates"""
+    if not DRIVE_INCREMENTAL or not dates:
+        return
+    catalog = load_catalog(DRIVE_FOLDER_ID)
+    if catalog:
+        for date in dates:
+            mark_date_processed(catalog, date)
+        save_catalog(catalog)
 
 def get_photo_timestamp(file_info: Dict, credentials: Credentials) -> Optional[datetime]:
     """Extract the original photo timestamp (when picture was taken) from various sources"""
+    return resolve_photo_timestamp(file_info, credentials)[0]
+
+def resolve_photo_timestamp(file_info: Dict, credentials: Credentials) -> Tuple[Optional[datetime], Optional[str]]:
+    """Like get_photo_timestamp, also returning the source: metadata, exif, filename or upload"""
     
     # Priority 1: Google Drive's image metadata (includes original timestamp)
     image_meta = file_info.get('image_metadata', {})
@@ -121,31 +343,17 @@ def get_photo_timestamp(file_info: Dict, credentials: Credentials) -> Optional[d
         try:
             original_time = datetime.fromisoformat(image_meta['time'].replace('Z', '+00:00'))
             print(f"  🕒 Original timestamp from Drive metadata: {original_time}")
-            return original_time
+            return original_time, 'metadata'
         except:
             pass
     
-    # Priority 2: Download and extract EXIF data (most reliable for original timestamp)
+    # Priority 2: Read EXIF data from the file header (most reliable for original timestamp)
     try:
-        download_url = f"https://www.googleapis.com/drive/v3/files/{file_info['id']}?alt=media"
-        headers = {'Authorization': f'Bearer {credentials.token}'}
-        
-        response = requests.get(download_url, headers=headers)
-        if response.status_code == 200:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-                temp_file.write(response.content)
-                temp_path = temp_file.name
-            
-            try:
-                exif_time = extract_exif_timestamp(temp_path)
-                if exif_time:
-                    print(f"  📸 Original timestamp from EXIF: {exif_time}")
-                    os.unlink(temp_path)
-                    return exif_time
-                os.unlink(temp_path)
-            except:
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
+        with telemetry.stage('exif'):
+            exif_time = fetch_exif_timestamp(file_info['id'], credentials)
+        if exif_time:
+            print(f"  📸 Original timestamp from EXIF: {exif_time}")
+            return exif_time, 'exif'
     except Exception as e:
         print(f"  ⚠️ Could not extract EXIF data: {e}")
     
@@ -157,7 +365,7 @@ def get_photo_timestamp(file_info: Dict, credentials: Credentials) -> Optional[d
                 try:
                     meta_time = datetime.fromisoformat(str(image_meta[field]).replace('Z', '+00:00'))
                     print(f"  📅 Timestamp from metadata field '{field}': {meta_time}")
-                    return meta_time
+                    return meta_time, 'metadata'
                 except:
                     continue
     
@@ -166,23 +374,233 @@ def get_photo_timestamp(file_info: Dict, credentials: Credentials) -> Optional[d
     timestamp_from_name = parse_timestamp_from_filename(filename)
     if timestamp_from_name:
         print(f"  📝 Timestamp from filename: {timestamp_from_name}")
-        return timestamp_from_name
+        return timestamp_from_name, 'filename'
     
     # Last resort: Use upload time (created_time) but warn user
     if file_info.get('created_time'):
         try:
             upload_time = datetime.fromisoformat(file_info['created_time'].replace('Z', '+00:00'))
             print(f"  ⚠️ Using upload time (not original photo time): {upload_time}")
-            return upload_time
+            return upload_time, 'upload'
         except:
             pass
     
+    return None, None
+
+def download_photo(file_id: str, credentials: Credentials) -> Optional[bytes]:
+    """Download a photo into memory, reusing the buffer if it was already fetched this run"""
+    if file_id in _photo_buffers:
+        return _photo_buffers[file_id]
+    
+    download_url = f"{DRIVE_API_ENDPOINT}/drive/v3/files/{file_id}?alt=media"
+    response = get_session().get(download_url, headers={'Authorization': f'Bearer {credentials.token}'}, stream=True)
+    if response.status_code != 200:
+        response.close()
+        print(f"❌ Failed to download image: {response.status_code}")
+        return None
+    
+    _photo_buffers[file_id] = read_body(response)
+    return _photo_buffers[file_id]
+
+def release_photo(file_id: str):
+    """Drop the in-memory buffer for a photo once it is no longer needed"""
+    _photo_buffers.pop(file_id, None)
+
+def prepare_food_image(photo: Dict, credentials: Credentials) -> Optional[Tuple[bytes, str]]:
+    """Produce a food-recognition-sized image for Gemini. Returns (image_bytes, mime_type)"""
+    mime_type = photo.get('mime_type', 'image/jpeg')
+    
+    if GEMINI_IMAGE_MAX_PX <= 0:
+        image_bytes = download_photo(photo['id'], credentials)
+        return (image_bytes, mime_type) if image_bytes else None
+    
+    # Already downloaded for EXIF - shrink the buffer locally
+    if photo['id'] in _photo_buffers:
+        return downscale_image(_photo_buffers[photo['id']], mime_type)
+    
+    # Let Drive render a thumbnail at the target size instead of pulling the original
+    thumbnail_link = photo.get('thumbnail_link')
+    if thumbnail_link:
+        sized_link = re.sub(r'=s\d+$', '', thumbnail_link) + f'=s{GEMINI_IMAGE_MAX_PX}'
+        response = get_streamed(sized_link, headers={'Authorization': f'Bearer {credentials.token}'})
+        if response.status_code == 200 and response.content:
+            thumbnail_type = response.headers.get('Content-Type', 'image/jpeg').split(';')[0]
+            return response.content, thumbnail_type
+        print(f"  ⚠️ Thumbnail unavailable for {photo['name']} ({response.status_code}), using original")
+    
+    image_bytes = download_photo(photo['id'], credentials)
+    if not image_bytes:
+        return None
+    return downscale_image(image_bytes, mime_type)
+
+def downscale_image(image_bytes: bytes, mime_type: str = 'image/jpeg') -> Tuple[bytes, str]:
+    """Shrink an image to GEMINI_IMAGE_MAX_PX on its longest side, re-encoded as JPEG"""
+    from PIL import Image
+    
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        target = (GEMINI_IMAGE_MAX_PX, GEMINI_IMAGE_MAX_PX)
+        if max(image.size) <= GEMINI_IMAGE_MAX_PX:
+            return image_bytes, mime_type
+        
+        # For JPEGs, let the decoder scale down by 1/2, 1/4 or 1/8 instead of decoding every pixel
+        image.draft('RGB', target)
+        image = image.convert('RGB')
+        image.thumbnail(target)
+        
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=85)
+        return output.getvalue(), 'image/jpeg'
+    except Exception as e:
+        print(f"  ⚠️ Could not downscale image, sending original: {e}")
+        return image_bytes, mime_type
+
+def fetch_photo_header(file_id: str, credentials: Credentials, length: int = EXIF_HEADER_BYTES) -> Optional[bytes]:
+    """Fetch only the first `length` bytes of a Drive file using a Range request"""
+    download_url = f"{DRIVE_API_ENDPOINT}/drive/v3/files/{file_id}?alt=media"
+    headers = {
+        'Authorization': f'Bearer {credentials.token}',
+        'Range': f'bytes=0-{length - 1}'
+    }
+    
+    # Stream so that a server ignoring the Range header doesn't make us pull the whole file
+    response = get_session().get(download_url, headers=headers, stream=True)
+    if response.status_code not in (200, 206):
+        response.close()
+        return None
+    return read_body(response, max_bytes=length)
+
+def fetch_exif_timestamp(file_id: str, credentials: Credentials) -> Optional[datetime]:
+    """Read the EXIF timestamp from the file header, downloading the full file only if needed"""
+    # Already downloaded this run - parse the buffer instead of fetching again
+    header = _photo_buffers.get(file_id) or fetch_photo_header(file_id, credentials)
+    if not header:
+        return None
+    
+    if header.startswith(b'\xff\xd8'):
+        tiff, required_length = locate_exif_block(header)
+        if tiff is not None:
+            return parse_tiff_timestamp(tiff)
+        if not required_length:
+            # Complete JPEG header without an EXIF segment
+            return None
+    
+    # EXIF block is larger than the header (or not a JPEG) - fall back to the full file,
+    # which stays buffered so that Gemini analysis doesn't download it again
+    image_bytes = download_photo(file_id, credentials)
+    if not image_bytes:
+        return None
+    
+    tiff, _ = locate_exif_block(image_bytes)
+    if tiff is not None:
+        return parse_tiff_timestamp(tiff)
+    return extract_exif_timestamp(io.BytesIO(image_bytes))
+
+def locate_exif_block(data: bytes) -> Tuple[Optional[bytes], int]:
+    """Find the TIFF block of a JPEG's EXIF APP1 segment.
+    
+    Returns (tiff_bytes, 0) when found, (None, required_length) when the buffer
+    ends before the EXIF segment does, and (None, 0) when there is no EXIF data.
+    """
+    if not data.startswith(b'\xff\xd8'):
+        return None, 0
+    
+    offset = 2
+    while offset + 4 <= len(data):
+        if data[offset] != 0xFF:
+            return None, 0
+        marker = data[offset + 1]
+        
+        # Fill bytes and standalone markers have no length field
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            offset += 2
+            continue
+        # Start of scan / end of image: metadata segments are over
+        if marker in (0xDA, 0xD9):
+            return None, 0
+        
+        segment_length = struct.unpack('>H', data[offset + 2:offset + 4])[0]
+        segment_end = offset + 2 + segment_length
+        
+        if marker == 0xE1 and data[offset + 4:offset + 10] == b'Exif\x00\x00':
+            if segment_end > len(data):
+                return None, segment_end
+            return data[offset + 10:segment_end], 0
+        
+        offset = segment_end
+    
+    # Ran out of buffer while walking the segments
+    return None, offset + 4
+
+def parse_tiff_timestamp(tiff: bytes) -> Optional[datetime]:
+    """Parse DateTimeOriginal (or DateTimeDigitized/DateTime) from an EXIF TIFF block"""
+    try:
+        if tiff[:2] == b'II':
+            endian = '<'
+        elif tiff[:2] == b'MM':
+            endian = '>'
+        else:
+            return None
+        
+        ifd0_offset = struct.unpack(endian + 'I', tiff[4:8])[0]
+        ifd0 = _read_tiff_ifd(tiff, ifd0_offset, endian)
+        
+        tags = {}
+        if EXIF_TAG_DATETIME in ifd0:
+            tags[EXIF_TAG_DATETIME] = ifd0[EXIF_TAG_DATETIME]
+        
+        if EXIF_TAG_EXIF_IFD in ifd0:
+            exif_ifd_offset = struct.unpack(endian + 'I', ifd0[EXIF_TAG_EXIF_IFD][2])[0]
+            tags.update(_read_tiff_ifd(tiff, exif_ifd_offset, endian))
+        
+        for tag in (EXIF_TAG_DATETIME_ORIGINAL, EXIF_TAG_DATETIME_DIGITIZED, EXIF_TAG_DATETIME):
+            if tag not in tags:
+                continue
+            value = _read_tiff_ascii(tiff, tags[tag], endian)
+            try:
+                return datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
+            except (TypeError, ValueError):
+                continue
+    except (struct.error, IndexError):
+        pass
+    
     return None
 
-def extract_exif_timestamp(image_path: str) -> Optional[datetime]:
-    """Extract timestamp from image EXIF data"""
+def _read_tiff_ifd(tiff: bytes, offset: int, endian: str) -> Dict[int, Tuple[int, int, bytes]]:
+    """Read an IFD into {tag: (type, count, raw 4-byte value/offset)}"""
+    entry_count = struct.unpack(endian + 'H', tiff[offset:offset + 2])[0]
+    entries = {}
+    for i in range(entry_count):
+        start = offset + 2 + i * 12
+        entry = tiff[start:start + 12]
+        if len(entry) < 12:
+            break
+        tag, field_type, count = struct.unpack(endian + 'HHI', entry[:8])
+        entries[tag] = (field_type, count, entry[8:12])
+    return entries
+
+def _read_tiff_ascii(tiff: bytes, entry: Tuple[int, int, bytes], endian: str) -> Optional[str]:
+    """Decode an ASCII-typed IFD entry"""
+    field_type, count, raw = entry
+    if field_type != 2:
+        return None
+    if count <= 4:
+        value = raw[:count]
+    else:
+        value_offset = struct.unpack(endian + 'I', raw)[0]
+        value = tiff[value_offset:value_offset + count]
+    return value.split(b'\x00', 1)[0].decode('ascii', errors='ignore').strip()
+
+def extract_exif_timestamp(image_source) -> Optional[datetime]:
+    """Extract timestamp from image EXIF data (path or file-like object)"""
+    from PIL import Image
+    from PIL.ExifTags import TAGS
+    
     try:
-        image = Image.open(image_path)
+        image = Image.open(image_source)
         exif = image._getexif()
         
         if exif:
@@ -206,7 +624,6 @@ def extract_exif_timestamp(image_path: str) -> Optional[datetime]:
 
 def parse_timestamp_from_filename(filename: str) -> Optional[datetime]:
     """Parse timestamp from filename patterns like IMG_20240723_142530.jpg"""
-    import re
     
     # Common filename patterns with timestamps
     patterns = [
@@ -241,112 +658,336 @@ def classify_meal_time(photo_time: datetime) -> Optional[str]:
     else:
         return None  # Outside typical meal times
 
-def analyze_food_image(image_url: str) -> Optional[str]:
-    """Analyze image using Gemini AI to detect and describe food"""
-    load_dotenv()
+def generate_food_response(image_bytes: bytes, mime_type: str = 'image/jpeg'):
+    """Send one image to Gemini with the food prompt and return the raw response"""
+    model = get_google_context().model
     
-    # Configure Gemini API
-    api_key = os.getenv('GOOGLE_API_KEY')
-    if not api_key:
-        print("⚠️ GOOGLE_API_KEY not found in .env file")
+    # Send the image inline with the prompt (no separate upload round-trip)
+    image_part = {'mime_type': mime_type, 'data': image_bytes}
+    with telemetry.stage('gemini_request'), telemetry.timed_call('gemini'):
+        return model.generate_content([FOOD_PROMPT, image_part])
+
+def parse_food_response(response) -> Optional[str]:
+    """Turn a Gemini response into a food description (None for NO_FOOD)"""
+    text = response.text.strip()
+    if text == "NO_FOOD":
         return None
+    return text
+
+def analyze_food_image(image_bytes: bytes, mime_type: str = 'image/jpeg') -> Optional[str]:
+    """Analyze image using Gemini AI to detect and describe food.
     
-    genai.configure(api_key=api_key)
+    Returns None when no food is visible; raises if the analysis itself failed
+    so that failures are never cached as NO_FOOD.
+    """
+    return parse_food_response(generate_food_response(image_bytes, mime_type))
+
+def generate_food_batch_response(images: List[Tuple[bytes, str]]):
+    """Send several images to Gemini in one request, asking for per-image JSON items"""
+    model = get_google_context().model
     
-    try:
-        # Download image from Drive with proper authentication
-        credentials = refresh_google_credentials()
-        headers = {'Authorization': f'Bearer {credentials.token}'}
-        
-        response = requests.get(image_url, headers=headers)
-        if response.status_code != 200:
-            print(f"❌ Failed to download image: {response.status_code}")
-            return None
-        
-        # Save image temporarily for processing
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.jpg') as temp_file:
-            temp_file.write(response.content)
-            temp_path = temp_file.name
-        
-        try:
-            # Upload image to Gemini
-            image_file = genai.upload_file(temp_path)
-            
-            # Initialize Gemini model
-            model = genai.GenerativeModel('gemini-2.5-flash')
-            
-            # Create prompt for food analysis
-            prompt = """List only the food and drink items in this image. No descriptions, no presentation details, no extra words.
+    contents = [FOOD_BATCH_PROMPT]
+    for index, (image_bytes, mime_type) in enumerate(images):
+        contents.append(f"Image {index}:")
+        contents.append({'mime_type': mime_type, 'data': image_bytes})
+    
+    with telemetry.stage('gemini_request'), telemetry.timed_call('gemini'):
+        return model.generate_content(contents, generation_config={'response_mime_type': 'application/json'})
 
-Good examples:
-- "cappuccino" (not "coffee with latte art" or "cup of coffee")
-- "fried eggs with tomatoes and cucumber" (not "plate of fried eggs served with fresh tomatoes and cucumber slices")
-- "pizza" (not "slice of pizza on a white plate")
-- "caesar salad" (not "fresh caesar salad with croutons")
+def parse_food_batch_response(response, image_count: int) -> List[Optional[str]]:
+    """Map a batch response back to one description per image (None for NO_FOOD)"""
+    items = json.loads(response.text).get('items', [])
+    
+    descriptions = {}
+    for item in items:
+        index = int(item.get('image', -1))
+        food = str(item.get('food', '')).strip()
+        if 0 <= index < image_count:
+            descriptions[index] = None if food in ('', 'NO_FOOD') else food
+    
+    if len(descriptions) != image_count:
+        raise ValueError(f"Batch response covered {len(descriptions)} of {image_count} images")
+    
+    return [descriptions[index] for index in range(image_count)]
 
-Just the food items, separated by commas if multiple dishes.
+def _analyze_photo(photo: Dict, credentials: Credentials, rate_limiter: GeminiRateLimiter,
+                   stats: FoodAnalysisStats) -> Tuple[bool, Optional[str]]:
+    """Worker task: download, analyze and cache one photo. Returns (ok, description)"""
+    try:
+        # Downscaled image (from a Drive thumbnail or the in-memory original), analyzed inline
+        with telemetry.stage('image_prep'):
+            image = prepare_food_image(photo, credentials)
+        if not image:
+            stats.record_failure()
+            return False, None
+        
+        handle = rate_limiter.acquire()
+        response = generate_food_response(*image)
+        rate_limiter.record(handle, stats.record_response(response))
+        food_description = parse_food_response(response)
+        stats.record_analyzed()
+    except Exception as e:
+        print(f"❌ Error analyzing {photo['name']} with Gemini: {e}")
+        stats.record_failure()
+        return False, None
+    finally:
+        release_photo(photo['id'])
+    
+    store_analysis(photo['id'], photo.get('checksum', ''), FOOD_PROMPT_VERSION, food_description)
+    return True, food_description
 
-If no food/drink is visible, respond "NO_FOOD"."""
-            
-            # Generate response
-            result = model.generate_content([prompt, image_file])
-            
-            # Clean up temp file
-            os.unlink(temp_path)
-            
-            # Process response
-            if result.text.strip() == "NO_FOOD":
-                return None
-            
-            return result.text.strip()
-            
-        except Exception as e:
-            # Clean up temp file if error occurs
-            if os.path.exists(temp_path):
-                os.unlink(temp_path)
-            raise e
-            
+def _analyze_photo_batch(photos: List[Dict], credentials: Credentials, rate_limiter: GeminiRateLimiter,
+                         stats: FoodAnalysisStats) -> List[Tuple[bool, Optional[str]]]:
+    """Worker task: analyze a group of photos in a single request, falling back to one request per photo"""
+    if len(photos) == 1:
+        return [_analyze_photo(photos[0], credentials, rate_limiter, stats)]
+    
+    try:
+        images = []
+        for photo in photos:
+            with telemetry.stage('image_prep'):
+                image = prepare_food_image(photo, credentials)
+            if not image:
+                raise Exception(f"could not download {photo['name']}")
+            images.append(image)
+        
+        handle = rate_limiter.acquire(ESTIMATED_TOKENS_PER_IMAGE * len(images))
+        response = generate_food_batch_response(images)
+        rate_limiter.record(handle, stats.record_response(response))
+        descriptions = parse_food_batch_response(response, len(images))
+        stats.record_analyzed(len(images))
     except Exception as e:
-        print(f"❌ Error analyzing image with Gemini: {e}")
-        return None
+        print(f"⚠️ Batch analysis of {len(photos)} photos failed ({e}), analyzing individually")
+        return [_analyze_photo(photo, credentials, rate_limiter, stats) for photo in photos]
+    
+    for photo, food_description in zip(photos, descriptions):
+        release_photo(photo['id'])
+        store_analysis(photo['id'], photo.get('checksum', ''), FOOD_PROMPT_VERSION, food_description)
+    
+    return [(True, food_description) for food_description in descriptions]
 
-def process_drive_food_photos(date: str) -> Dict[str, List[str]]:
-    """Process all photos from Drive folder for a date and return food descriptions by meal"""
-    photos = get_drive_photos(date)
+def group_photos_for_analysis(meal_photos: List[Tuple[Dict, str]]) -> List[List[Dict]]:
+    """Group photos into Gemini requests according to FOOD_BATCH_MODE"""
+    if FOOD_BATCH_MODE == 'day':
+        groups = [[photo for photo, _ in meal_photos]]
+    elif FOOD_BATCH_MODE == 'meal':
+        by_meal = {}
+        for photo, meal in meal_photos:
+            by_meal.setdefault(meal, []).append(photo)
+        groups = list(by_meal.values())
+    else:
+        groups = [[photo] for photo, _ in meal_photos]
     
-    if not photos:
-        return {'breakfast': [], 'lunch': [], 'dinner': []}
+    # Keep requests a reasonable size
+    batches = []
+    for group in groups:
+        for start in range(0, len(group), FOOD_BATCH_MAX_IMAGES):
+            batches.append(group[start:start + FOOD_BATCH_MAX_IMAGES])
+    return batches
+
+def fetch_hash_image(photo: Dict) -> Optional[bytes]:
+    """Small image for perceptual hashing: a tiny Drive thumbnail, or the in-memory original"""
+    if photo['id'] in _photo_buffers:
+        return _photo_buffers[photo['id']]
     
-    meal_foods = {'breakfast': [], 'lunch': [], 'dinner': []}
+    thumbnail_link = photo.get('thumbnail_link')
+    if not thumbnail_link:
+        return None
     
-    for photo in photos:
+    credentials = get_google_context().credentials
+    small_link = re.sub(r'=s\d+$', '', thumbnail_link) + '=s64'
+    response = get_streamed(small_link, headers={'Authorization': f'Bearer {credentials.token}'})
+    return response.content if response.status_code == 200 else None
+
+def _classify_photos(photos: List[Dict]) -> List[Tuple[Dict, str]]:
+    """Pair each photo with its meal, in the order they were taken"""
+    meal_photos = []
+    for photo in sorted(photos, key=lambda p: p['photo_time'].replace(tzinfo=None)):
         # Get photo timestamp
         photo_time = photo.get('photo_time')
         if not photo_time:
             print(f"⚠️ No timestamp for {photo['name']}, skipping")
+            release_photo(photo['id'])
             continue
         
         # Classify meal time
         meal = classify_meal_time(photo_time)
         if not meal:
             print(f"⚠️ Photo taken outside meal times: {photo_time.strftime('%H:%M')}")
+            release_photo(photo['id'])
             continue
         
-        # Get proper download URL for Gemini analysis
-        file_id = photo['id']
-        download_url = f"https://www.googleapis.com/drive/v3/files/{file_id}?alt=media"
+        meal_photos.append((photo, meal))
+    return meal_photos
+
+def analyze_photos_by_date(photos_by_date: Dict[str, List[Dict]]) -> Tuple[Dict[str, Dict[str, List[str]]], List[str]]:
+    """Analyze the photos of one or more dates with a single worker pool.
+    
+    Returns meal foods per date and the dates whose photos were all analyzed.
+    """
+    credentials = get_google_context().credentials
+    stats = FoodAnalysisStats()
+    meal_photos_by_date = {}
+    with telemetry.stage('photo_dedupe'):
+        for date, photos in photos_by_date.items():
+            # Only one photo per cluster of near-identical shots goes to Gemini
+            meal_photos, duplicates = dedupe_meal_photos(_classify_photos(photos), fetch_hash_image)
+            for photo in duplicates:
+                release_photo(photo['id'])
+            meal_photos_by_date[date] = meal_photos
+    
+    # Reuse previous analyses of the same file content with the same prompt
+    results = {}
+    batches = []
+    for date, meal_photos in meal_photos_by_date.items():
+        pending = []
+        for photo, meal in meal_photos:
+            cache_hit, food_description = get_cached_analysis(photo['id'], photo.get('checksum', ''), FOOD_PROMPT_VERSION)
+            if cache_hit:
+                stats.record_cache_hit()
+                release_photo(photo['id'])
+                results[photo['id']] = (True, food_description)
+            else:
+                pending.append((photo, meal))
         
-        # Analyze image for food content
-        food_description = analyze_food_image(download_url)
+        # Batches never span dates
+        batches.extend(group_photos_for_analysis(pending))
+    
+    # Analyze the rest concurrently (batched per meal/day), within Gemini's per-minute quotas
+    if batches:
+        rate_limiter = GeminiRateLimiter()
+        with telemetry.stage('gemini_analysis'), \
+                ThreadPoolExecutor(max_workers=min(GEMINI_MAX_WORKERS, len(batches))) as executor:
+            outcomes = executor.map(lambda batch: _analyze_photo_batch(batch, credentials, rate_limiter, stats), batches)
+            for batch, batch_outcomes in zip(batches, outcomes):
+                for photo, outcome in zip(batch, batch_outcomes):
+                    results[photo['id']] = outcome
+    
+    # Assemble results in meal order
+    foods_by_date = {}
+    completed_dates = []
+    for date, meal_photos in meal_photos_by_date.items():
+        meal_foods = {'breakfast': [], 'lunch': [], 'dinner': []}
+        all_ok = True
+        date_note = f"{date} " if len(meal_photos_by_date) > 1 else ""
         
-        if food_description:
-            meal_foods[meal].append(food_description)
-            print(f"🍽️ {meal.title()} ({photo_time.strftime('%H:%M')}): {food_description}")
-        else:
-            print(f"⚠️ No food detected in {photo['name']}")
+        for photo, meal in meal_photos:
+            ok, food_description = results[photo['id']]
+            if not ok:
+                all_ok = False
+                continue
+            
+            photo_time = photo['photo_time']
+            if food_description:
+                meal_foods[meal].append(food_description)
+                print(f"🍽️ {date_note}{meal.title()} ({photo_time.strftime('%H:%M')}): {food_description}")
+            else:
+                print(f"⚠️ No food detected in {photo['name']}")
+        
+        foods_by_date[date] = meal_foods
+        if all_ok:
+            completed_dates.append(date)
+    
+    print(f"📊 Food analysis: {stats.summary()}")
+    mark_photos_processed(completed_dates)
+    return foods_by_date, completed_dates
+
+def photo_fingerprint(photos: List[Dict]) -> str:
+    """Identify a date's set of photos (count + hash of ids and checksums)"""
+    content = '\n'.join(sorted(f"{photo['id']}:{photo.get('checksum', '')}" for photo in photos))
+    return f"{len(photos)}:{hashlib.sha256(content.encode()).hexdigest()[:16]}"
+
+def process_drive_food_photos(date: str, refresh_cache: bool = False,
+                              processed_fingerprints: Optional[Dict[str, str]] = None) -> Optional[Dict]:
+    """Process all photos from Drive folder for a date and return food descriptions by meal.
+    
+    The result also carries the date's photo 'fingerprint' once every photo was analyzed
+    (so failed photos are retried). If `processed_fingerprints` (from Notion) shows the
+    date was already processed with the same photos, returns None. Raises if Drive can't
+    be read, so nothing is written for the date.
+    """
+    if refresh_cache:
+        removed = invalidate_food_cache()
+        print(f"🗑️ Cleared {removed} cached food analyses")
+    
+    photos = get_drive_photos(date)
+    fingerprint = photo_fingerprint(photos)
     
+    if processed_fingerprints and processed_fingerprints.get(date) == fingerprint:
+        print(f"⏭️ Food photos for {date} already processed ({len(photos)} photos, none new), skipping")
+        for photo in photos:
+            release_photo(photo['id'])
+        return None
+    
+    if not photos:
+        return {'breakfast': [], 'lunch': [], 'dinner': [], 'fingerprint': fingerprint}
+    
+    foods_by_date, completed_dates = analyze_photos_by_date({date: photos})
+    meal_foods = foods_by_date[date]
+    if date in completed_dates:
+        meal_foods['fingerprint'] = fingerprint
     return meal_foods
 
+def process_drive_food_photos_range(start_date: str, end_date: str, refresh_cache: bool = False,
+                                    processed_fingerprints: Optional[Dict[str, str]] = None) -> Dict[str, Optional[Dict]]:
+    """Process food photos for every date in a range with one folder pass; returns meal foods per date.
+    
+    Dates already processed with the same photos (per `processed_fingerprints`) map to None.
+    """
+    if refresh_cache:
+        removed = invalidate_food_cache()
+        print(f"🗑️ Cleared {removed} cached food analyses")
+    
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    dates = [(start + timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range((end - start).days + 1)]
+    
+    try:
+        return process_drive_food_photos_dates(dates, processed_fingerprints)
+    except Exception as e:
+        print(f"❌ Error retrieving Drive photos: {e}")
+        return {date: None for date in dates}
+
+def process_drive_food_photos_dates(dates: List[str],
+                                    processed_fingerprints: Optional[Dict[str, str]] = None) -> Dict[str, Optional[Dict]]:
+    """Process food photos for any set of dates with one Drive pass and shared Gemini batches.
+    
+    Dates already processed with the same photos map to None. Raises if Drive can't be read.
+    """
+    # One listing / changes pass, then bucket photos by capture date
+    index = PhotoTimestampIndex.load()
+    files = sync_photo_index(index, set(dates))
+    index.save()
+    
+    results = {}
+    photos_by_date = {}
+    for date in dates:
+        photos = photos_for_date(files, index, date)
+        fingerprint = photo_fingerprint(photos)
+        
+        if processed_fingerprints and processed_fingerprints.get(date) == fingerprint:
+            results[date] = None
+            for photo in photos:
+                release_photo(photo['id'])
+            continue
+        
+        results[date] = {'breakfast': [], 'lunch': [], 'dinner': [], 'fingerprint': fingerprint}
+        if photos:
+            photos_by_date[date] = photos
+    
+    skipped = sum(1 for result in results.values() if result is None)
+    print(f"📅 Found {sum(len(p) for p in photos_by_date.values())} photos to process on {len(photos_by_date)} of {len(dates)} dates"
+          f" ({skipped} already processed)")
+    
+    if photos_by_date:
+        foods_by_date, completed_dates = analyze_photos_by_date(photos_by_date)
+        for date, meal_foods in foods_by_date.items():
+            results[date].update(meal_foods)
+            # Without a fingerprint the date is analyzed again next time, retrying the failed photos
+            if date not in completed_dates:
+                del results[date]['fingerprint']
+    return results
+
 def format_meal_text(food_items: List[str]) -> str:
     """Format list of food descriptions into readable text"""
     if not food_items:
@@ -360,14 +1001,19 @@ def format_meal_text(food_items: List[str]) -> str:
 
 if __name__ == "__main__":
     # Test the integration
+    import sys
     from datetime import datetime, timedelta
     
     test_date = datetime.now().strftime('%Y-%m-%d')
     print(f"🧪 Testing Drive food photo processing for {test_date}")
     
     meal_data = process_drive_food_photos(test_date)
+    if meal_data is None:
+        print("⏭️ Nothing to process")
+        sys.exit(0)
     
-    for meal, foods in meal_data.items():
+    for meal in ('breakfast', 'lunch', 'dinner'):
+        foods = meal_data.get(meal)
         if foods:
             print(f"{meal.title()}: {format_meal_text(foods)}")
         else:
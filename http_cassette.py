@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Record/replay of HTTP traffic ("cassettes") for offline, repeatable runs
+Recording captures every exchange made through requests (Fitbit, Drive downloads,
+Gemini REST, token refreshes), httpx (Notion) and httplib2 (Drive API) into a
+cassette directory with credentials redacted. Replaying serves those responses
+with their recorded timings, without touching the network.
+
+Cassette layout:
+    <dir>/cassette.json      interactions (request key, status, headers, timing)
+    <dir>/bodies/<sha256>    response bodies, stored once per distinct content
+    <dir>/state/             snapshot of SYNC_STATE_DIR taken before the recorded run;
+                             replays start from a copy of it so they issue the same requests
+"""
+
+import atexit
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+from state_store import get_state_dir
+
+CASSETTE_VERSION = 1
+REDACTED = 'REDACTED'
+
+# Request headers and query/form/JSON fields that carry credentials
+SENSITIVE_HEADERS = {'authorization', 'cookie', 'x-goog-api-key', 'proxy-authorization'}
+SENSITIVE_FIELDS = {'key', 'access_token', 'refresh_token', 'id_token', 'client_secret', 'client_id', 'code',
+                    'code_verifier', 'api_key', 'password'}
+# Response headers that no longer describe the stored (decoded) body, or that leak session state
+DROPPED_RESPONSE_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'set-cookie', 'connection'}
+
+class CassetteMiss(Exception):
+    """Replay found no recorded response for a request"""
+
+_cassette = None
+_started = time.monotonic()
+
+def _redact_query(query: str) -> str:
+    pairs = [(name, REDACTED if name.lower() in SENSITIVE_FIELDS else value)
+             for name, value in parse_qsl(query, keep_blank_values=True)]
+    return urlencode(pairs)
+
+def redact_url(url: str) -> str:
+    parsed = urlparse(str(url))
+    return urlunparse(parsed._replace(query=_redact_query(parsed.query)))
+
+def _redact_json(value):
+    if isinstance(value, dict):
+        return {key: REDACTED if key.lower() in SENSITIVE_FIELDS else _redact_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_redact_json(item) for item in value]
+    return value
+
+def redact_body(body: bytes, content_type: str = '') -> bytes:
+    """Blank out credentials in a JSON or form-encoded body"""
+    if not body:
+        return b''
+    try:
+        text = body.decode('utf-8')
+    except UnicodeDecodeError:
+        return body
+    
+    stripped = text.lstrip()
+    if stripped.startswith('{') or stripped.startswith('['):
+        try:
+            return json.dumps(_redact_json(json.loads(text)), sort_keys=True).encode()
+        except ValueError:
+            return body
+    if 'x-www-form-urlencoded' in content_type or re.fullmatch(r'[\w.%~+-]+=[^&]*(&[\w.%~+-]+=[^&]*)*', text):
+        return _redact_query(text).encode()
+    return body
+
+def redact_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    return {name: REDACTED if name.lower() in SENSITIVE_HEADERS else value for name, value in headers.items()}
+
+def _as_bytes(body) -> bytes:
+    if body is None:
+        return b''
+    if isinstance(body, str):
+        return body.encode()
+    if isinstance(body, (bytes, bytearray)):
+        return bytes(body)
+    return b''  # streamed/generator bodies aren't used by these scripts
+
+def request_key(method: str, url: str, headers: Dict[str, str], body) -> str:
+    """Identify a request independently of credentials: method, redacted URL, Range and redacted body"""
+    lowered = {name.lower(): value for name, value in (headers or {}).items()}
+    redacted_body = redact_body(_as_bytes(body), lowered.get('content-type', ''))
+    body_hash = hashlib.sha256(redacted_body).hexdigest()[:16] if redacted_body else '-'
+    return f"{method.upper()} {redact_url(url)} range={lowered.get('range', '-')} body={body_hash}"
+
+class Cassette:
+    """A directory of recorded interactions, opened for recording or replay"""
+    
+    def __init__(self, path: str, mode: str, speed: float = 1.0):
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.interactions = []
+        self.metadata = {}
+        self.misses = 0
+        self._queues = defaultdict(deque)
+        self._last = {}
+        self._lock = threading.Lock()
+        
+        if mode == 'replay':
+            with open(os.path.join(path, 'cassette.json')) as f:
+                data = json.load(f)
+            self.metadata = data.get('metadata', {})
+            for interaction in data['interactions']:
+                self._queues[interaction['key']].append(interaction)
+        else:
+            os.makedirs(os.path.join(path, 'bodies'), exist_ok=True)
+            self.metadata = {
+                'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                'today': datetime.now().strftime('%Y-%m-%d')
+            }
+    
+    def _body_path(self, digest: str) -> str:
+        return os.path.join(self.path, 'bodies', digest)
+    
+    def record(self, client: str, method: str, url: str, request_headers: Dict, request_body,
+               status: int, response_headers: Dict, response_body: bytes, elapsed: float):
+        lowered = {name.lower(): value for name, value in response_headers.items()}
+        is_token_response = 'token' in urlparse(str(url)).path
+        if is_token_response:
+            response_body = redact_body(response_body, lowered.get('content-type', ''))
+        
+        digest = hashlib.sha256(response_body).hexdigest()
+        if not os.path.exists(self._body_path(digest)):
+            with open(self._body_path(digest), 'wb') as f:
+                f.write(response_body)
+        
+        interaction = {
+            'key': request_key(method, url, request_headers, request_body),
+            'client': client,
+            'request': {'method': method.upper(), 'url': redact_url(url), 'headers': redact_headers(dict(request_headers or {}))},
+            'response': {
+                'status': status,
+                'headers': {name: value for name, value in response_headers.items()
+                            if name.lower() not in DROPPED_RESPONSE_HEADERS},
+                'body': digest
+            },
+            'elapsed': round(elapsed, 4),
+            'offset': round(time.monotonic() - _started, 4)
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+    
+    def replay(self, method: str, url: str, request_headers: Dict, request_body) -> Tuple[int, Dict, bytes]:
+        """Next recorded response for this request (repeats the last one if the recording ran out)"""
+        key = request_key(method, url, request_headers, request_body)
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                interaction = queue.popleft()
+                self._last[key] = interaction
+            else:
+                interaction = self._last.get(key)
+            if interaction is None:
+                self.misses += 1
+        
+        if interaction is None:
+            raise CassetteMiss(f"No recorded response for {key}")
+        
+        if self.speed > 0:
+            time.sleep(interaction['elapsed'] / self.speed)
+        
+        with open(self._body_path(interaction['response']['body']), 'rb') as f:
+            body = f.read()
+        return interaction['response']['status'], dict(interaction['response']['headers']), body
+    
+    def save(self):
+        if self.mode != 'record':
+            return
+        with self._lock:
+            data = {
+                'version': CASSETTE_VERSION,
+                'metadata': self.metadata,
+                'interactions': list(self.interactions)
+            }
+        with open(os.path.join(self.path, 'cassette.json'), 'w') as f:
+            json.dump(data, f, indent=1)
+        print(f"📼 Recorded {len(data['interactions'])} HTTP exchanges to {self.path}")
+
+def _patch_requests(cassette: Cassette):
+    import requests
+    from requests.adapters import HTTPAdapter
+    from requests.structures import CaseInsensitiveDict
+    from requests.utils import get_encoding_from_headers
+    
+    original_send = HTTPAdapter.send
+    
+    def send(self, request, **kwargs):
+        if cassette.mode == 'record':
+            started = time.monotonic()
+            response = original_send(self, request, **kwargs)
+            body = response.content  # reads streamed bodies too; iter_content then serves from memory
+            cassette.record('requests', request.method, request.url, dict(request.headers), request.body,
+                            response.status_code, dict(response.headers), body, time.monotonic() - started)
+            return response
+        
+        try:
+            status, headers, body = cassette.replay(request.method, request.url, dict(request.headers), request.body)
+        except CassetteMiss as e:
+            raise requests.exceptions.ConnectionError(str(e), request=request)
+        
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = io.BytesIO(body)
+        response._content = body
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.reason = 'Replayed'
+        response.elapsed = timedelta(0)
+        return response
+    
+    HTTPAdapter.send = send
+
+def _patch_httpx(cassette: Cassette):
+    try:
+        import httpx
+    except ImportError:
+        return
+    
+    original_handle = httpx.HTTPTransport.handle_request
+    
+    def handle_request(self, request):
+        body = request.read()
+        if cassette.mode == 'record':
+            started = time.monotonic()
+            response = original_handle(self, request)
+            content = response.read()
+            cassette.record('httpx', request.method, str(request.url), dict(request.headers), body,
+                            response.status_code, dict(response.headers), content, time.monotonic() - started)
+            return response
+        
+        try:
+            status, headers, content = cassette.replay(request.method, str(request.url), dict(request.headers), body)
+        except CassetteMiss as e:
+            raise httpx.ConnectError(str(e), request=request)
+        return httpx.Response(status, headers=headers, content=content, request=request)
+    
+    httpx.HTTPTransport.handle_request = handle_request
+
+def _patch_httplib2(cassette: Cassette):
+    try:
+        import httplib2
+    except ImportError:
+        return
+    
+    original_request = httplib2.Http.request
+    
+    def request(self, uri, method='GET', body=None, headers=None, *args, **kwargs):
+        if cassette.mode == 'record':
+            started = time.monotonic()
+            response, content = original_request(self, uri, method, body, headers, *args, **kwargs)
+            response_headers = {name: value for name, value in dict(response).items()
+                                if name != 'status' and not name.startswith('-')}
+            cassette.record('httplib2', method, uri, dict(headers or {}), body,
+                            response.status, response_headers, content, time.monotonic() - started)
+            return response, content
+        
+        try:
+            status, response_headers, content = cassette.replay(method, uri, dict(headers or {}), body)
+        except CassetteMiss as e:
+            raise httplib2.HttpLib2Error(str(e))
+        response = httplib2.Response(dict(response_headers, status=str(status)))
+        return response, content
+    
+    httplib2.Http.request = request
+
+def install(path: str, mode: str, speed: Optional[float] = None) -> Cassette:
+    """Start recording to / replaying from a cassette directory (once per process)"""
+    global _cassette
+    if _cassette is not None:
+        return _cassette
+    
+    if speed is None:
+        speed = float(os.getenv('HTTP_CASSETTE_SPEED', '1'))
+    cassette = Cassette(path, mode, speed)
+    
+    # Gemini's default gRPC transport can't be captured; use its REST transport instead
+    os.environ.setdefault('GEMINI_TRANSPORT', 'rest')
+    snapshot = os.path.join(path, 'state')
+    if mode == 'replay':
+        # Replayed runs pretend to run on the recording's date, from the recording's local state,
+        # so they issue the same requests (the real state directory is left untouched)
+        if cassette.metadata.get('today'):
+            os.environ.setdefault('SYNC_TODAY', cassette.metadata['today'])
+        replay_state = tempfile.mkdtemp(prefix='cassette-state-')
+        if os.path.isdir(snapshot):
+            shutil.copytree(snapshot, replay_state, dirs_exist_ok=True)
+        os.environ['SYNC_STATE_DIR'] = replay_state
+        atexit.register(shutil.rmtree, replay_state, True)
+        print(f"📼 Replaying HTTP from {path} (recorded {cassette.metadata.get('recorded_at', '?')})")
+    else:
+        shutil.rmtree(snapshot, ignore_errors=True)
+        shutil.copytree(get_state_dir(), snapshot)
+        atexit.register(cassette.save)
+        print(f"📼 Recording HTTP to {path}")
+    
+    _patch_requests(cassette)
+    _patch_httpx(cassette)
+    _patch_httplib2(cassette)
+    _cassette = cassette
+    return cassette
+
+def replaying() -> bool:
+    """True while responses come from a cassette (refreshed tokens in it are redacted placeholders)"""
+    return _cassette is not None and _cassette.mode == 'replay'
+
+def add_arguments(parser):
+    """--record-http / --replay-http options shared by the entry points"""
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument('--record-http', metavar='DIR', help='Record all HTTP exchanges (credentials redacted) to a cassette directory')
+    group.add_argument('--replay-http', metavar='DIR', help='Serve HTTP from a recorded cassette instead of the network')
+
+def install_from_args(args=None) -> Optional[Cassette]:
+    """Install a cassette from --record-http/--replay-http, or HTTP_CASSETTE_RECORD/HTTP_CASSETTE_REPLAY"""
+    record = getattr(args, 'record_http', None) or os.getenv('HTTP_CASSETTE_RECORD')
+    replay = getattr(args, 'replay_http', None) or os.getenv('HTTP_CASSETTE_REPLAY')
+    if record:
+        return install(record, 'record')
+    if replay:
+        return install(replay, 'replay')
+    return None
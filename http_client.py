@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP clients for a run
+One pooled requests.Session (Fitbit, Drive downloads, token refreshes) and one
+Notion client, both instrumented so every outbound call lands in the run report
+"""
+
+import io
+import os
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlparse
+import requests
+import telemetry
+
+# Host fragments used to attribute calls to a service in the run report
+SERVICE_HOSTS = [
+    ('api.fitbit.com', 'fitbit'),
+    ('api.notion.com', 'notion'),
+    ('oauth2.googleapis.com', 'google_oauth'),
+    ('generativelanguage.googleapis.com', 'gemini'),
+    ('googleapis.com', 'drive'),
+    ('googleusercontent.com', 'drive'),
+]
+
+# Endpoint overrides (e.g. local mock servers) are attributed to the service they stand in for
+for _env, _service in (('FITBIT_API_BASE_URL', 'fitbit'), ('NOTION_BASE_URL', 'notion'),
+                       ('DRIVE_API_ENDPOINT', 'drive'), ('GEMINI_API_ENDPOINT', 'gemini')):
+    if os.getenv(_env):
+        SERVICE_HOSTS.insert(0, (urlparse(os.getenv(_env)).netloc or os.getenv(_env), _service))
+
+# Most response-body bytes being read at once across all threads (0 = unlimited).
+# Streaming downloads wait for room instead of every worker holding a
+# multi-megabyte body at the same time, which keeps peak memory flat.
+HTTP_MAX_INFLIGHT_BYTES = int(os.getenv('HTTP_MAX_INFLIGHT_BYTES', str(16 * 1024 * 1024)))
+STREAM_CHUNK_BYTES = 64 * 1024
+# Reserved for bodies that don't declare a Content-Length (e.g. chunked JSON)
+UNKNOWN_LENGTH_BYTES = 1024 * 1024
+
+_session = None
+_notion_client = None
+
+def register_service_host(host: str, service: str):
+    """Attribute calls to an extra host (e.g. a local fake server) to a service"""
+    SERVICE_HOSTS.insert(0, (host, service))
+
+def classify_url(url: str) -> str:
+    netloc = urlparse(str(url)).netloc
+    for fragment, service in SERVICE_HOSTS:
+        if fragment in netloc:
+            return service
+    return netloc or 'other'
+
+def _record_fitbit_rate_limit(headers):
+    remaining = headers.get('fitbit-rate-limit-remaining')
+    if remaining is not None:
+        telemetry.record_rate_limit(
+            'fitbit',
+            int(remaining),
+            limit=int(headers.get('fitbit-rate-limit-limit', 0)) or None,
+            reset_seconds=int(headers.get('fitbit-rate-limit-reset', 0)) or None
+        )
+
+class InstrumentedSession(requests.Session):
+    """requests.Session that reports latency, status and bytes of every call"""
+    
+    def send(self, request, **kwargs):
+        service = classify_url(request.url)
+        body = request.body or b''
+        bytes_out = len(body) if isinstance(body, (bytes, str)) else 0
+        started = time.monotonic()
+        
+        try:
+            response = super().send(request, **kwargs)
+        except requests.exceptions.RequestException:
+            telemetry.record_call(service, 'error', time.monotonic() - started, bytes_out=bytes_out)
+            raise
+        
+        if kwargs.get('stream'):
+            # Body not read yet - rely on the declared length
+            bytes_in = int(response.headers.get('Content-Length', 0) or 0)
+        else:
+            bytes_in = len(response.content)
+        
+        telemetry.record_call(service, response.status_code, time.monotonic() - started, bytes_in, bytes_out)
+        if service == 'fitbit':
+            _record_fitbit_rate_limit(response.headers)
+        return response
+
+class ByteBudget:
+    """Counting semaphore over bytes, shared by every streaming read of the run.
+    
+    A reservation larger than the whole budget is admitted once nothing else is
+    in flight, so one oversized file is slowed down but never blocked forever.
+    """
+    
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+    
+    def acquire(self, size: int) -> int:
+        """Block until `size` bytes fit in the budget; returns the amount to release"""
+        if self.limit <= 0:
+            return 0
+        size = min(size, self.limit)
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_use == 0 or self.in_use + size <= self.limit)
+            self.in_use += size
+            self.peak = max(self.peak, self.in_use)
+        return size
+    
+    def release(self, size: int):
+        if not size:
+            return
+        with self._condition:
+            self.in_use -= size
+            self._condition.notify_all()
+
+_byte_budget = ByteBudget(HTTP_MAX_INFLIGHT_BYTES)
+
+def get_byte_budget() -> ByteBudget:
+    return _byte_budget
+
+def read_body(response: requests.Response, max_bytes: Optional[int] = None) -> bytes:
+    """Read a stream=True response in chunks under the in-flight byte budget, then close it.
+    
+    With `max_bytes` only that many bytes are read and the rest of the body is
+    never downloaded (e.g. a server ignoring a Range header).
+    """
+    declared = int(response.headers.get('Content-Length', 0) or 0) or UNKNOWN_LENGTH_BYTES
+    reserved = _byte_budget.acquire(min(declared, max_bytes) if max_bytes else declared)
+    try:
+        buffer = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=STREAM_CHUNK_BYTES):
+            buffer.write(chunk)
+            if max_bytes and buffer.tell() >= max_bytes:
+                buffer.truncate(max_bytes)
+                break
+        return buffer.getvalue()
+    finally:
+        response.close()
+        _byte_budget.release(reserved)
+
+def get_streamed(url: str, **kwargs) -> requests.Response:
+    """GET on the shared session with the body read through read_body.
+    
+    The returned response behaves like a normal one (.content, .text, .json()).
+    """
+    response = get_session().get(url, stream=True, **kwargs)
+    # Hand the body to requests as if it had read it itself
+    response._content = read_body(response)
+    response._content_consumed = True
+    return response
+
+def get_session() -> requests.Session:
+    """Pooled, instrumented session shared by the whole run"""
+    global _session
+    if _session is None:
+        _session = InstrumentedSession()
+    return _session
+
+def get_notion_client(auth: Optional[str] = None):
+    """Notion client whose HTTP transport reports to the run telemetry (created once per run)"""
+    global _notion_client
+    if _notion_client is None:
+        import httpx
+        from notion_client import Client
+        
+        class InstrumentedTransport(httpx.HTTPTransport):
+            def handle_request(self, request):
+                started = time.monotonic()
+                try:
+                    response = super().handle_request(request)
+                    response.read()
+                except httpx.HTTPError:
+                    telemetry.record_call('notion', 'error', time.monotonic() - started)
+                    raise
+                telemetry.record_call(
+                    'notion', response.status_code, time.monotonic() - started,
+                    len(response.content), len(request.content or b'')
+                )
+                return response
+        
+        _notion_client = Client(
+            auth=auth or os.getenv('NOTION_TOKEN'),
+            client=httpx.Client(transport=InstrumentedTransport()),
+            base_url=os.getenv('NOTION_BASE_URL', 'https://api.notion.com')
+        )
+    return _notion_client
@@ -3,76 +3,51 @@
 Manual sync for today's date (including your latte photo!)
 """
 
-import os
-import sys
-from datetime import datetime
-from google_drive_food import process_drive_food_photos, format_meal_text
-from sync_fitbit_notion import get_fitbit_data, update_notion_database
+import argparse
+from sync_fitbit_notion import daily_sync_stages, get_today
+from pipeline import Pipeline
+import http_cassette
+import profiling
+import telemetry
 
-def manual_sync_today():
-    """Manual sync for today's date"""
-    today = datetime.now().strftime('%Y-%m-%d')
+def manual_sync_today(refresh_food_cache=False, force_food=False, date=None, skip_food=False):
+    """Manual sync for today's date (or `date`)"""
+    today = date or get_today().strftime('%Y-%m-%d')
     
-    print(f"🔄 Starting MANUAL sync for TODAY: {today}")
+    print(f"🔄 Starting MANUAL sync for: {today}")
     print(f"🎯 This will include your breakfast latte photo!")
     print()
     
-    # Get Fitbit data for today
-    print("📊 Fetching Fitbit data for today...")
-    try:
-        fitbit_data = get_fitbit_data(today)
-        if fitbit_data:
-            print("✅ Fitbit data fetched:")
-            for key, value in fitbit_data.items():
-                if value is not None and value != 0:
-                    print(f"  {key}: {value}")
-        else:
-            print("⚠️ No Fitbit data available for today")
-            fitbit_data = {}
-    except Exception as e:
-        print(f"⚠️ Error fetching Fitbit data: {e}")
-        print("  (This is normal if today's data isn't complete yet)")
-        fitbit_data = {}
-    
-    print()
-    
-    # Get food data from Drive
-    print("🍽️ Processing food photos from Drive...")
-    try:
-        food_data = process_drive_food_photos(today)
-        
-        food_found = any(food_data.values())
-        if food_found:
-            print("✅ Food data processed:")
-            for meal, foods in food_data.items():
-                if foods:
-                    print(f"  {meal.title()}: {format_meal_text(foods)}")
-        else:
-            print("  No food photos found for today")
-            
-    except Exception as e:
-        print(f"❌ Error processing food photos: {e}")
-        food_data = None
-    
-    print()
-    
-    # Update Notion
-    print("📝 Updating Notion database...")
-    try:
-        update_notion_database(today, fitbit_data, food_data)
-        print("✅ Notion database updated successfully!")
-        print()
-        print("🎉 Manual sync completed!")
-        print("📱 Check your Notion database to see the results!")
-        
-    except Exception as e:
-        print(f"❌ Error updating Notion: {e}")
+    # Today's Fitbit data may not be complete yet; a failed fetch still writes the food
+    stages = daily_sync_stages(refresh_food_cache, force_food, skip_food)
+    [item] = Pipeline('manual_sync', stages).run([today])
+    if item.failed:
         return False
     
+    print()
+    print("🎉 Manual sync completed!")
+    print("📱 Check your Notion database to see the results!")
     return True
 
 if __name__ == "__main__":
-    success = manual_sync_today()
+    parser = argparse.ArgumentParser(description='Manual sync for today\'s date')
+    parser.add_argument('--date', '-d', type=str, help='Date to sync (YYYY-MM-DD, default: today)')
+    parser.add_argument('--skip-food', action='store_true', help='Only sync Fitbit data')
+    parser.add_argument('--refresh-food-cache', action='store_true', help='Discard cached food analyses (e.g. after changing the prompt)')
+    parser.add_argument('--force-food', action='store_true', help='Re-process food photos even if Notion marks today as processed')
+    http_cassette.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    http_cassette.install_from_args(args)
+    profiling.enable_from_args(args)
+    
+    telemetry.start_run('manual_sync_today')
+    success = False
+    try:
+        success = manual_sync_today(refresh_food_cache=args.refresh_food_cache, force_food=args.force_food,
+                                    date=args.date, skip_food=args.skip_food)
+    finally:
+        telemetry.finish_run('ok' if success else 'error')
     if success:
         print("\n🚀 Your latte should now appear in your Notion health database!")
     else:
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection for food photos
+Clusters photos of the same meal taken within a few minutes whose perceptual
+hashes (dHash) are close, so only one representative per plate is analyzed
+"""
+
+import io
+import os
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+PHOTO_DEDUPE = os.getenv('PHOTO_DEDUPE', 'true').lower() == 'true'
+DEDUPE_WINDOW_MINUTES = int(os.getenv('DEDUPE_WINDOW_MINUTES', '5'))
+# Max differing bits (out of 64) for two photos to count as the same shot
+DEDUPE_MAX_DISTANCE = int(os.getenv('DEDUPE_MAX_DISTANCE', '8'))
+
+def dhash(image_bytes: bytes, hash_size: int = 8) -> int:
+    """Difference hash: compares neighbouring pixels of a tiny greyscale version of the image"""
+    from PIL import Image
+    
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft('L', (hash_size * 8, hash_size * 8))
+    image = image.convert('L').resize((hash_size + 1, hash_size), Image.LANCZOS)
+    pixels = list(image.getdata())
+    
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+def dedupe_meal_photos(meal_photos: List[Tuple[Dict, str]],
+                       fetch_hash_image: Callable[[Dict], Optional[bytes]]) -> Tuple[List[Tuple[Dict, str]], List[Dict]]:
+    """Keep one representative per cluster of near-identical photos.
+    
+    `meal_photos` must be in capture order. `fetch_hash_image` returns small image
+    bytes for hashing (or None if unavailable). Hashes are only computed for photos
+    that have another photo of the same meal within the time window.
+    Returns (kept_meal_photos, skipped_photos).
+    """
+    if not PHOTO_DEDUPE or len(meal_photos) < 2:
+        return meal_photos, []
+    
+    window = timedelta(minutes=DEDUPE_WINDOW_MINUTES)
+    hashes: Dict[str, Optional[int]] = {}
+    
+    def photo_hash(photo: Dict) -> Optional[int]:
+        if photo['id'] not in hashes:
+            try:
+                image_bytes = fetch_hash_image(photo)
+                hashes[photo['id']] = dhash(image_bytes) if image_bytes else None
+            except Exception as e:
+                print(f"  ⚠️ Could not hash {photo['name']}: {e}")
+                hashes[photo['id']] = None
+        return hashes[photo['id']]
+    
+    clusters = []  # [representative, meal, last_time]
+    kept = []
+    skipped = []
+    
+    for photo, meal in meal_photos:
+        photo_time = photo['photo_time'].replace(tzinfo=None)
+        duplicate_of = None
+        
+        for cluster in clusters:
+            representative, cluster_meal, last_time = cluster
+            if cluster_meal != meal or photo_time - last_time > window:
+                continue
+            
+            representative_hash = photo_hash(representative)
+            candidate_hash = photo_hash(photo)
+            if representative_hash is None or candidate_hash is None:
+                continue
+            
+            if hamming_distance(representative_hash, candidate_hash) <= DEDUPE_MAX_DISTANCE:
+                duplicate_of = cluster
+                break
+        
+        if duplicate_of:
+            duplicate_of[2] = photo_time
+            skipped.append(photo)
+            print(f"🔁 {photo['name']} looks like a repeat of {duplicate_of[0]['name']}, skipping")
+        else:
+            clusters.append([photo, meal, photo_time])
+            kept.append((photo, meal))
+    
+    return kept, skipped
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Persistent index of resolved photo capture times
+Maps Drive file id + modifiedTime to the capture timestamp and where it came from
+(metadata, EXIF, filename or upload time), with per-date buckets for fast lookups
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+from state_store import load_json_state, save_json_state
+
+INDEX_FILE = 'photo_timestamp_index.json'
+
+class PhotoTimestampIndex:
+    """Capture times for every photo seen in the Drive folder"""
+    
+    def __init__(self, entries: Optional[Dict[str, Dict]] = None):
+        self.entries = entries or {}
+        self.by_date: Dict[str, List[str]] = {}
+        for file_id, entry in self.entries.items():
+            if entry.get('date'):
+                self.by_date.setdefault(entry['date'], []).append(file_id)
+    
+    @classmethod
+    def load(cls) -> 'PhotoTimestampIndex':
+        data = load_json_state(INDEX_FILE, {})
+        return cls(data.get('entries', {}))
+    
+    def save(self):
+        save_json_state(INDEX_FILE, {'entries': self.entries})
+    
+    def lookup(self, file_id: str, modified_time: Optional[str]) -> Optional[Dict]:
+        """Entry for this exact version of the file, or None if it needs resolving"""
+        entry = self.entries.get(file_id)
+        if entry is None or entry.get('modified_time') != modified_time:
+            return None
+        return entry
+    
+    def update(self, file_id: str, modified_time: Optional[str], photo_time: Optional[datetime], source: Optional[str]):
+        """Record the resolved capture time (None if it could not be determined)"""
+        self.remove(file_id)
+        date = photo_time.strftime('%Y-%m-%d') if photo_time else None
+        self.entries[file_id] = {
+            'modified_time': modified_time,
+            'photo_time': photo_time.isoformat() if photo_time else None,
+            'source': source,
+            'date': date
+        }
+        if date:
+            self.by_date.setdefault(date, []).append(file_id)
+    
+    def remove(self, file_id: str):
+        entry = self.entries.pop(file_id, None)
+        if entry and entry.get('date') in self.by_date:
+            bucket = self.by_date[entry['date']]
+            if file_id in bucket:
+                bucket.remove(file_id)
+    
+    def file_ids_on(self, date: str) -> List[str]:
+        """Ids of photos taken on a date (YYYY-MM-DD)"""
+        return list(self.by_date.get(date, []))
+    
+    def photo_time(self, file_id: str) -> Optional[datetime]:
+        entry = self.entries.get(file_id)
+        if not entry or not entry.get('photo_time'):
+            return None
+        return datetime.fromisoformat(entry['photo_time'])
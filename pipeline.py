@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Staged pipeline engine shared by the sync, backfill and manual-sync entry points
+Work items (one per date) flow through named stages joined by bounded queues, so
+day N+1's Fitbit fetch overlaps day N's Notion write. A full queue blocks the stage
+feeding it (back-pressure) and every stage runs its own number of worker threads.
+Worker counts can be overridden per stage with PIPELINE_WORKERS, e.g.
+"fitbit_fetch=1,notion_write=2".
+"""
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+import telemetry
+
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', '2'))
+
+_DONE = object()
+
+def stage_workers(name: str, default: int = 1) -> int:
+    """Worker count for a stage: PIPELINE_WORKERS override, else the entry point's default"""
+    for setting in os.getenv('PIPELINE_WORKERS', '').split(','):
+        stage_name, _, value = setting.partition('=')
+        if stage_name.strip() == name and value.strip():
+            return max(1, int(value))
+    return default
+
+class WorkItem:
+    """One date moving through the pipeline; stage results are kept by stage name"""
+    
+    def __init__(self, index: int, date: str):
+        self.index = index
+        self.date = date
+        self.values: Dict[str, Any] = {}
+        self.errors: Dict[str, str] = {}
+        self.failed = False
+    
+    def get(self, stage_name: str, default: Any = None) -> Any:
+        return self.values.get(stage_name, default)
+
+class Stage:
+    """A named step: `func(item)` returns the stage's value for the item.
+    
+    An exception is recorded on the item. If the stage is `required`, later stages
+    skip the item; otherwise they still run (e.g. write whatever data there is).
+    """
+    
+    def __init__(self, name: str, func: Callable[[WorkItem], Any], workers: int = 1,
+                 required: bool = True, queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.name = name
+        self.func = func
+        self.workers = stage_workers(name, workers)
+        self.required = required
+        self.queue_size = queue_size
+    
+    def process(self, item: WorkItem):
+        if item.failed:
+            return
+        try:
+            with telemetry.stage(self.name):
+                item.values[self.name] = self.func(item)
+        except Exception as e:
+            item.errors[self.name] = str(e)
+            print(f"❌ {self.name} failed for {item.date}: {e}")
+            if self.required:
+                item.failed = True
+
+class ParallelStage(Stage):
+    """Independent stages run on the same item at the same time; the item moves on once all are done.
+    
+    Each branch keeps its own `required` flag, so a failing optional branch leaves
+    the other branches' values for the next stage.
+    """
+    
+    def __init__(self, stages: List[Stage], workers: int = 1, queue_size: int = PIPELINE_QUEUE_SIZE):
+        name = '+'.join(stage.name for stage in stages)
+        super().__init__(name, None, workers=workers, required=False, queue_size=queue_size)
+        self.branches = stages
+    
+    def process(self, item: WorkItem):
+        if item.failed:
+            return
+        with ThreadPoolExecutor(max_workers=len(self.branches) - 1 or 1, thread_name_prefix=self.name) as executor:
+            futures = [executor.submit(branch.process, item) for branch in self.branches[1:]]
+            self.branches[0].process(item)
+            for future in futures:
+                future.result()
+
+class Pipeline:
+    """Runs items through stages concurrently, one thread pool per stage"""
+    
+    def __init__(self, name: str, stages: List[Stage]):
+        self.name = name
+        self.stages = stages
+    
+    def run(self, dates: List[str]) -> List[WorkItem]:
+        """Process every date; returns the items in input order"""
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        finished: List[WorkItem] = []
+        finished_lock = threading.Lock()
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+        
+        def work(position: int):
+            stage = self.stages[position]
+            downstream: Optional[queue.Queue] = queues[position + 1] if position + 1 < len(self.stages) else None
+            while True:
+                item = queues[position].get()
+                if item is _DONE:
+                    break
+                stage.process(item)
+                if downstream is not None:
+                    downstream.put(item)  # blocks while the next stage is behind
+                else:
+                    with finished_lock:
+                        finished.append(item)
+            
+            # The last worker of a stage tells every worker of the next one to stop
+            with remaining_lock:
+                remaining[position] -= 1
+                last = remaining[position] == 0
+            if last and downstream is not None:
+                for _ in range(self.stages[position + 1].workers):
+                    downstream.put(_DONE)
+        
+        threads = [
+            threading.Thread(target=work, args=(position,), name=f"{self.name}-{stage.name}-{worker}", daemon=True)
+            for position, stage in enumerate(self.stages)
+            for worker in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        
+        for index, date in enumerate(dates):
+            queues[0].put(WorkItem(index, date))
+        for _ in range(self.stages[0].workers):
+            queues[0].put(_DONE)
+        
+        for thread in threads:
+            thread.join()
+        
+        telemetry.increment(f'{self.name}_items', len(finished))
+        return sorted(finished, key=lambda item: item.index)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+--profile mode: CPU and memory profiles per pipeline stage
+Hooks into telemetry.stage(). Each stage gets its own cProfile (nested stages pause
+the enclosing one, so a stage's .pstats holds its own work), tracemalloc peaks are
+tracked per stage, and a sampling thread records collapsed stacks (labelled with
+the active stages, worker threads included) for flamegraph tools.
+
+Output directory:
+    <stage>.pstats      cProfile stats, all runs of the stage merged (python -m pstats / snakeviz)
+    memory.json         per-stage peak traced memory and peak growth over the stage's start
+    stacks.collapsed    "frame;frame;frame count" lines (flamegraph.pl, speedscope, inferno)
+"""
+
+import cProfile
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+import telemetry
+
+DEFAULT_PROFILE_DIR = 'profile'
+SAMPLE_INTERVAL_SECONDS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5')) / 1000
+ROOT_STAGE = 'run'
+
+_profiler = None
+
+class _Frame:
+    """One active stage on one thread"""
+
+    def __init__(self, name: str, start_memory: int):
+        self.name = name
+        self.profile = cProfile.Profile()
+        self.profiling = False
+        self.start_memory = start_memory
+        self.peak_memory = start_memory
+
+class StageProfiler:
+    """Stage observer collecting cProfile stats, tracemalloc peaks and stack samples"""
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self._lock = threading.Lock()
+        self._stacks: Dict[int, List[_Frame]] = defaultdict(list)  # thread id -> active stages
+        self._profiles: Dict[str, List[cProfile.Profile]] = defaultdict(list)
+        self._memory: Dict[str, Dict] = {}
+        self._samples = Counter()
+        self._stop = threading.Event()
+        self._sampler = None
+        self._finished = False
+
+    def start(self):
+        tracemalloc.start()
+        self.stage_started(ROOT_STAGE)
+        self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+        self._sampler.start()
+
+    def _update_peaks(self) -> int:
+        """Fold the peak since the last reset into every active stage; returns current memory"""
+        current, peak = tracemalloc.get_traced_memory()
+        for frames in self._stacks.values():
+            for frame in frames:
+                frame.peak_memory = max(frame.peak_memory, peak)
+        tracemalloc.reset_peak()
+        return current
+
+    @staticmethod
+    def _enable(frame: _Frame):
+        try:
+            frame.profile.enable()
+            frame.profiling = True
+        except ValueError:
+            # Another profiler is active (e.g. one cProfile per process on Python 3.12+);
+            # the stage still gets memory figures and stack samples
+            frame.profiling = False
+
+    @staticmethod
+    def _disable(frame: _Frame):
+        if frame.profiling:
+            frame.profile.disable()
+            frame.profiling = False
+
+    def stage_started(self, name: str):
+        thread_id = threading.get_ident()
+        with self._lock:
+            current = self._update_peaks()
+            stack = self._stacks[thread_id]
+            if stack:
+                self._disable(stack[-1])
+            frame = _Frame(name, current)
+            stack.append(frame)
+        self._enable(frame)
+
+    def stage_finished(self, name: str):
+        thread_id = threading.get_ident()
+        with self._lock:
+            stack = self._stacks.get(thread_id)
+            if not stack:
+                return
+            frame = stack[-1]
+            self._disable(frame)
+            self._update_peaks()
+            stack.pop()
+            if stack:
+                self._enable(stack[-1])
+            else:
+                del self._stacks[thread_id]
+
+            self._profiles[frame.name].append(frame.profile)
+            memory = self._memory.setdefault(frame.name, {'runs': 0, 'peak_bytes': 0, 'peak_growth_bytes': 0})
+            memory['runs'] += 1
+            memory['peak_bytes'] = max(memory['peak_bytes'], frame.peak_memory)
+            memory['peak_growth_bytes'] = max(memory['peak_growth_bytes'], frame.peak_memory - frame.start_memory)
+
+    def _sample(self):
+        sampler_id = threading.get_ident()
+        while not self._stop.wait(SAMPLE_INTERVAL_SECONDS):
+            frames = sys._current_frames()
+            with self._lock:
+                stage_paths = {thread_id: [f"stage:{frame.name}" for frame in stack]
+                               for thread_id, stack in self._stacks.items()}
+            for thread_id, frame in frames.items():
+                if thread_id == sampler_id:
+                    continue
+                calls = []
+                while frame is not None:
+                    code = frame.f_code
+                    calls.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                path = stage_paths.get(thread_id, ['stage:(none)']) + calls[::-1]
+                self._samples[';'.join(part.replace(';', ',') for part in path)] += 1
+
+    def finish(self, report: Optional[Dict] = None):
+        """Stop profiling and write the .pstats, memory and collapsed-stack files"""
+        if self._finished:
+            return
+        self._finished = True
+        self.stage_finished(ROOT_STAGE)
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        tracemalloc.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        for name, profiles in self._profiles.items():
+            stats = None
+            for profile in profiles:
+                try:
+                    if stats is None:
+                        stats = pstats.Stats(profile)
+                    else:
+                        stats.add(profile)
+                except TypeError:
+                    continue  # profile never enabled (no stats collected)
+            if stats is not None:
+                filename = re.sub(r'[^\w.-]', '_', name) + '.pstats'
+                stats.dump_stats(os.path.join(self.output_dir, filename))
+
+        memory = {
+            name: dict(figures,
+                       peak_mb=round(figures['peak_bytes'] / 1e6, 2),
+                       peak_growth_mb=round(figures['peak_growth_bytes'] / 1e6, 2))
+            for name, figures in self._memory.items()
+        }
+        with open(os.path.join(self.output_dir, 'memory.json'), 'w') as f:
+            json.dump(memory, f, indent=2)
+
+        with open(os.path.join(self.output_dir, 'stacks.collapsed'), 'w') as f:
+            for stack, count in sorted(self._samples.items()):
+                f.write(f"{stack} {count}\n")
+
+        if report is not None:
+            report['profile'] = {
+                'output_dir': self.output_dir,
+                'memory': {name: {'peak_mb': figures['peak_mb'], 'peak_growth_mb': figures['peak_growth_mb']}
+                           for name, figures in memory.items()}
+            }
+        print(f"🔬 Profiles for {len(self._profiles)} stages written to {self.output_dir}/")
+
+    # telemetry observer interface
+    def run_finished(self, report: Dict):
+        self.finish(report)
+
+def enable(output_dir: str = DEFAULT_PROFILE_DIR) -> StageProfiler:
+    """Start profiling this process (once); files are written when the run finishes"""
+    global _profiler
+    if _profiler is None:
+        _profiler = StageProfiler(output_dir)
+        _profiler.start()
+        telemetry.add_stage_observer(_profiler)
+        print(f"🔬 Profiling enabled, writing to {output_dir}/")
+    return _profiler
+
+def add_arguments(parser):
+    parser.add_argument('--profile', nargs='?', const=DEFAULT_PROFILE_DIR, metavar='DIR',
+                        help=f"Write per-stage CPU/memory profiles and collapsed stacks (default dir: {DEFAULT_PROFILE_DIR})")
+
+def enable_from_args(args=None) -> Optional[StageProfiler]:
+    """Enable profiling from --profile, or the SYNC_PROFILE_DIR environment variable"""
+    output_dir = getattr(args, 'profile', None) or os.getenv('SYNC_PROFILE_DIR')
+    return enable(output_dir) if output_dir else None
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Weekly and monthly trend rows in a Notion summary database
+Daily steps, sleep hours, HRV and resting HR are kept locally as compact NumPy arrays
+(one float32 per day, NaN where there is no value), so the averages come from the
+local arrays instead of re-reading every daily page. A changed day only rewrites the
+rows of its ISO week and its calendar month. When the arrays don't reach back far
+enough for those rows (e.g. after a cache miss), the missing days are read once from
+the daily database.
+"""
+
+import os
+from datetime import date as Date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from http_client import get_notion_client
+from state_store import state_path
+from sync_fitbit_notion import upsert_notion_page
+import telemetry
+
+METRICS_FILE = 'daily_metrics.npz'
+
+# Fitbit field -> (Notion column label, decimals)
+ROLLUP_METRICS = {
+    'steps': ('Steps', 0),
+    'sleep_hours': ('Sleep Hours', 1),
+    'hrv_daily_rmssd': ('HRV', 1),
+    'resting_heart_rate': ('Resting HR', 1),
+}
+
+# Fitbit field -> column of the daily database it is read back from
+DAILY_COLUMNS = {
+    'steps': 'Steps',
+    'sleep_hours': 'Sleep Hours',
+    'hrv_daily_rmssd': 'HRV Daily RMSSD',
+    'resting_heart_rate': 'Wake Resting HR',
+}
+
+# Trailing window of the rolling averages, ending on the last day of each period
+ROLLING_DAYS = 28
+
+# Page ids of the summary rows by period key, read once per run
+_rollup_page_ids: Optional[Dict[str, str]] = None
+
+class DailyMetrics:
+    """One array of daily values per metric, index 0 being the day with ordinal `start`.
+    
+    Dates whose rows could not be written yet are kept in `pending`, so the next
+    run rewrites them even though their values no longer change.
+    """
+    
+    def __init__(self, start: Optional[int] = None, values: Optional[Dict[str, np.ndarray]] = None,
+                 pending: Iterable[int] = ()):
+        self.start = start
+        self.values = values or {}
+        self.pending = set(pending)
+    
+    @property
+    def days(self) -> int:
+        return len(self.values['steps']) if self.values else 0
+    
+    @classmethod
+    def load(cls) -> 'DailyMetrics':
+        path = state_path(METRICS_FILE)
+        if not os.path.exists(path):
+            return cls()
+        try:
+            with np.load(path) as data:
+                values = {field: data[field] for field in ROLLUP_METRICS}
+                return cls(int(data['start']), values, data['pending'].tolist())
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Ignoring unreadable state file {path}: {e}")
+            return cls()
+    
+    def save(self):
+        """Atomically write the arrays (np.savez would append .npz to a temp name, so write a handle)"""
+        path = state_path(METRICS_FILE)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'wb') as f:
+            np.savez(f, start=np.int64(self.start or 0), pending=np.array(sorted(self.pending), dtype=np.int64),
+                     **self.values)
+        os.replace(temp_path, path)
+    
+    def index_of(self, ordinal: int) -> int:
+        """Array index of a day, growing the arrays with NaN to cover it"""
+        if self.start is None:
+            self.start = ordinal
+            self.values = {field: np.full(1, np.nan, dtype=np.float32) for field in ROLLUP_METRICS}
+        if ordinal < self.start:
+            padding = np.full(self.start - ordinal, np.nan, dtype=np.float32)
+            self.values = {field: np.concatenate([padding, values]) for field, values in self.values.items()}
+            self.start = ordinal
+        if ordinal >= self.start + self.days:
+            padding = np.full(ordinal - self.start - self.days + 1, np.nan, dtype=np.float32)
+            self.values = {field: np.concatenate([values, padding]) for field, values in self.values.items()}
+        return ordinal - self.start
+    
+    def record(self, date: str, fitbit_data: Dict) -> bool:
+        """Store the day's values present in fitbit_data; returns True if any changed.
+        
+        Zero readings mean the device wasn't worn (or there was no sleep log), so
+        they are left out of the averages like missing ones.
+        """
+        present = {field: fitbit_data[field] for field in ROLLUP_METRICS if (fitbit_data.get(field) or 0) > 0}
+        if not present:
+            return False
+        
+        index = self.index_of(Date.fromisoformat(date).toordinal())
+        changed = False
+        for field, value in present.items():
+            value = np.float32(value)
+            if self.values[field][index] != value:  # NaN never compares equal
+                self.values[field][index] = value
+                changed = True
+        return changed
+    
+    def matrix(self) -> np.ndarray:
+        """metrics x days"""
+        return np.vstack([self.values[field] for field in ROLLUP_METRICS])
+
+def window_means(matrix: np.ndarray, first: int, last: int) -> Tuple[np.ndarray, int]:
+    """Per-metric mean over days first..last (inclusive) and the number of days with any value"""
+    window = matrix[:, max(first, 0):last + 1]
+    valid = ~np.isnan(window)
+    counts = valid.sum(axis=1)
+    totals = np.where(valid, window, 0).sum(axis=1, dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = totals / counts
+    return means, int(valid.any(axis=0).sum())
+
+def rolling_means(matrix: np.ndarray, window: int) -> np.ndarray:
+    """Trailing `window`-day mean of every metric for every day, skipping missing days"""
+    valid = ~np.isnan(matrix)
+    totals = np.pad(np.cumsum(np.where(valid, matrix, 0), axis=1, dtype=np.float64), ((0, 0), (1, 0)))
+    counts = np.pad(np.cumsum(valid, axis=1), ((0, 0), (1, 0)))
+    # Window i covers days (i - window, i]; the first days average over the history there is
+    ends = np.arange(1, matrix.shape[1] + 1)
+    starts = np.maximum(ends - window, 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (totals[:, ends] - totals[:, starts]) / (counts[:, ends] - counts[:, starts])
+
+def periods_of(ordinal: int) -> List[Tuple[str, str, int, int]]:
+    """(key, type, first ordinal, last ordinal) of the ISO week and the month of a day"""
+    day = Date.fromordinal(ordinal)
+    year, week, weekday = day.isocalendar()
+    week_start = ordinal - weekday + 1
+    month_start = day.replace(day=1)
+    next_month = (month_start + timedelta(days=32)).replace(day=1)
+    return [
+        (f"{year}-W{week:02d}", 'Week', week_start, week_start + 6),
+        (f"{day:%Y-%m}", 'Month', month_start.toordinal(), next_month.toordinal() - 1)
+    ]
+
+def _number(value: float, decimals: int) -> Optional[float]:
+    if np.isnan(value):
+        return None
+    return int(round(float(value))) if decimals == 0 else round(float(value), decimals)
+
+def period_properties(metrics: DailyMetrics, matrix: np.ndarray, rolling: np.ndarray,
+                      key: str, kind: str, first: int, last: int) -> Dict:
+    """Notion properties of one summary row"""
+    means, days = window_means(matrix, first - metrics.start, last - metrics.start)
+    # Rolling averages as of the period's last day (or the latest day recorded, for the current period)
+    end = min(last - metrics.start, metrics.days - 1)
+    properties = {
+        "Period": {"title": [{"text": {"content": key}}]},
+        "Type": {"select": {"name": kind}},
+        "Dates": {"date": {"start": Date.fromordinal(first).isoformat(), "end": Date.fromordinal(last).isoformat()}},
+        "Days": {"number": days},
+    }
+    for row, (label, decimals) in enumerate(ROLLUP_METRICS.values()):
+        properties[f"Avg {label}"] = {"number": _number(means[row], decimals)}
+        properties[f"Avg {label} ({ROLLING_DAYS}d)"] = {"number": _number(rolling[row, end], decimals)}
+    return properties
+
+def seed_from_notion(notion, metrics: DailyMetrics, first: int, last: int) -> int:
+    """Record the daily database's values for days first..last (ordinals); returns the days read.
+    
+    The arrays are then extended to cover `first`, so the same days aren't read again.
+    """
+    database_id = os.getenv('NOTION_DATABASE_ID')
+    days = 0
+    start_cursor = None
+    while True:
+        query = {
+            "database_id": database_id,
+            "filter": {
+                "and": [
+                    {"property": "Date", "date": {"on_or_after": Date.fromordinal(first).isoformat()}},
+                    {"property": "Date", "date": {"on_or_before": Date.fromordinal(last).isoformat()}}
+                ]
+            },
+            "page_size": 100
+        }
+        if start_cursor:
+            query["start_cursor"] = start_cursor
+        
+        response = notion.databases.query(**query)
+        for page in response['results']:
+            properties = page.get('properties', {})
+            date_value = (properties.get('Date', {}).get('date') or {}).get('start')
+            if date_value:
+                metrics.record(date_value[:10], {field: properties.get(column, {}).get('number')
+                                                 for field, column in DAILY_COLUMNS.items()})
+                days += 1
+        
+        if not response.get('has_more'):
+            break
+        start_cursor = response.get('next_cursor')
+    
+    metrics.index_of(first)
+    return days
+
+def rollup_page_ids(notion, database_id: str) -> Dict[str, str]:
+    """Page ids of the existing summary rows by period, read in one paginated query"""
+    global _rollup_page_ids
+    if _rollup_page_ids is not None:
+        return _rollup_page_ids
+    
+    page_ids = {}
+    start_cursor = None
+    while True:
+        query = {"database_id": database_id, "page_size": 100}
+        if start_cursor:
+            query["start_cursor"] = start_cursor
+        response = notion.databases.query(**query)
+        for page in response['results']:
+            title = page.get('properties', {}).get('Period', {}).get('title', [])
+            key = ''.join(text.get('plain_text', '') for text in title)
+            if key:
+                page_ids[key] = page['id']
+        if not response.get('has_more'):
+            break
+        start_cursor = response.get('next_cursor')
+    
+    _rollup_page_ids = page_ids
+    return page_ids
+
+def update_rollups(days: Dict[str, Dict]) -> int:
+    """Record daily Fitbit values and rewrite the week/month rows they changed; returns rows written"""
+    load_dotenv()
+    database_id = os.getenv('NOTION_ROLLUP_DATABASE_ID')
+    
+    metrics = DailyMetrics.load()
+    notion = get_notion_client()
+    
+    # The rows being rewritten need every day of their periods, plus ROLLING_DAYS before them
+    ordinals = {Date.fromisoformat(date).toordinal() for date, data in days.items() if data}
+    needed = [first for ordinal in ordinals | metrics.pending for _, _, first, _ in periods_of(ordinal)]
+    seeded = False
+    if needed:
+        first = min(needed) - ROLLING_DAYS + 1
+        if metrics.start is None or metrics.start > first:
+            last = metrics.start - 1 if metrics.start is not None else max(ordinals | metrics.pending)
+            with telemetry.stage('rollup_seed'):
+                count = seed_from_notion(notion, metrics, first, last)
+            print(f"📈 Read {count} days from the daily database to complete the rollup history")
+            seeded = True
+    
+    changed = {Date.fromisoformat(date).toordinal() for date, data in days.items() if data and metrics.record(date, data)}
+    # Rows written from incomplete history are rewritten once it has been read back
+    dirty = changed | metrics.pending | (ordinals if seeded else set())
+    if not dirty:
+        print("📈 Rollups unchanged")
+        return 0
+    
+    periods = {}
+    for ordinal in sorted(dirty):
+        for key, kind, first, last in periods_of(ordinal):
+            periods.setdefault(key, (kind, first, last, set()))[3].add(ordinal)
+    
+    matrix = metrics.matrix()
+    rolling = rolling_means(matrix, ROLLING_DAYS)
+    page_ids = rollup_page_ids(notion, database_id)
+    
+    metrics.pending = set()
+    written = []
+    for key, (kind, first, last, ordinals) in sorted(periods.items()):
+        properties = period_properties(metrics, matrix, rolling, key, kind, first, last)
+        try:
+            page_ids[key] = upsert_notion_page(notion, database_id, page_ids.get(key), properties)
+            written.append(key)
+        except Exception as e:
+            page_ids.pop(key, None)
+            metrics.pending |= ordinals
+            print(f"❌ Error updating rollup {key}: {e}")
+    metrics.save()
+    
+    telemetry.increment('rollup_rows', len(written))
+    print(f"📈 Updated {len(written)} rollup rows: {', '.join(written)}")
+    return len(written)
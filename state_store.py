@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Local state shared between runs (caches, indexes, sync tokens)
+Lives in SYNC_STATE_DIR (default .sync_state) - persisted by the workflows via actions/cache
+Rotated OAuth tokens go to .env through update_env_file.
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Any, Dict
+
+# Serializes .env rewrites: the Fitbit and Google token refreshes can run at the same time
+_env_lock = threading.Lock()
+
+def get_state_dir() -> str:
+    """Return the state directory, creating it if needed"""
+    state_dir = os.getenv('SYNC_STATE_DIR', '.sync_state')
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
+
+def state_path(name: str) -> str:
+    """Path of a state file inside the state directory"""
+    return os.path.join(get_state_dir(), name)
+
+def load_json_state(name: str, default: Any = None) -> Any:
+    """Load a JSON state file, returning `default` if it is missing or unreadable"""
+    path = state_path(name)
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Ignoring unreadable state file {path}: {e}")
+        return default
+
+def save_json_state(name: str, data: Any):
+    """Atomically write a JSON state file"""
+    path = state_path(name)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+def update_env_file(values: Dict[str, str], path: str = '.env'):
+    """Set keys in the .env file (and os.environ), re-reading it under a lock so concurrent updates aren't lost"""
+    with _env_lock:
+        content = ''
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                content = f.read()
+        
+        for key, value in values.items():
+            line = f'{key}={value}'
+            content, replaced = re.subn(rf'^{re.escape(key)}=.*$', lambda _: line, content, flags=re.MULTILINE)
+            if not replaced:
+                if content and not content.endswith('\n'):
+                    content += '\n'
+                content += f'{line}\n'
+        
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+        
+        # load_dotenv() doesn't override variables that are already set, so a
+        # long-running process has to pick up the new values itself
+        os.environ.update(values)
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Long-running sync daemon
+Keeps the pooled HTTP sessions, Google/Fitbit credentials and the Notion page index
+warm between runs instead of starting cold for every sync. Runs on an internal schedule:
+    daily     yesterday's full sync (Fitbit + food photos) at DAEMON_DAILY_AT
+    intraday  today's activity summary and new food photos (plus photos uploaded late
+              for earlier dates) every DAEMON_INTRADAY_MINUTES
+Each run is delayed by random jitter and writes its own run report. The schedule is
+kept in the state directory so a restarted daemon picks up (and catches up on) it.
+SIGTERM/SIGINT stop the daemon once the running job has finished.
+"""
+
+import argparse
+import os
+import random
+import signal
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from food_cache import close_food_cache
+from http_client import get_session, get_notion_client
+from state_store import load_json_state, save_json_state
+from sync_fitbit_notion import (
+    GOOGLE_DRIVE_AVAILABLE, get_fitbit_data, update_notion_database, collect_late_food_photos,
+    pending_food_dates, get_today, run_sync
+)
+import telemetry
+
+DAEMON_STATE_FILE = 'daemon_state.json'
+
+# Local time of the daily sync (the scheduled workflow runs at 07:00 UTC)
+DAEMON_DAILY_AT = os.getenv('DAEMON_DAILY_AT', '07:00')
+DAEMON_INTRADAY_MINUTES = float(os.getenv('DAEMON_INTRADAY_MINUTES', '60'))
+# Random delay added to every run, so restarts and many installs don't hit the APIs in lockstep
+DAEMON_JITTER_SECONDS = float(os.getenv('DAEMON_JITTER_SECONDS', '300'))
+# Delay before retrying a failed run
+DAEMON_RETRY_MINUTES = float(os.getenv('DAEMON_RETRY_MINUTES', '15'))
+
+# Intraday refreshes only re-read the activity summary (steps, distance, calories)
+INTRADAY_COLLECTIONS = ('activities',)
+
+# Longest single sleep, so clock jumps (suspend, NTP) are noticed quickly
+MAX_WAIT_SECONDS = 60
+
+class Job:
+    """A scheduled action; `next_after` gives the next run time (before jitter) after a success"""
+    
+    def __init__(self, name: str, action: Callable[[], bool], next_after: Callable[[datetime], datetime]):
+        self.name = name
+        self.action = action
+        self.next_after = next_after
+        self.next_run: Optional[datetime] = None
+        self.last_run: Optional[datetime] = None
+        self.last_ok: Optional[bool] = None
+    
+    def to_state(self) -> Dict:
+        return {
+            'next_run': self.next_run.isoformat() if self.next_run else None,
+            'last_run': self.last_run.isoformat() if self.last_run else None,
+            'last_ok': self.last_ok
+        }
+    
+    def load_state(self, state: Dict):
+        if state.get('next_run'):
+            self.next_run = datetime.fromisoformat(state['next_run'])
+        if state.get('last_run'):
+            self.last_run = datetime.fromisoformat(state['last_run'])
+        self.last_ok = state.get('last_ok')
+
+def with_jitter(when: datetime, jitter_seconds: float) -> datetime:
+    return when + timedelta(seconds=random.uniform(0, jitter_seconds))
+
+def next_daily(daily_at: str) -> Callable[[datetime], datetime]:
+    hour, minute = (int(part) for part in daily_at.split(':'))
+    
+    def next_after(now: datetime) -> datetime:
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        return candidate if candidate > now else candidate + timedelta(days=1)
+    return next_after
+
+def next_interval(minutes: float) -> Callable[[datetime], datetime]:
+    return lambda now: now + timedelta(minutes=minutes)
+
+def refresh_food(today: str) -> Dict[str, Dict]:
+    """New meals for today and for dates that got photos after they were synced; meal foods by date"""
+    dates = sorted({today} | {date for date in pending_food_dates() if date <= today})
+    return collect_late_food_photos(dates)
+
+def run_intraday(skip_food: bool = False) -> bool:
+    """Refresh today's steps and any new food photos in Notion; returns True on success"""
+    today = get_today().strftime('%Y-%m-%d')
+    print(f"🔄 Intraday refresh for {today}")
+    
+    with telemetry.stage('fitbit_fetch'):
+        fitbit_data = get_fitbit_data(today, collections=INTRADAY_COLLECTIONS)
+    if fitbit_data is None:
+        print("❌ Failed to fetch Fitbit data")
+        return False
+    
+    food_by_date = {}
+    if GOOGLE_DRIVE_AVAILABLE and not skip_food:
+        try:
+            with telemetry.stage('food'):
+                food_by_date = refresh_food(today)
+        except Exception as e:
+            print(f"⚠️ Error processing food photos: {e}")
+    
+    with telemetry.stage('notion_write'):
+        update_notion_database(today, fitbit_data, food_by_date.pop(today, None), partial=True)
+        for date, food_data in sorted(food_by_date.items()):
+            update_notion_database(date, {}, food_data, partial=True)
+    return True
+
+def warm_up(skip_food: bool = False):
+    """Create the pooled clients and refresh credentials before the first job"""
+    load_dotenv()
+    get_session()
+    get_notion_client()
+    if GOOGLE_DRIVE_AVAILABLE and not skip_food:
+        try:
+            from google_drive_food import get_google_context
+            get_google_context()
+        except Exception as e:
+            print(f"⚠️ Could not prepare Google clients yet: {e}")
+
+class SyncDaemon:
+    """Runs jobs when they are due until asked to stop"""
+    
+    def __init__(self, jobs: List[Job], jitter_seconds: float = DAEMON_JITTER_SECONDS,
+                 retry_minutes: float = DAEMON_RETRY_MINUTES):
+        self.jobs = jobs
+        self.jitter_seconds = jitter_seconds
+        self.retry_minutes = retry_minutes
+        self.stopping = threading.Event()
+    
+    def load_state(self):
+        """Resume the persisted schedule; jobs missed while stopped are run right away"""
+        state = load_json_state(DAEMON_STATE_FILE, {}) or {}
+        now = datetime.now()
+        for job in self.jobs:
+            job.load_state(state.get('jobs', {}).get(job.name, {}))
+            if job.next_run is None:
+                job.next_run = with_jitter(job.next_after(now), self.jitter_seconds)
+    
+    def save_state(self):
+        save_json_state(DAEMON_STATE_FILE, {'jobs': {job.name: job.to_state() for job in self.jobs}})
+    
+    def handle_signal(self, signum, frame):
+        if self.stopping.is_set():
+            raise SystemExit(f"{signal.Signals(signum).name} received again, exiting immediately")
+        print(f"🛑 {signal.Signals(signum).name} received, stopping after the current job...")
+        self.stopping.set()
+    
+    def run_job(self, job: Job):
+        started = datetime.now()
+        print(f"▶️ [{started:%Y-%m-%d %H:%M:%S}] Running {job.name}")
+        telemetry.start_run(f'daemon_{job.name}')
+        ok = False
+        try:
+            ok = job.action()
+        except Exception as e:
+            print(f"❌ {job.name} failed: {e}")
+        finally:
+            telemetry.finish_run('ok' if ok else 'error')
+        
+        now = datetime.now()
+        job.last_run, job.last_ok = started, ok
+        if ok:
+            job.next_run = with_jitter(job.next_after(now), self.jitter_seconds)
+        else:
+            job.next_run = with_jitter(now + timedelta(minutes=self.retry_minutes), self.jitter_seconds)
+        self.save_state()
+        print(f"⏰ Next {job.name} run at {job.next_run:%Y-%m-%d %H:%M:%S}")
+    
+    def run(self):
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        signal.signal(signal.SIGINT, self.handle_signal)
+        
+        self.load_state()
+        self.save_state()
+        for job in self.jobs:
+            print(f"⏰ {job.name} scheduled for {job.next_run:%Y-%m-%d %H:%M:%S}")
+        
+        try:
+            while not self.stopping.is_set():
+                job = min(self.jobs, key=lambda candidate: candidate.next_run)
+                wait = (job.next_run - datetime.now()).total_seconds()
+                if wait > 0:
+                    self.stopping.wait(min(wait, MAX_WAIT_SECONDS))
+                    continue
+                self.run_job(job)
+        finally:
+            self.save_state()
+            close_food_cache()
+            print("👋 Sync daemon stopped")
+
+def build_jobs(args) -> List[Job]:
+    sync_args = argparse.Namespace(refresh_food_cache=False, force_food=False, skip_food=args.skip_food)
+    return [
+        Job('daily', lambda: run_sync(sync_args), next_daily(args.daily_at)),
+        Job('intraday', lambda: run_intraday(args.skip_food), next_interval(args.intraday_minutes))
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description='Keep Fitbit and food photos synced to Notion from a long-running process')
+    parser.add_argument('--daily-at', default=DAEMON_DAILY_AT, help='Local time (HH:MM) of the full sync of yesterday')
+    parser.add_argument('--intraday-minutes', type=float, default=DAEMON_INTRADAY_MINUTES, help='Minutes between intraday refreshes')
+    parser.add_argument('--jitter-seconds', type=float, default=DAEMON_JITTER_SECONDS, help='Max random delay added to every run')
+    parser.add_argument('--skip-food', action='store_true', help='Only sync Fitbit data')
+    parser.add_argument('--once', action='store_true', help='Run the daily sync and an intraday refresh now, then exit')
+    args = parser.parse_args()
+    
+    print("🚀 Starting sync daemon...")
+    warm_up(args.skip_food)
+    jobs = build_jobs(args)
+    daemon = SyncDaemon(jobs, jitter_seconds=args.jitter_seconds)
+    
+    if args.once:
+        daemon.load_state()
+        for job in jobs:
+            daemon.run_job(job)
+        close_food_cache()
+        return
+    
+    daemon.run()
+
+if __name__ == "__main__":
+    main()
@@ -5,26 +5,94 @@ Fetches yesterday's health metrics and updates Notion
 """
 
 import os
+import argparse
 import requests
 from datetime import datetime, timedelta
-from notion_client import Client
+from importlib.util import find_spec
 from dotenv import load_dotenv
-# Import Google Drive functionality with fallback
-try:
-    from google_drive_food import process_drive_food_photos, format_meal_text
-    GOOGLE_DRIVE_AVAILABLE = True
-except ImportError as e:
-    print(f"⚠️ Google Drive integration not available: {e}")
-    GOOGLE_DRIVE_AVAILABLE = False
-    def process_drive_food_photos(date):
+from http_client import get_session, get_streamed, get_notion_client
+from state_store import update_env_file
+from anomalies import flag_anomalies, anomaly_properties
+import http_cassette
+import profiling
+import telemetry
+from pipeline import Pipeline, ParallelStage, Stage
+
+def _google_drive_dependencies_installed() -> bool:
+    """Check for the Drive/Gemini/Pillow packages without importing them"""
+    try:
+        return all(find_spec(name) for name in ('googleapiclient', 'google.oauth2', 'google.generativeai', 'PIL'))
+    except ModuleNotFoundError:
+        return False
+
+# Google Drive food detection is imported when the food stage runs, so
+# Fitbit-only runs don't pay for the Google API client, Gemini SDK and Pillow
+GOOGLE_DRIVE_AVAILABLE = _google_drive_dependencies_installed()
+if not GOOGLE_DRIVE_AVAILABLE:
+    print("⚠️ Google Drive integration not available: missing Google API, Gemini or Pillow packages")
+
+def process_drive_food_photos(date, refresh_cache=False, processed_fingerprints=None):
+    if not GOOGLE_DRIVE_AVAILABLE:
         return None
-    def format_meal_text(foods):
+    from google_drive_food import process_drive_food_photos as process_photos
+    return process_photos(date, refresh_cache=refresh_cache, processed_fingerprints=processed_fingerprints)
+
+def format_meal_text(foods):
+    if not GOOGLE_DRIVE_AVAILABLE:
         return ""
+    from google_drive_food import format_meal_text as format_text
+    return format_text(foods)
+
+def rollups_enabled():
+    """Weekly/monthly rollups need a summary database (NOTION_ROLLUP_DATABASE_ID) and NumPy"""
+    load_dotenv()
+    return bool(os.getenv('NOTION_ROLLUP_DATABASE_ID')) and find_spec('numpy') is not None
+
+def update_rollups(days):
+    from rollups import update_rollups as update
+    return update(days)
+
+# Fitbit Web API host (overridable to point at a local mock server)
+FITBIT_API_BASE_URL = os.getenv('FITBIT_API_BASE_URL', 'https://api.fitbit.com').rstrip('/')
+
+# Groups of endpoints get_fitbit_data can fetch on their own
+FITBIT_COLLECTIONS = ('activities', 'sleep', 'heart', 'body', 'hrv')
+
+# Notion number properties that default to 0, and the Fitbit field each one shows
+NOTION_METRIC_FIELDS = {
+    "Steps": 'steps',
+    "Distance (km)": 'distance',
+    "Calories": 'calories',
+    "Active Minutes": 'active_minutes',
+    "Sleep Hours": 'sleep_hours',
+    "Sleep Efficiency": 'sleep_efficiency',
+    "Deep Sleep (min)": 'deep_sleep',
+    "Light Sleep (min)": 'light_sleep',
+    "REM Sleep (min)": 'rem_sleep',
+    "Fat Burn Zone (min)": 'fat_burn_minutes',
+    "Cardio Zone (min)": 'cardio_minutes',
+    "Peak Zone (min)": 'peak_minutes'
+}
+
+# Columns added by update_notion_schema.py after a database was set up; rows are
+# written without them (instead of failing) until the script has been re-run
+SCHEMA_UPGRADE_COLUMNS = ("Food Photos Fingerprint", "Anomaly", "Anomaly Note")
+
+# Notion page id per date, learned from queries and creates during this process
+_notion_page_ids = {}
+
+# Column names per database id, read once per process
+_database_columns = {}
+
+def get_today():
+    """Today's date, unless pinned with SYNC_TODAY (YYYY-MM-DD), e.g. when replaying a recorded run"""
+    pinned = os.getenv('SYNC_TODAY')
+    return datetime.strptime(pinned, '%Y-%m-%d') if pinned else datetime.now()
 
 def get_yesterday_date():
     """Get yesterday's date in YYYY-MM-DD format (Zurich timezone)"""
     # For simplicity, using UTC. In production, consider timezone conversion
-    yesterday = datetime.now() - timedelta(days=1)
+    yesterday = get_today() - timedelta(days=1)
     return yesterday.strftime('%Y-%m-%d')
 
 def refresh_fitbit_token():
@@ -45,36 +113,28 @@ def refresh_fitbit_token():
         'refresh_token': refresh_token
     }
     
-    response = requests.post('https://api.fitbit.com/oauth2/token', data=data, headers=headers)
+    response = get_session().post(f'{FITBIT_API_BASE_URL}/oauth2/token', data=data, headers=headers)
     
     if response.status_code == 200:
         tokens = response.json()
         new_access_token = tokens['access_token']
         new_refresh_token = tokens['refresh_token']
         
-        # Update .env file
-        with open('.env', 'r') as f:
-            content = f.read()
+        # Replayed token responses are redacted; writing them would overwrite the
+        # real (single-use) refresh token
+        if http_cassette.replaying():
+            return new_access_token
         
-        content = content.replace(
-            f'FITBIT_ACCESS_TOKEN={os.getenv("FITBIT_ACCESS_TOKEN")}',
-            f'FITBIT_ACCESS_TOKEN={new_access_token}'
-        )
-        content = content.replace(
-            f'FITBIT_REFRESH_TOKEN={refresh_token}',
-            f'FITBIT_REFRESH_TOKEN={new_refresh_token}'
-        )
+        # Update .env file (the refresh token is single-use, so it must not be lost)
+        update_env_file({'FITBIT_ACCESS_TOKEN': new_access_token, 'FITBIT_REFRESH_TOKEN': new_refresh_token})
         
-        with open('.env', 'w') as f:
-            f.write(content)
-            
         return new_access_token
     else:
         raise Exception(f"Failed to refresh token: {response.text}")
 
 def make_api_request_with_refresh(url, headers):
     """Make API request with automatic token refresh if needed"""
-    response = requests.get(url, headers=headers)
+    response = get_streamed(url, headers=headers)
     
     if response.status_code == 401:  # Token expired
         print("🔄 Access token expired, refreshing...")
@@ -82,173 +142,177 @@ def make_api_request_with_refresh(url, headers):
             new_token = refresh_fitbit_token()
             headers['Authorization'] = f'Bearer {new_token}'
             # Retry with new token
-            response = requests.get(url, headers=headers)
+            telemetry.record_retry('fitbit')
+            response = get_streamed(url, headers=headers)
         except Exception as e:
             print(f"❌ Token refresh failed: {e}")
     
     return response
 
-def get_fitbit_data(date):
-    """Fetch comprehensive Fitbit data for a specific date"""
+def get_fitbit_data(date, collections=None):
+    """Fetch comprehensive Fitbit data for a specific date (optionally only some of FITBIT_COLLECTIONS)"""
     load_dotenv()
     access_token = os.getenv('FITBIT_ACCESS_TOKEN')
     
     headers = {'Authorization': f'Bearer {access_token}'}
-    base_url = 'https://api.fitbit.com/1/user/-'
+    base_url = f'{FITBIT_API_BASE_URL}/1/user/-'
+    wanted = set(collections or FITBIT_COLLECTIONS)
     
     data = {}
     
     try:
         # Activity summary
-        response = make_api_request_with_refresh(f'{base_url}/activities/date/{date}.json', headers)
-        if response.status_code == 200:
-            activities = response.json()
-            summary = activities['summary']
-            data['steps'] = summary.get('steps', 0)
-            data['distance'] = summary.get('distances', [{}])[0].get('distance', 0) if summary.get('distances') else 0
-            data['calories'] = summary.get('caloriesOut', 0)
-            data['active_minutes'] = summary.get('fairlyActiveMinutes', 0) + summary.get('veryActiveMinutes', 0)
+        if 'activities' in wanted:
+            response = make_api_request_with_refresh(f'{base_url}/activities/date/{date}.json', headers)
+            if response.status_code == 200:
+                activities = response.json()
+                summary = activities['summary']
+                data['steps'] = summary.get('steps', 0)
+                data['distance'] = summary.get('distances', [{}])[0].get('distance', 0) if summary.get('distances') else 0
+                data['calories'] = summary.get('caloriesOut', 0)
+                data['active_minutes'] = summary.get('fairlyActiveMinutes', 0) + summary.get('veryActiveMinutes', 0)
         
         # Sleep data with detailed stages - use sleep log list endpoint for stages data
-        headers_v12 = headers.copy()
-        headers_v12['Accept-Language'] = 'en_US'
-        headers_v12['Accept-Version'] = '1.2'
-        
-        # Use sleep log list endpoint to get stages data
-        from datetime import datetime, timedelta
-        next_day = (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
-        response = make_api_request_with_refresh(f'https://api.fitbit.com/1.2/user/-/sleep/list.json?beforeDate={next_day}&sort=desc&limit=5', headers_v12)
-        if response.status_code == 200:
-            sleep_data = response.json()
-            if sleep_data.get('sleep'):
-                # Find the sleep session for the specific date
-                main_sleep = None
-                for sleep_session in sleep_data['sleep']:
-                    if sleep_session.get('dateOfSleep') == date and sleep_session.get('isMainSleep', False):
-                        main_sleep = sleep_session
-                        break
-                
-                # Fallback to any session for the date
-                if not main_sleep:
+        if 'sleep' in wanted:
+            headers_v12 = headers.copy()
+            headers_v12['Accept-Language'] = 'en_US'
+            headers_v12['Accept-Version'] = '1.2'
+            
+            # Use sleep log list endpoint to get stages data
+            from datetime import datetime, timedelta
+            next_day = (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+            response = make_api_request_with_refresh(f'{FITBIT_API_BASE_URL}/1.2/user/-/sleep/list.json?beforeDate={next_day}&sort=desc&limit=5', headers_v12)
+            if response.status_code == 200:
+                sleep_data = response.json()
+                if sleep_data.get('sleep'):
+                    # Find the sleep session for the specific date
+                    main_sleep = None
                     for sleep_session in sleep_data['sleep']:
-                        if sleep_session.get('dateOfSleep') == date:
+                        if sleep_session.get('dateOfSleep') == date and sleep_session.get('isMainSleep', False):
                             main_sleep = sleep_session
                             break
-                data['sleep_hours'] = round(main_sleep.get('minutesAsleep', 0) / 60, 1)
-                data['sleep_efficiency'] = main_sleep.get('efficiency', 0)
-                data['sleep_start'] = main_sleep.get('startTime', '')
-                data['sleep_end'] = main_sleep.get('endTime', '')
-                
-                # Sleep stages - handle both new and old Fitbit formats
-                levels = main_sleep.get('levels', {})
-                
-                # First try new format with levels.summary
-                if 'summary' in levels and levels['summary']:
-                    summary = levels['summary']
-                    data['deep_sleep'] = summary.get('deep', {}).get('minutes', 0)
-                    data['light_sleep'] = summary.get('light', {}).get('minutes', 0)
-                    data['rem_sleep'] = summary.get('rem', {}).get('minutes', 0)
-                
-                # If no summary, try parsing levels.data for sleep stages
-                elif 'data' in levels and levels['data']:
-                    stage_minutes = {'deep': 0, 'light': 0, 'rem': 0}
                     
-                    # Parse data groupings (stages > 3 minutes)
-                    for period in levels['data']:
-                        stage = period.get('level', '')
-                        if stage in stage_minutes:
-                            # Convert seconds to minutes
-                            duration_seconds = period.get('seconds', 0)
-                            stage_minutes[stage] += duration_seconds // 60
+                    # Fallback to any session for the date
+                    if not main_sleep:
+                        for sleep_session in sleep_data['sleep']:
+                            if sleep_session.get('dateOfSleep') == date:
+                                main_sleep = sleep_session
+                                break
+                    data['sleep_hours'] = round(main_sleep.get('minutesAsleep', 0) / 60, 1)
+                    data['sleep_efficiency'] = main_sleep.get('efficiency', 0)
+                    data['sleep_start'] = main_sleep.get('startTime', '')
+                    data['sleep_end'] = main_sleep.get('endTime', '')
+                    
+                    # Sleep stages - handle both new and old Fitbit formats
+                    levels = main_sleep.get('levels', {})
                     
-                    # Parse shortData if available (short wake periods ≤ 3 minutes)
-                    if 'shortData' in levels:
-                        for period in levels.get('shortData', []):
+                    # First try new format with levels.summary
+                    if 'summary' in levels and levels['summary']:
+                        summary = levels['summary']
+                        data['deep_sleep'] = summary.get('deep', {}).get('minutes', 0)
+                        data['light_sleep'] = summary.get('light', {}).get('minutes', 0)
+                        data['rem_sleep'] = summary.get('rem', {}).get('minutes', 0)
+                    
+                    # If no summary, try parsing levels.data for sleep stages
+                    elif 'data' in levels and levels['data']:
+                        stage_minutes = {'deep': 0, 'light': 0, 'rem': 0}
+                        
+                        # Parse data groupings (stages > 3 minutes)
+                        for period in levels['data']:
                             stage = period.get('level', '')
                             if stage in stage_minutes:
+                                # Convert seconds to minutes
                                 duration_seconds = period.get('seconds', 0)
                                 stage_minutes[stage] += duration_seconds // 60
+                        
+                        # Parse shortData if available (short wake periods ≤ 3 minutes)
+                        if 'shortData' in levels:
+                            for period in levels.get('shortData', []):
+                                stage = period.get('level', '')
+                                if stage in stage_minutes:
+                                    duration_seconds = period.get('seconds', 0)
+                                    stage_minutes[stage] += duration_seconds // 60
+                        
+                        data['deep_sleep'] = stage_minutes['deep']
+                        data['light_sleep'] = stage_minutes['light']
+                        data['rem_sleep'] = stage_minutes['rem']
                     
-                    data['deep_sleep'] = stage_minutes['deep']
-                    data['light_sleep'] = stage_minutes['light']
-                    data['rem_sleep'] = stage_minutes['rem']
-                
-                else:
-                    # Fallback to old format - parse minuteData
-                    minute_data = main_sleep.get('minuteData', [])
-                    if minute_data:
-                        asleep_minutes = sum(1 for m in minute_data if m.get('value') == '1')
-                        # For old format, treat all sleep as "light sleep"
-                        data['light_sleep'] = asleep_minutes
-                        data['deep_sleep'] = 0  # Not available in old format
-                        data['rem_sleep'] = 0   # Not available in old format
                     else:
-                        data['deep_sleep'] = 0
-                        data['light_sleep'] = 0
-                        data['rem_sleep'] = 0
+                        # Fallback to old format - parse minuteData
+                        minute_data = main_sleep.get('minuteData', [])
+                        if minute_data:
+                            asleep_minutes = sum(1 for m in minute_data if m.get('value') == '1')
+                            # For old format, treat all sleep as "light sleep"
+                            data['light_sleep'] = asleep_minutes
+                            data['deep_sleep'] = 0  # Not available in old format
+                            data['rem_sleep'] = 0   # Not available in old format
+                        else:
+                            data['deep_sleep'] = 0
+                            data['light_sleep'] = 0
+                            data['rem_sleep'] = 0
         
         # Heart rate data (resting + zones)
-        response = make_api_request_with_refresh(f'{base_url}/activities/heart/date/{date}/1d.json', headers)
-        if response.status_code == 200:
-            hr_data = response.json()
-            if hr_data.get('activities-heart'):
-                heart_info = hr_data['activities-heart'][0].get('value', {})
-                data['resting_heart_rate'] = heart_info.get('restingHeartRate')
-                
-                # Heart rate zones
-                zones = heart_info.get('heartRateZones', [])
-                for zone in zones:
-                    zone_name = zone.get('name', '').lower().replace(' ', '_')
-                    if 'fat_burn' in zone_name or 'fat burn' in zone_name:
-                        data['fat_burn_minutes'] = zone.get('minutes', 0)
-                    elif 'cardio' in zone_name:
-                        data['cardio_minutes'] = zone.get('minutes', 0)  
-                    elif 'peak' in zone_name:
-                        data['peak_minutes'] = zone.get('minutes', 0)
+        if 'heart' in wanted:
+            response = make_api_request_with_refresh(f'{base_url}/activities/heart/date/{date}/1d.json', headers)
+            if response.status_code == 200:
+                hr_data = response.json()
+                if hr_data.get('activities-heart'):
+                    heart_info = hr_data['activities-heart'][0].get('value', {})
+                    data['resting_heart_rate'] = heart_info.get('restingHeartRate')
+                    
+                    # Heart rate zones
+                    zones = heart_info.get('heartRateZones', [])
+                    for zone in zones:
+                        zone_name = zone.get('name', '').lower().replace(' ', '_')
+                        if 'fat_burn' in zone_name or 'fat burn' in zone_name:
+                            data['fat_burn_minutes'] = zone.get('minutes', 0)
+                        elif 'cardio' in zone_name:
+                            data['cardio_minutes'] = zone.get('minutes', 0)  
+                        elif 'peak' in zone_name:
+                            data['peak_minutes'] = zone.get('minutes', 0)
         
         # Weight data (if available)
-        response = make_api_request_with_refresh(f'{base_url}/body/log/weight/date/{date}.json', headers)
-        if response.status_code == 200:
-            weight_data = response.json()
-            if weight_data.get('weight'):
-                latest_weight = weight_data['weight'][0]
-                data['weight'] = latest_weight.get('weight')
-                data['bmi'] = latest_weight.get('bmi')
-        
-        # Body fat data (if available)
-        response = make_api_request_with_refresh(f'{base_url}/body/log/fat/date/{date}.json', headers)
-        if response.status_code == 200:
-            fat_data = response.json()
-            if fat_data.get('fat'):
-                data['body_fat'] = fat_data['fat'][0].get('fat')
+        if 'body' in wanted:
+            response = make_api_request_with_refresh(f'{base_url}/body/log/weight/date/{date}.json', headers)
+            if response.status_code == 200:
+                weight_data = response.json()
+                if weight_data.get('weight'):
+                    latest_weight = weight_data['weight'][0]
+                    data['weight'] = latest_weight.get('weight')
+                    data['bmi'] = latest_weight.get('bmi')
+            
+            # Body fat data (if available)
+            response = make_api_request_with_refresh(f'{base_url}/body/log/fat/date/{date}.json', headers)
+            if response.status_code == 200:
+                fat_data = response.json()
+                if fat_data.get('fat'):
+                    data['body_fat'] = fat_data['fat'][0].get('fat')
         
         # HRV data (Heart Rate Variability)
-        response = make_api_request_with_refresh(f'{base_url}/hrv/date/{date}.json', headers)
-        if response.status_code == 200:
-            hrv_data = response.json()
-            if hrv_data.get('hrv'):
-                hrv_entries = hrv_data['hrv']
-                if hrv_entries:
-                    # Get the most recent HRV reading for the day
-                    latest_hrv = hrv_entries[-1]
-                    hrv_value = latest_hrv.get('value', {})
-                    data['hrv_daily_rmssd'] = hrv_value.get('dailyRmssd')
-                    data['hrv_deep_rmssd'] = hrv_value.get('deepRmssd')
+        if 'hrv' in wanted:
+            response = make_api_request_with_refresh(f'{base_url}/hrv/date/{date}.json', headers)
+            if response.status_code == 200:
+                hrv_data = response.json()
+                if hrv_data.get('hrv'):
+                    hrv_entries = hrv_data['hrv']
+                    if hrv_entries:
+                        # Get the most recent HRV reading for the day
+                        latest_hrv = hrv_entries[-1]
+                        hrv_value = latest_hrv.get('value', {})
+                        data['hrv_daily_rmssd'] = hrv_value.get('dailyRmssd')
+                        data['hrv_deep_rmssd'] = hrv_value.get('deepRmssd')
         
         return data
-        
+    
     except requests.exceptions.RequestException as e:
         print(f"❌ Error fetching Fitbit data: {e}")
         return None
 
-def update_notion_database(date, fitbit_data, food_data=None):
-    """Update or create entry in Notion database"""
-    load_dotenv()
+def find_notion_page(notion, database_id, date):
+    """Page id of the database row for a date (None if there is none yet)"""
+    if date in _notion_page_ids:
+        return _notion_page_ids[date]
     
-    notion = Client(auth=os.getenv('NOTION_TOKEN'))
-    database_id = os.getenv('NOTION_DATABASE_ID')
-    
-    # Check if entry already exists for this date
     existing_pages = notion.databases.query(
         database_id=database_id,
         filter={
@@ -258,6 +322,56 @@ def update_notion_database(date, fitbit_data, food_data=None):
             }
         }
     )
+    if existing_pages['results']:
+        _notion_page_ids[date] = existing_pages['results'][0]['id']
+        return _notion_page_ids[date]
+    return None
+
+def get_database_columns(notion, database_id):
+    """Column names of a database (None if the schema couldn't be read)"""
+    if database_id not in _database_columns:
+        try:
+            _database_columns[database_id] = set(notion.databases.retrieve(database_id=database_id).get('properties', {}))
+        except Exception as e:
+            print(f"⚠️ Could not read the Notion database schema: {e}")
+            return None
+        missing = [name for name in SCHEMA_UPGRADE_COLUMNS if name not in _database_columns[database_id]]
+        if missing:
+            print(f"⚠️ Notion database has no {', '.join(missing)} column(s) - run update_notion_schema.py to add them")
+    return _database_columns[database_id]
+
+def drop_missing_columns(notion, database_id, properties):
+    """Leave out SCHEMA_UPGRADE_COLUMNS the database doesn't have, so the rest of the row is still written"""
+    columns = get_database_columns(notion, database_id)
+    if columns is None:
+        return properties
+    return {name: value for name, value in properties.items()
+            if name not in SCHEMA_UPGRADE_COLUMNS or name in columns}
+
+def upsert_notion_page(notion, database_id, page_id, properties):
+    """Update a page, or create a row in the database when there is none yet; returns the page id"""
+    if page_id:
+        notion.pages.update(page_id=page_id, properties=properties)
+        return page_id
+    page = notion.pages.create(
+        parent={"database_id": database_id},
+        properties=properties
+    )
+    return page['id']
+
+def update_notion_database(date, fitbit_data, food_data=None, partial=False):
+    """Update or create entry in Notion database.
+    
+    With partial=True only the metrics present in fitbit_data are written, so a
+    refresh of one collection doesn't zero the others.
+    """
+    load_dotenv()
+    
+    notion = get_notion_client()
+    database_id = os.getenv('NOTION_DATABASE_ID')
+    
+    # Check if entry already exists for this date
+    page_id = find_notion_page(notion, database_id, date)
     
     # Prepare properties with all Fitbit metrics
     properties = {
@@ -275,6 +389,9 @@ def update_notion_database(date, fitbit_data, food_data=None):
         "Cardio Zone (min)": {"number": fitbit_data.get('cardio_minutes', 0)},
         "Peak Zone (min)": {"number": fitbit_data.get('peak_minutes', 0)},
     }
+    if partial:
+        properties = {name: value for name, value in properties.items()
+                      if name not in NOTION_METRIC_FIELDS or NOTION_METRIC_FIELDS[name] in fitbit_data}
     
     # Add optional properties if available
     if fitbit_data.get('resting_heart_rate'):
@@ -304,6 +421,8 @@ def update_notion_database(date, fitbit_data, food_data=None):
     if fitbit_data.get('hrv_deep_rmssd'):
         properties["HRV Deep RMSSD"] = {"number": fitbit_data['hrv_deep_rmssd']}
     
+    properties.update(anomaly_properties(fitbit_data, partial))
+    
     # Add food data if available
     if food_data:
         if food_data.get('breakfast'):
@@ -315,69 +434,198 @@ def update_notion_database(date, fitbit_data, food_data=None):
         if food_data.get('dinner'):
             properties["Dinner"] = {"rich_text": [{"text": {"content": format_meal_text(food_data['dinner'])}}]}
         
-        # Mark that food photos were processed
+        # Mark that food photos were processed (and which photos, so unchanged dates can be skipped)
         properties["Food Photos Processed"] = {"checkbox": True}
+        if food_data.get('fingerprint'):
+            properties["Food Photos Fingerprint"] = {"rich_text": [{"text": {"content": food_data['fingerprint']}}]}
+    
+    properties = drop_missing_columns(notion, database_id, properties)
     
     try:
-        if existing_pages['results']:
-            # Update existing page
-            page_id = existing_pages['results'][0]['id']
-            notion.pages.update(page_id=page_id, properties=properties)
-            print(f"✅ Updated existing entry for {date}")
-        else:
-            # Create new page
-            notion.pages.create(
-                parent={"database_id": database_id},
-                properties=properties
-            )
-            print(f"✅ Created new entry for {date}")
-            
+        _notion_page_ids[date] = upsert_notion_page(notion, database_id, page_id, properties)
+        print(f"✅ {'Updated existing' if page_id else 'Created new'} entry for {date}")
     except Exception as e:
+        # The cached page may have been deleted; look it up again next time
+        _notion_page_ids.pop(date, None)
         print(f"❌ Error updating Notion: {e}")
 
-def main():
-    """Main sync function"""
+def get_food_processed_fingerprints(start_date, end_date):
+    """Photo fingerprints of dates already marked 'Food Photos Processed', read in one paginated query"""
+    load_dotenv()
+    
+    notion = get_notion_client()
+    database_id = os.getenv('NOTION_DATABASE_ID')
+    
+    fingerprints = {}
+    start_cursor = None
+    while True:
+        query = {
+            "database_id": database_id,
+            "filter": {
+                "and": [
+                    {"property": "Date", "date": {"on_or_after": start_date}},
+                    {"property": "Date", "date": {"on_or_before": end_date}},
+                    {"property": "Food Photos Processed", "checkbox": {"equals": True}}
+                ]
+            },
+            "page_size": 100
+        }
+        if start_cursor:
+            query["start_cursor"] = start_cursor
+        
+        response = notion.databases.query(**query)
+        for page in response['results']:
+            properties = page.get('properties', {})
+            date_value = (properties.get('Date', {}).get('date') or {}).get('start')
+            fingerprint = ''.join(
+                text.get('plain_text', '') for text in properties.get('Food Photos Fingerprint', {}).get('rich_text', [])
+            )
+            if date_value:
+                _notion_page_ids[date_value[:10]] = page['id']
+            if date_value and fingerprint:
+                fingerprints[date_value[:10]] = fingerprint
+        
+        if not response.get('has_more'):
+            return fingerprints
+        start_cursor = response.get('next_cursor')
+
+def daily_sync_stages(refresh_food_cache=False, force_food=False, skip_food=False):
+    """fitbit_fetch and food (concurrently) -> notion_write (-> rollup) stages for syncing single dates.
+    
+    The two sources don't depend on each other, so the day takes as long as the slower
+    one; if either fails, the other's data is still written.
+    """
+    
+    def fetch_fitbit(item):
+        fitbit_data = get_fitbit_data(item.date)
+        if not fitbit_data:
+            raise Exception("Failed to fetch Fitbit data")
+        flag_anomalies(item.date, fitbit_data)
+        print("📊 Fitbit data fetched:")
+        for key, value in fitbit_data.items():
+            print(f"  {key}: {value}")
+        return fitbit_data
+    
+    def process_food(item):
+        print("🍽️ Processing food photos from Drive...")
+        processed_fingerprints = None if force_food else get_food_processed_fingerprints(item.date, item.date)
+        food_data = process_drive_food_photos(
+            item.date, refresh_cache=refresh_food_cache, processed_fingerprints=processed_fingerprints
+        )
+        
+        # Log food data
+        meals = ('breakfast', 'lunch', 'dinner')
+        if food_data and any(food_data.get(meal) for meal in meals):
+            print("📊 Food data processed:")
+            for meal in meals:
+                if food_data.get(meal):
+                    print(f"  {meal}: {format_meal_text(food_data[meal])}")
+        elif food_data is None:
+            print("  Food photos already processed for this date")
+        else:
+            print("  No food photos found for this date")
+        return food_data
+    
+    def write_notion(item):
+        fitbit_data = item.get('fitbit_fetch')
+        food_data = item.get('food')
+        if not fitbit_data and not food_data:
+            print(f"⏭️ Nothing new to write for {item.date}")
+            return
+        # Without Fitbit data only the food columns are written, instead of zeroing the metrics
+        update_notion_database(item.date, fitbit_data or {}, food_data, partial=not fitbit_data)
+    
+    def write_rollups(item):
+        fitbit_data = item.get('fitbit_fetch')
+        if fitbit_data:
+            update_rollups({item.date: fitbit_data})
+    
+    sources = [Stage('fitbit_fetch', fetch_fitbit, required=False)]
+    if skip_food:
+        print("⏭️ Skipping food photos (--skip-food)")
+    elif not GOOGLE_DRIVE_AVAILABLE:
+        print("⚠️ Google Drive integration disabled - skipping food photos")
+    else:
+        sources.append(Stage('food', process_food, required=False))
+    stages = [ParallelStage(sources), Stage('notion_write', write_notion)]
+    if rollups_enabled():
+        stages.append(Stage('rollup', write_rollups, required=False))
+    return stages
+
+def pending_food_dates():
+    """Dates in the Drive catalog's analysis queue, filled by the incremental Drive sync"""
+    from drive_changes import load_catalog, pending_dates
+    from google_drive_food import DRIVE_FOLDER_ID
+    
+    return pending_dates(load_catalog(DRIVE_FOLDER_ID))
+
+def collect_late_food_photos(dates):
+    """Meal foods by date for dates with new photos, processed with one Drive pass.
+    
+    Dates whose photos were all written to Notion already are left out and taken off the queue.
+    """
+    from google_drive_food import mark_photos_processed, process_drive_food_photos_dates
+    
+    processed_fingerprints = get_food_processed_fingerprints(min(dates), max(dates))
+    food_by_date = process_drive_food_photos_dates(dates, processed_fingerprints)
+    # Same photos as already written to Notion; nothing left to pick up for these dates
+    mark_photos_processed([date for date, food_data in food_by_date.items() if food_data is None])
+    return {date: food_data for date, food_data in food_by_date.items() if food_data is not None}
+
+def sync_late_food_photos(before_date):
+    """Write the meals of earlier dates whose photos were uploaded after those dates were synced; returns the dates written"""
+    dates = [date for date in pending_food_dates() if date < before_date]
+    if not dates:
+        return []
+    print(f"📥 Photos uploaded late for {', '.join(dates)}")
+    
+    food_by_date = collect_late_food_photos(dates)
+    for date, food_data in sorted(food_by_date.items()):
+        update_notion_database(date, {}, food_data, partial=True)
+    return sorted(food_by_date)
+
+def run_sync(args):
+    """Sync yesterday's Fitbit data and food photos; returns True on success"""
     print("🔄 Starting Fitbit → Notion sync...")
     
     date = get_yesterday_date()
     print(f"📅 Syncing data for: {date}")
     
-    # Get Fitbit data
-    fitbit_data = get_fitbit_data(date)
-    if not fitbit_data:
-        print("❌ Failed to fetch Fitbit data")
-        return
-    
-    print("📊 Fitbit data fetched:")
-    for key, value in fitbit_data.items():
-        print(f"  {key}: {value}")
+    stages = daily_sync_stages(args.refresh_food_cache, args.force_food, args.skip_food)
+    [item] = Pipeline('sync', stages).run([date])
     
-    # Get Google Drive food data
-    if GOOGLE_DRIVE_AVAILABLE:
-        print("🍽️ Processing food photos from Drive...")
+    # Photos of earlier dates that reached Drive after their sync
+    if GOOGLE_DRIVE_AVAILABLE and not args.skip_food:
         try:
-            food_data = process_drive_food_photos(date)
-            
-            # Log food data
-            if food_data and any(food_data.values()):
-                print("📊 Food data processed:")
-                for meal, foods in food_data.items():
-                    if foods:
-                        print(f"  {meal}: {format_meal_text(foods)}")
-            else:
-                print("  No food photos found for this date")
-                
+            with telemetry.stage('food'):
+                sync_late_food_photos(date)
         except Exception as e:
-            print(f"⚠️ Error processing food photos: {e}")
-            food_data = None
-    else:
-        print("⚠️ Google Drive integration disabled - skipping food photos")
-        food_data = None
+            print(f"⚠️ Error processing late food photos: {e}")
     
-    # Update Notion
-    update_notion_database(date, fitbit_data, food_data)
+    if item.failed or 'fitbit_fetch' in item.errors:
+        return False
     
     print("🎉 Sync completed!")
+    return True
+
+def main():
+    """Main sync function"""
+    parser = argparse.ArgumentParser(description='Sync yesterday\'s Fitbit data and food photos to Notion')
+    parser.add_argument('--refresh-food-cache', action='store_true', help='Discard cached food analyses (e.g. after changing the prompt)')
+    parser.add_argument('--force-food', action='store_true', help='Re-process food photos even if Notion marks the date as processed')
+    parser.add_argument('--skip-food', action='store_true', help='Fitbit-only run: don\'t load or run the Drive food stage')
+    http_cassette.add_arguments(parser)
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    http_cassette.install_from_args(args)
+    profiling.enable_from_args(args)
+    
+    telemetry.start_run('sync')
+    ok = False
+    try:
+        ok = run_sync(args)
+    finally:
+        telemetry.finish_run('ok' if ok else 'error')
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
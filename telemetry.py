@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Run instrumentation: per-stage and per-service latency, counts, status codes,
+retries, bytes and rate-limit headroom, written out as a JSON run report, a
+Markdown table for $GITHUB_STEP_SUMMARY and (optionally) an OpenMetrics textfile
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# Latency histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float('inf')]
+
+_lock = threading.RLock()
+_run = {}
+
+# Notified around every stage and at the end of the run (e.g. the --profile mode):
+# objects with stage_started(name), stage_finished(name) and run_finished(report)
+_stage_observers = []
+
+def _new_service_stats() -> Dict:
+    return {'calls': 0, 'errors': 0, 'retries': 0, 'bytes_in': 0, 'bytes_out': 0,
+            'status_codes': Counter(), 'latencies': []}
+
+def start_run(entry_point: str):
+    """Reset all counters for a new run of an entry point"""
+    with _lock:
+        _run.clear()
+        _run.update({
+            'entry_point': entry_point,
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'started': time.monotonic(),
+            'services': {},
+            'stages': {},
+            'rate_limits': {},
+            'counters': Counter()
+        })
+
+def _ensure_run():
+    if not _run:
+        start_run(os.path.basename(os.sys.argv[0]) or 'python')
+
+def record_call(service: str, status, latency: float, bytes_in: int = 0, bytes_out: int = 0):
+    """Record one outbound call (status is an HTTP code, or 'ok'/'error' for client libraries)"""
+    with _lock:
+        _ensure_run()
+        stats = _run['services'].setdefault(service, _new_service_stats())
+        stats['calls'] += 1
+        stats['status_codes'][str(status)] += 1
+        stats['latencies'].append(latency)
+        stats['bytes_in'] += bytes_in or 0
+        stats['bytes_out'] += bytes_out or 0
+        if status == 'error' or (isinstance(status, int) and status >= 400):
+            stats['errors'] += 1
+
+def record_retry(service: str):
+    with _lock:
+        _ensure_run()
+        _run['services'].setdefault(service, _new_service_stats())['retries'] += 1
+
+def record_rate_limit(service: str, remaining, limit=None, reset_seconds=None):
+    """Remember the latest rate-limit headroom reported for a service"""
+    with _lock:
+        _ensure_run()
+        _run['rate_limits'][service] = {
+            'remaining': remaining,
+            'limit': limit,
+            'reset_seconds': reset_seconds
+        }
+
+def increment(counter: str, value: int = 1):
+    """Add to a free-form counter (e.g. gemini_tokens)"""
+    with _lock:
+        _ensure_run()
+        _run['counters'][counter] += value
+
+def add_stage_observer(observer):
+    _stage_observers.append(observer)
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage"""
+    for observer in _stage_observers:
+        observer.stage_started(name)
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        with _lock:
+            _ensure_run()
+            _run['stages'].setdefault(name, []).append(elapsed)
+        for observer in reversed(_stage_observers):
+            observer.stage_finished(name)
+
+@contextmanager
+def timed_call(service: str):
+    """Time a call made through a client library that we can't hook at the HTTP level"""
+    started = time.monotonic()
+    try:
+        yield
+    except Exception:
+        record_call(service, 'error', time.monotonic() - started)
+        raise
+    record_call(service, 'ok', time.monotonic() - started)
+
+def _percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def _histogram(values: List[float]) -> Dict[str, int]:
+    buckets = {}
+    for bound in LATENCY_BUCKETS:
+        label = '+Inf' if bound == float('inf') else str(bound)
+        buckets[label] = sum(1 for value in values if value <= bound)
+    return buckets
+
+def build_report(status: str = 'ok') -> Dict:
+    """Snapshot of the run as a JSON-serializable dict"""
+    with _lock:
+        _ensure_run()
+        services = {}
+        for name, stats in _run['services'].items():
+            latencies = stats['latencies']
+            services[name] = {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'retries': stats['retries'],
+                'bytes_in': stats['bytes_in'],
+                'bytes_out': stats['bytes_out'],
+                'status_codes': dict(stats['status_codes']),
+                'latency_seconds': {
+                    'total': round(sum(latencies), 4),
+                    'p50': round(_percentile(latencies, 0.5), 4),
+                    'p95': round(_percentile(latencies, 0.95), 4),
+                    'max': round(max(latencies), 4) if latencies else 0.0,
+                    'histogram': _histogram(latencies)
+                }
+            }
+        
+        stages = {}
+        for name, durations in _run['stages'].items():
+            stages[name] = {
+                'count': len(durations),
+                'total_seconds': round(sum(durations), 4),
+                'p50_seconds': round(_percentile(durations, 0.5), 4),
+                'p95_seconds': round(_percentile(durations, 0.95), 4)
+            }
+        
+        return {
+            'entry_point': _run['entry_point'],
+            'status': status,
+            'started_at': _run['started_at'],
+            'duration_seconds': round(time.monotonic() - _run['started'], 3),
+            'stages': stages,
+            'services': services,
+            'rate_limits': dict(_run['rate_limits']),
+            'counters': dict(_run['counters'])
+        }
+
+def format_markdown(report: Dict) -> str:
+    """Markdown tables for the GitHub Actions job summary"""
+    lines = [
+        f"## Run report: {report['entry_point']} ({report['status']}, {report['duration_seconds']}s)",
+        "",
+        "| Stage | Runs | Total (s) | p50 (s) | p95 (s) |",
+        "|---|---|---|---|---|"
+    ]
+    for name, stats in report['stages'].items():
+        lines.append(f"| {name} | {stats['count']} | {stats['total_seconds']} | {stats['p50_seconds']} | {stats['p95_seconds']} |")
+    
+    lines += [
+        "",
+        "| Service | Calls | Errors | Retries | Status codes | KB in | KB out | p50 (s) | p95 (s) | Rate limit left |",
+        "|---|---|---|---|---|---|---|---|---|---|"
+    ]
+    for name, stats in report['services'].items():
+        codes = ', '.join(f"{code}×{count}" for code, count in sorted(stats['status_codes'].items()))
+        headroom = report['rate_limits'].get(name, {})
+        remaining = headroom.get('remaining')
+        limit = headroom.get('limit')
+        left = '' if remaining is None else (f"{remaining}/{limit}" if limit is not None else str(remaining))
+        lines.append(
+            f"| {name} | {stats['calls']} | {stats['errors']} | {stats['retries']} | {codes} | "
+            f"{stats['bytes_in'] / 1024:.1f} | {stats['bytes_out'] / 1024:.1f} | "
+            f"{stats['latency_seconds']['p50']} | {stats['latency_seconds']['p95']} | {left} |"
+        )
+    
+    if report['counters']:
+        lines += ["", "| Counter | Value |", "|---|---|"]
+        for name, value in sorted(report['counters'].items()):
+            lines.append(f"| {name} | {value} |")
+    
+    return '\n'.join(lines) + '\n'
+
+def format_openmetrics(report: Dict) -> str:
+    """OpenMetrics text exposition of the run (for a node_exporter textfile collector or similar)"""
+    entry = report['entry_point']
+    lines = [
+        "# TYPE fitbit_sync_run_duration_seconds gauge",
+        f'fitbit_sync_run_duration_seconds{{entry_point="{entry}"}} {report["duration_seconds"]}',
+        "# TYPE fitbit_sync_stage_seconds gauge"
+    ]
+    for name, stats in report['stages'].items():
+        lines.append(f'fitbit_sync_stage_seconds{{entry_point="{entry}",stage="{name}"}} {stats["total_seconds"]}')
+    
+    lines.append("# TYPE fitbit_sync_requests counter")
+    for name, stats in report['services'].items():
+        for code, count in stats['status_codes'].items():
+            lines.append(f'fitbit_sync_requests_total{{entry_point="{entry}",service="{name}",status="{code}"}} {count}')
+    
+    lines.append("# TYPE fitbit_sync_request_latency_seconds histogram")
+    for name, stats in report['services'].items():
+        latency = stats['latency_seconds']
+        for bound, count in latency['histogram'].items():
+            lines.append(f'fitbit_sync_request_latency_seconds_bucket{{entry_point="{entry}",service="{name}",le="{bound}"}} {count}')
+        lines.append(f'fitbit_sync_request_latency_seconds_sum{{entry_point="{entry}",service="{name}"}} {latency["total"]}')
+        lines.append(f'fitbit_sync_request_latency_seconds_count{{entry_point="{entry}",service="{name}"}} {stats["calls"]}')
+    
+    lines.append("# TYPE fitbit_sync_rate_limit_remaining gauge")
+    for name, headroom in report['rate_limits'].items():
+        if headroom.get('remaining') is not None:
+            lines.append(f'fitbit_sync_rate_limit_remaining{{entry_point="{entry}",service="{name}"}} {headroom["remaining"]}')
+    
+    lines.append("# EOF")
+    return '\n'.join(lines) + '\n'
+
+def finish_run(status: str = 'ok') -> Optional[Dict]:
+    """Write the run report (JSON), the job summary table and the optional OpenMetrics file"""
+    report = build_report(status)
+    for observer in _stage_observers:
+        observer.run_finished(report)
+    
+    try:
+        report_path = os.getenv('RUN_REPORT_PATH', 'run_report.json')
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"📈 Run report written to {report_path}")
+        
+        summary_path = os.getenv('GITHUB_STEP_SUMMARY')
+        if summary_path:
+            with open(summary_path, 'a') as f:
+                f.write(format_markdown(report))
+        
+        metrics_path = os.getenv('METRICS_TEXTFILE')
+        if metrics_path:
+            with open(metrics_path, 'w') as f:
+                f.write(format_openmetrics(report))
+    except OSError as e:
+        print(f"⚠️ Could not write run report: {e}")
+    
+    return report
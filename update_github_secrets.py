@@ -22,6 +22,7 @@ def main():
         ('FITBIT_REFRESH_TOKEN', os.getenv('FITBIT_REFRESH_TOKEN')),
         ('NOTION_TOKEN', os.getenv('NOTION_TOKEN')),
         ('NOTION_DATABASE_ID', os.getenv('NOTION_DATABASE_ID')),
+        ('NOTION_ROLLUP_DATABASE_ID', os.getenv('NOTION_ROLLUP_DATABASE_ID')),
         ('GOOGLE_CLIENT_ID', os.getenv('GOOGLE_CLIENT_ID')),
         ('GOOGLE_CLIENT_SECRET', os.getenv('GOOGLE_CLIENT_SECRET')),
         ('GOOGLE_ACCESS_TOKEN', os.getenv('GOOGLE_ACCESS_TOKEN')),
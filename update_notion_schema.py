@@ -9,7 +9,7 @@ from notion_client import Client
 from dotenv import load_dotenv
 
 def update_database_schema():
-    """Add food tracking columns to the Notion database"""
+    """Add food tracking and anomaly columns to the Notion database"""
     load_dotenv()
     
     notion = Client(auth=os.getenv('NOTION_TOKEN'))
@@ -38,6 +38,18 @@ def update_database_schema():
         "Food Photos Processed": {
             "type": "checkbox",
             "checkbox": {}
+        },
+        "Food Photos Fingerprint": {
+            "type": "rich_text",
+            "rich_text": {}
+        },
+        "Anomaly": {
+            "type": "checkbox",
+            "checkbox": {}
+        },
+        "Anomaly Note": {
+            "type": "rich_text",
+            "rich_text": {}
         }
     }
     
@@ -64,10 +76,63 @@ def update_database_schema():
             print(f"✅ Successfully added {len(properties_to_add)} new columns")
         else:
             print("✅ All required columns already exist")
-            
+    
     except Exception as e:
         print(f"❌ Error updating database schema: {e}")
         print("Make sure your Notion token has edit permissions for the database")
 
+def update_rollup_schema():
+    """Set up the weekly/monthly summary database (NOTION_ROLLUP_DATABASE_ID) used by rollups.py"""
+    load_dotenv()
+    
+    notion = Client(auth=os.getenv('NOTION_TOKEN'))
+    database_id = os.getenv('NOTION_ROLLUP_DATABASE_ID')
+    
+    if not database_id:
+        print("⏭️ NOTION_ROLLUP_DATABASE_ID not set - skipping the rollup database")
+        return
+    
+    print("🔄 Updating rollup database schema...")
+    
+    new_properties = {
+        "Type": {"type": "select", "select": {"options": [{"name": "Week"}, {"name": "Month"}]}},
+        "Dates": {"type": "date", "date": {}},
+        "Days": {"type": "number", "number": {}}
+    }
+    for label in ("Steps", "Sleep Hours", "HRV", "Resting HR"):
+        new_properties[f"Avg {label}"] = {"type": "number", "number": {}}
+        new_properties[f"Avg {label} (28d)"] = {"type": "number", "number": {}}
+    
+    try:
+        database = notion.databases.retrieve(database_id=database_id)
+        existing_properties = database.get('properties', {})
+        
+        properties_to_add = {}
+        # Rows are keyed by their title ("2025-W28", "2025-07"), so the title column is named Period
+        for prop_name, prop_config in existing_properties.items():
+            if prop_config.get('type') == 'title' and prop_name != "Period":
+                properties_to_add[prop_name] = {"name": "Period"}
+                print(f"  ✏️ Renaming title column {prop_name} to Period")
+        for prop_name, prop_config in new_properties.items():
+            if prop_name not in existing_properties:
+                properties_to_add[prop_name] = prop_config
+                print(f"  ➕ Adding column: {prop_name}")
+            else:
+                print(f"  ✅ Column already exists: {prop_name}")
+        
+        if properties_to_add:
+            notion.databases.update(
+                database_id=database_id,
+                properties=properties_to_add
+            )
+            print(f"✅ Successfully updated {len(properties_to_add)} columns")
+        else:
+            print("✅ All required columns already exist")
+    
+    except Exception as e:
+        print(f"❌ Error updating rollup database schema: {e}")
+        print("Make sure your Notion token has edit permissions for the database")
+
 if __name__ == "__main__":
-    update_database_schema()
\ No newline at end of file
+    update_database_schema()
+    update_rollup_schema()
\ No newline at end of file